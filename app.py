@@ -9,10 +9,17 @@ import sqlite3
 from pathlib import Path
 from datetime import datetime
 import hashlib
+import itertools
+import numbers
 import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from collections import OrderedDict
 import threading
 from data_translation import data_translation_bp
+from supp_pivot import pivot_first
 
 # 加载环境变量
 try:
@@ -22,12 +29,31 @@ except ImportError:
     print("Warning: python-dotenv not installed. Environment variables from .env file will not be loaded.")
     print("Install with: pip install python-dotenv")
 
+# sas_reader 在导入时读取读取/缓存相关环境变量，需在加载 .env 之后导入
+import sas_reader
+
 # 禁用Pandas未来版本的降级行为警告
 try:
     pd.set_option('future.no_silent_downcasting', True)
 except Exception:
     pass  # 如果选项不存在则忽略
 
+# 写时复制（SAS_COPY_ON_WRITE，默认开启）：浅拷贝之间共享未修改的列，写入时才复制被修改的列。
+# 该选项作用于整个进程内的 pandas（链式赋值不再写回原表，df[col] 等取出的对象修改后不影响原表），
+# 关闭时数据集各表示之间改为深拷贝
+COPY_ON_WRITE = os.getenv('SAS_COPY_ON_WRITE', 'True').lower() in ('1', 'true', 'yes')
+if COPY_ON_WRITE:
+    try:
+        pd.set_option('mode.copy_on_write', True)
+    except Exception:
+        COPY_ON_WRITE = False
+
+
+def _shared_copy(df):
+    """数据集表示之间的拷贝：写时复制开启时为共享列缓冲区的浅拷贝，关闭时为深拷贝（避免一方的写入改到另一方）"""
+    return df.copy(deep=not COPY_ON_WRITE)
+
+
 app = Flask(__name__)
 
 # 注册蓝图
@@ -1056,18 +1082,656 @@ class DatabaseManager:
         finally:
             conn.close()
 
+class StudyKeyDictionary:
+    """项目级键字典：把规范化后的 STUDYID、USUBJID 与 IDVARVAL/--SEQ 取值映射为紧凑的 int32 编码。
+    同一项目的所有数据集共享编码，相同取值在任何数据集中编码一致，跨数据集的连接与转置可直接在整数数组上进行"""
+
+    # 其余键列（IDVARVAL 与各 --SEQ 等 IDVAR 指向的列）共用 'SEQ' 编码空间
+    DOMAINS = {'STUDYID': 'STUDYID', 'USUBJID': 'USUBJID'}
+
+    def __init__(self):
+        self.codes = {}  # 编码空间 -> {取值: 编码}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def domain(cls, column):
+        return cls.DOMAINS.get(str(column).upper(), 'SEQ')
+
+    def encode(self, column, values):
+        """将规范化后的取值数组编码为 int32（新取值追加编码），返回 (编码, 不同取值数)"""
+        local, uniques = pd.factorize(values, use_na_sentinel=False)
+        with self.lock:
+            table = self.codes.setdefault(self.domain(column), {})
+            mapped = np.fromiter((table.setdefault(v, len(table)) for v in uniques.tolist()),
+                                 dtype=np.int32, count=len(uniques))
+        return mapped[local], len(uniques)
+
+    def size(self, column):
+        """编码空间当前的取值数（即编码上界）"""
+        return len(self.codes.get(self.domain(column), ()))
+
+    def stats(self):
+        """各编码空间的取值数与字典占用（字节，含取值字符串）"""
+        with self.lock:
+            return {domain: {'values': len(table),
+                             'bytes': sys.getsizeof(table) + sum(sys.getsizeof(v) for v in table)}
+                    for domain, table in self.codes.items()}
+
+
+class KeyIndex:
+    """单个数据集的连接键索引：缓存规范化后的键列、各键列的整数编码与键组合编码，
+    以及键组合 -> 首行位置的哈希表，左连接对齐时直接查出行位置，代替每次 DataFrame.merge。
+    缓存项持有键列本身并按底层缓冲区校验（写时复制下改写键列会产生新缓冲区），键列变化后自动重算"""
+
+    def __init__(self, normalize, dictionary=None):
+        self.normalize = normalize
+        self.dictionary = dictionary
+        self.normalized_columns = {}  # 列名 -> (原列缓冲区, 原列, 规范化列)
+        self.columns = {}             # 列名 -> {'signature', 'ref', 'codes', 'uniques', 'kind'}
+        self.combined = {}            # 连接键 -> {'entries', 'codes', 'table'}
+        self.encoded_columns = {}     # 列名 -> {'signatures', 'refs', 'codes', 'injective'}
+        self.hits = 0
+        self.normalize_hits = 0    # 规范化键列命中缓存次数
+        self.normalize_misses = 0  # 规范化键列重新计算次数
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def _signature(series):
+        """列底层缓冲区的标识；非 numpy/Categorical 存储的列每次转换都会复制，返回 None 表示不缓存"""
+        values = series.array
+        if isinstance(values, pd.Categorical):
+            arrays = (values.codes, values.categories.to_numpy())
+        elif isinstance(series.dtype, np.dtype):
+            arrays = (series.to_numpy(),)
+        else:
+            return None
+        return tuple((a.__array_interface__['data'][0], a.shape, a.strides, a.dtype.str) for a in arrays)
+
+    @staticmethod
+    def _kind(dtype):
+        """键列的可比较类别：数值与字符之间不做匹配（merge 会报错），其他类型不使用索引"""
+        if isinstance(dtype, pd.CategoricalDtype):
+            dtype = dtype.categories.dtype
+        if pd.api.types.is_bool_dtype(dtype) or not isinstance(dtype, np.dtype):
+            return None
+        if dtype.kind in 'iuf':
+            return 'number'
+        if dtype.kind == 'O':
+            return 'object'
+        return None
+
+    def normalized(self, df, column):
+        """返回 df[column] 规范化后的列（_normalize_key_series），同一列缓冲区只计算一次"""
+        series = df[column]
+        signature = self._signature(series)
+        with self.lock:
+            cached = self.normalized_columns.get(column)
+            if cached is not None and signature is not None and signature in (cached[0], self._signature(cached[2])):
+                self.hits += 1
+                self.normalize_hits += 1
+                result = cached[2]
+            else:
+                self.normalize_misses += 1
+                result = self.normalize(series)
+                if signature is not None:
+                    self.normalized_columns[column] = (signature, series, result)
+        if not result.index.equals(df.index):
+            result = result.set_axis(df.index)
+        return result
+
+    def encoded(self, df, column):
+        """返回 df[column] 规范化后在项目键字典中的 int32 编码，以及规范化前后取值是否一一对应
+        （如同时存在 '1' 与 '1.0' 则不是）；同一列缓冲区只编码一次"""
+        series = df[column]
+        signature = self._signature(series)
+        with self.lock:
+            cached = self.encoded_columns.get(column)
+            if cached is not None and signature is not None and signature in cached['signatures']:
+                self.hits += 1
+                return cached['codes'], cached['injective']
+            entry = self._column(series)
+            uniques = entry['uniques']
+            if not entry['has_null'] and pd.api.types.infer_dtype(uniques, skipna=False) in ('string', 'integer', 'floating'):
+                # 规范化逐值进行：只需规范化各不同取值，再按原列编码展开，不生成整列规范化字符串
+                normalized = self.normalize(pd.Series(uniques.to_numpy()))
+                unique_codes, n_values = self.dictionary.encode(column, normalized.to_numpy(dtype=object))
+                codes = unique_codes[entry['codes']]
+                refs = (series,)
+            else:
+                normalized = self.normalized(df, column)
+                codes, n_values = self.dictionary.encode(column, normalized.to_numpy(dtype=object))
+                refs = (series, normalized)
+            injective = len(uniques) == n_values
+            if signature is not None:
+                self.encoded_columns[column] = {
+                    'signatures': tuple(self._signature(ref) for ref in refs),
+                    'refs': refs,
+                    'codes': codes,
+                    'injective': injective,
+                }
+        return codes, injective
+
+    def _column(self, series):
+        """键列的整数编码与取值表（pd.Index），列未变化时复用"""
+        signature = self._signature(series)
+        cached = self.columns.get(series.name)
+        if cached is not None and signature is not None and cached['signature'] == signature:
+            self.hits += 1
+            return cached
+        codes, uniques = pd.factorize(series, use_na_sentinel=False)
+        entry = {
+            'signature': signature,
+            'ref': series,
+            'codes': codes.astype(np.int64, copy=False),
+            'uniques': pd.Index(np.asarray(uniques, dtype=object) if isinstance(series.dtype, pd.CategoricalDtype) else uniques),
+            'kind': self._kind(series.dtype),
+        }
+        entry['has_null'] = bool(entry['uniques'].hasnans)
+        if signature is not None:
+            self.columns[series.name] = entry
+        return entry
+
+    def _combined(self, df, keys):
+        """键组合编码（按各键取值数做混合进制）及 组合编码 -> 首行位置 的查找表；取值组合过多时返回 None"""
+        entries = [self._column(df[k]) for k in keys]
+        cached = self.combined.get(tuple(keys))
+        if cached is not None and all(a is b for a, b in zip(cached['entries'], entries)):
+            return cached
+        size = int(np.prod([float(len(e['uniques'])) for e in entries]))
+        if size >= 2 ** 62:
+            return None
+        codes = np.zeros(len(df), dtype=np.int64)
+        for e in entries:
+            codes = codes * len(e['uniques']) + e['codes']
+        combined = {'entries': entries, 'codes': codes, 'size': size}
+        combined['table'], combined['unique'] = self._first_rows(codes, np.arange(len(df)), size)
+        if all(e['signature'] is not None for e in entries):
+            self.combined[tuple(keys)] = combined
+        return combined
+
+    @staticmethod
+    def _first_rows(codes, rows, size):
+        """构建 组合编码 -> 首个行位置 的查找表，返回 (查找表, 编码是否无重复)。
+        编码空间不大时使用稠密数组，否则使用哈希索引 (pd.Index, 行位置)"""
+        if size <= 8 * len(codes) + 1024:
+            table = np.full(size, -1, dtype=np.int64)
+            # 重复下标赋值时保留最后一次写入，倒序写入即保留首行
+            table[codes[::-1]] = rows[::-1]
+            unique = len(codes) == 0 or int(np.bincount(codes, minlength=size).max()) <= 1
+            return table, unique
+        index = pd.Index(codes)
+        if index.is_unique:
+            return (index, rows), True
+        first = ~index.duplicated()
+        return (index[first], rows[first]), False
+
+    @staticmethod
+    def _find(table, codes):
+        """在 _first_rows 的查找表中查找编码，未找到（或编码为 -1）返回 -1"""
+        result = np.full(len(codes), -1, dtype=np.int64)
+        valid = codes >= 0
+        if isinstance(table, np.ndarray):
+            result[valid] = table[codes[valid]]
+            return result
+        index, rows = table
+        found = np.full(len(codes), -1, dtype=np.int64)
+        found[valid] = index.get_indexer(codes[valid])
+        hit = found >= 0
+        result[hit] = rows[found[hit]]
+        return result
+
+    def _probe_codes(self, entries, other, other_keys):
+        """将 other 的键映射为本数据集的组合编码；键值不存在于本数据集的行为 -1。类型无法可靠比较时返回 None"""
+        codes = np.zeros(len(other), dtype=np.int64)
+        valid = np.ones(len(other), dtype=bool)
+        for e, k in zip(entries, other_keys):
+            col = other[k]
+            kind = self._kind(col.dtype)
+            if kind is None or kind != e['kind']:
+                return None
+            # 先在 other 内部编码，只对其不同取值查找本数据集的编码
+            local, uniques = pd.factorize(col)
+            if e['has_null'] and (local < 0).any():
+                # 两侧都有缺失键时 merge 会相互匹配（对象列中 None 与 NaN 的规则也不同），交给 merge 处理
+                return None
+            uniques = pd.Index(np.asarray(uniques, dtype=object) if isinstance(col.dtype, pd.CategoricalDtype) else uniques)
+            idx = np.append(e['uniques'].get_indexer(uniques), -1)[local]
+            valid &= idx >= 0
+            codes = codes * len(e['uniques']) + idx
+        codes[~valid] = -1
+        return codes
+
+    def positions(self, df, keys, other, other_keys=None, unique=False):
+        """df（本数据集的某个版本）每行在 other 中按键匹配到的第一行位置，未匹配为 -1，
+        与 df.merge(other, left_on=keys, right_on=other_keys, how='left') 的对齐一致（键按原值比较）。
+        unique=True 时 other 中被匹配的键有重复（merge 会扩展行数）返回 None；类型无法比较时同样返回 None"""
+        other_keys = list(other_keys or keys)
+        with self.lock:
+            combined = self._combined(df, keys)
+        if combined is None:
+            return None
+        probe = self._probe_codes(combined['entries'], other, other_keys)
+        if probe is None:
+            return None
+        rows = np.flatnonzero(probe >= 0)
+        table, probe_unique = self._first_rows(probe[rows], rows, combined['size'])
+        if unique and not probe_unique:
+            return None
+        return self._find(table, combined['codes'])
+
+    def lookup(self, df, keys, probe_df, probe_keys=None, unique=False):
+        """probe_df 每行在 df（本数据集的某个版本）中按键匹配到的第一行位置，未匹配为 -1，
+        与 probe_df.merge(df, left_on=probe_keys, right_on=keys, how='left') 的对齐一致。
+        unique=True 时本数据集键有重复返回 None；类型无法比较时同样返回 None"""
+        probe_keys = list(probe_keys or keys)
+        with self.lock:
+            combined = self._combined(df, keys)
+        if combined is None or (unique and not combined['unique']):
+            return None
+        codes = self._probe_codes(combined['entries'], probe_df, probe_keys)
+        if codes is None:
+            return None
+        return self._find(combined['table'], codes)
+
+    def stats(self):
+        """缓存命中统计：规范化键列的命中/计算次数与全部缓存（规范化、编码、键组合）的命中次数"""
+        return {
+            'normalize_hits': self.normalize_hits,
+            'normalize_misses': self.normalize_misses,
+            'hits': self.hits,
+            'cached_columns': len(self.normalized_columns),
+        }
+
+    def prune(self, df):
+        """丢弃键列已不在 df 中的缓存项，释放其持有的旧列"""
+        with self.lock:
+            current = {c: self._signature(df[c]) for c in set(self.columns) | set(self.normalized_columns) if c in df.columns}
+            for column, entry in list(self.columns.items()):
+                if current.get(column) != entry['signature']:
+                    del self.columns[column]
+            for column, cached in list(self.normalized_columns.items()):
+                if current.get(column) not in (cached[0], self._signature(cached[2])):
+                    del self.normalized_columns[column]
+            for column, cached in list(self.encoded_columns.items()):
+                if column not in df.columns or self._signature(df[column]) not in cached['signatures']:
+                    del self.encoded_columns[column]
+            self.combined = {k: v for k, v in self.combined.items() if all(e is self.columns.get(k_) for e, k_ in zip(v['entries'], k))}
+
+class PreviewQuery:
+    """单个数据集预览的排序/筛选/搜索：在预览表上向量化求值，并缓存排序置换、各筛选条件与搜索的行掩码
+    以及组合后的结果行顺序。缓存随预览表（视图/数据版本）失效，同一查询翻页时只需按行顺序取出当前页"""
+
+    OPS = ('equals', 'contains', 'range', 'null')
+    MAX_ENTRIES = 16  # 每类缓存保留的最近查询数
+    # 数值/日期时间列字符串形式中可能出现的字符：搜索文本含其他字符时这类列不可能匹配，跳过逐值格式化
+    NUMBER_CHARS = frozenset('0123456789.+-einf')
+    DATETIME_CHARS = frozenset('0123456789-:.t')
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.sorts = OrderedDict()   # 排序键 -> 行位置置换
+        self.masks = OrderedDict()   # 单个筛选条件 / 搜索文本 -> 行掩码
+        self.orders = OrderedDict()  # (排序键, 筛选条件, 搜索文本) -> 结果行位置
+        self.hits = 0
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def parse(columns, sort=None, filters=None, search=None):
+        """规范化查询参数，返回可哈希的 (排序键, 筛选条件, 搜索文本)，无任何条件时返回 None。
+        sort 为 'COL,-COL2' 形式（- 表示降序）或 [(列, 是否升序)]；filters 为
+        [{'column', 'op': equals|contains|range|null, 'value' / 'min' / 'max'}]；列名或条件无效时抛出 ValueError"""
+        columns = set(columns)
+        if isinstance(sort, str):
+            sort = [(item[1:], False) if item.startswith('-') else (item, True)
+                    for item in (part.strip() for part in sort.split(',')) if item and item != '-']
+        sort_key = tuple((str(column), bool(ascending)) for column, ascending in (sort or []))
+        filter_keys = []
+        for spec in filters or []:
+            if not isinstance(spec, dict):
+                raise ValueError(f"无效的筛选条件: {spec}")
+            column, op = spec.get('column'), spec.get('op', 'equals')
+            if op not in PreviewQuery.OPS:
+                raise ValueError(f"不支持的筛选操作: {op}")
+            if op == 'range':
+                value = (spec.get('min'), spec.get('max'))
+            elif op == 'null':
+                value = spec.get('value', True) not in (False, 'false', 'False', '0', 0)
+            else:
+                value = spec.get('value')
+                value = tuple(value) if isinstance(value, list) else value
+            filter_keys.append((column, op, value))
+        for column in [c for c, _ in sort_key] + [c for c, _, _ in filter_keys]:
+            if column not in columns:
+                raise ValueError(f"列不存在: {column}")
+        search = str(search or '').strip()
+        if not sort_key and not filter_keys and not search:
+            return None
+        return sort_key, tuple(filter_keys), search
+
+    def rows(self, query):
+        """查询结果的行位置（按排序顺序）；同一预览表上重复的查询直接返回缓存"""
+        sort_key, filter_keys, search = query
+        with self.lock:
+            cached = self.orders.get(query)
+            if cached is not None:
+                self.hits += 1
+                self.orders.move_to_end(query)
+                return cached
+            mask = None
+            for key in list(filter_keys) + ([('', 'search', search)] if search else []):
+                part = self._cached(self.masks, key, lambda key=key: self._mask(*key))
+                mask = part if mask is None else mask & part
+            if sort_key:
+                order = self._cached(self.sorts, sort_key, lambda: self._sort_positions(sort_key))
+                rows = order if mask is None else order[mask[order]]
+            else:
+                rows = np.arange(len(self.frame)) if mask is None else np.flatnonzero(mask)
+            return self._store(self.orders, query, rows)
+
+    def _cached(self, store, key, compute):
+        value = store.get(key)
+        if value is not None:
+            self.hits += 1
+            store.move_to_end(key)
+            return value
+        return self._store(store, key, compute())
+
+    def _store(self, store, key, value):
+        store[key] = value
+        while len(store) > self.MAX_ENTRIES:
+            store.popitem(last=False)
+        return value
+
+    def _sort_positions(self, sort_key):
+        """多列稳定排序的行位置置换，缺失值排在最后；对象列取值类型混杂（如数值与字符串）无法直接比较时，
+        数值排在字符串之前并按数值比较，字符串之间按字符串比较（降序时整体反转，缺失值仍在最后）"""
+        columns = [c for c, _ in sort_key]
+        frame = pd.DataFrame({i: self.frame[c].reset_index(drop=True) for i, c in enumerate(columns)})
+        ascending = [a for _, a in sort_key]
+        try:
+            ordered = frame.sort_values(list(frame.columns), ascending=ascending, kind='stable', na_position='last')
+        except TypeError:
+            keys, key_ascending = {}, []
+            for position, asc in zip(frame.columns, ascending):
+                series = frame[position]
+                if series.dtype != object:
+                    keys[len(keys)] = series
+                    key_ascending.append(asc)
+                    continue
+                missing = series.isna().to_numpy()
+                is_number = series.map(lambda v: isinstance(v, numbers.Real) and not isinstance(v, (bool, np.bool_))) \
+                    .to_numpy(dtype=bool) & ~missing
+                # 每列展开为 (类别: 数值 0 / 字符串 1 / 缺失 NaN, 数值, 字符串) 三个排序键
+                keys[len(keys)] = pd.Series(np.where(missing, np.nan, np.where(is_number, 0.0, 1.0)))
+                keys[len(keys)] = pd.to_numeric(series.where(is_number), errors='coerce')
+                keys[len(keys)] = pd.Series(np.where(is_number | missing, None, series.astype(str)), dtype=object)
+                key_ascending += [asc] * 3
+            ordered = pd.DataFrame(keys).sort_values(list(keys), ascending=key_ascending, kind='stable',
+                                                     na_position='last')
+        return ordered.index.to_numpy(dtype=np.int64)
+
+    @staticmethod
+    def _by_unique(series, test):
+        """对列的各不同取值求 test（输入为字符串形式的取值 Series），再按编码展开为行掩码；缺失值为 False。
+        日期时间列的字符串形式与预览 JSON 一致（ISO 格式，精确到毫秒）"""
+        codes, uniques = pd.factorize(series)
+        if len(uniques) == 0:
+            return np.zeros(len(series), dtype=bool)
+        values = np.asarray(uniques)
+        if values.dtype.kind == 'M':
+            text = pd.Series(np.datetime_as_string(values, unit='ms'), dtype=object)
+        else:
+            text = pd.Series(values.astype(object)).astype(str)
+        matched = np.asarray(test(text), dtype=bool)
+        return np.where(codes >= 0, matched[codes], False)
+
+    def _mask(self, column, op, value):
+        """单个筛选条件（或全局搜索）的行掩码"""
+        if op == 'search':
+            needle = value.lower()
+            mask = np.zeros(len(self.frame), dtype=bool)
+            for position, dtype in enumerate(self.frame.dtypes):
+                if isinstance(dtype, np.dtype) and dtype.kind == 'M':
+                    if not set(needle) <= self.DATETIME_CHARS:
+                        continue
+                elif pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+                    if not set(needle) <= self.NUMBER_CHARS:
+                        continue
+                mask |= self._by_unique(self.frame.iloc[:, position],
+                                        lambda text: text.str.lower().str.contains(needle, regex=False))
+            return mask
+        series = self.frame[column]
+        if op == 'null':
+            # 字符列的空白字符串也视为空值
+            missing = series.isna().to_numpy()
+            if series.dtype == object or isinstance(series.dtype, (pd.CategoricalDtype, pd.StringDtype)):
+                missing = missing | self._by_unique(series, lambda text: text.str.strip() == '')
+            return missing if value else ~missing
+        if op == 'contains':
+            needle = str(value if value is not None else '').lower()
+            return self._by_unique(series, lambda text: text.str.lower().str.contains(needle, regex=False))
+        if op == 'equals':
+            values = list(value) if isinstance(value, tuple) else [value]
+            if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+                numbers = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').dropna()
+                return series.isin(numbers.tolist()).to_numpy()
+            wanted = {str(v).strip() for v in values if v is not None}
+            return self._by_unique(series, lambda text: text.str.strip().isin(wanted))
+        # range：数值列按数值、日期列按时间；字符列在边界均为数值时按数值，否则按字符串（ISO 日期可直接比较），
+        # 字符列只对各不同取值求值
+        low, high = value
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            return self._between(series, *(None if v in (None, '') else pd.Timestamp(v) for v in (low, high)))
+        bounds = pd.to_numeric(pd.Series([low, high], dtype=object), errors='coerce')
+        low_num, high_num = (None if v in (None, '') else b for v, b in zip((low, high), bounds))
+        if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+            return self._between(series, low_num, high_num)
+        if all(v in (None, '') or pd.notna(b) for v, b in zip((low, high), bounds)):
+            return self._by_unique(series, lambda text: self._between(pd.to_numeric(text, errors='coerce'), low_num, high_num))
+        low, high = (None if v in (None, '') else str(v) for v in (low, high))
+        return self._by_unique(series, lambda text: self._between(text, low, high))
+
+    @staticmethod
+    def _between(values, low, high):
+        """low <= values <= high 的掩码（边界为 None 表示不限），缺失值为 False"""
+        mask = values.notna().to_numpy()
+        if low is not None:
+            mask = mask & (values >= low).fillna(False).to_numpy(dtype=bool)
+        if high is not None:
+            mask = mask & (values <= high).fillna(False).to_numpy(dtype=bool)
+        return mask
+
+class RenderedPageCache:
+    """已序列化预览页（响应字节）的 LRU 缓存，按总字节数限制。
+    键中包含数据集 ETag（版本号），数据变更后旧页不再命中，随 LRU 淘汰"""
+
+    def __init__(self, max_mb=32):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.pages = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """根据 SAS_PAGE_CACHE_MB 创建缓存，0 表示关闭时返回 None"""
+        max_mb = float(os.getenv('SAS_PAGE_CACHE_MB', '32'))
+        return cls(max_mb) if max_mb > 0 else None
+
+    def get(self, key, render):
+        """返回缓存的响应字节，未命中时调用 render() 生成并缓存；render 返回 None 时不缓存。
+        超过缓存上限四分之一的单页（如全量预览）不缓存"""
+        with self.lock:
+            body = self.pages.get(key)
+            if body is not None:
+                self.pages.move_to_end(key)
+                self.hits += 1
+                return body
+            self.misses += 1
+        body = render()
+        if body is None or len(body) > self.max_bytes // 4:
+            return body
+        with self.lock:
+            if key not in self.pages:
+                self.pages[key] = body
+                self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                _, evicted = self.pages.popitem(last=False)
+                self.bytes -= len(evicted)
+        return body
+
+    def stats(self):
+        with self.lock:
+            return {'pages': len(self.pages), 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+class MergeOverlay:
+    """批量合并中一个目标分组的工作区：读取时优先返回本分组已写入的版本，
+    写入只记录在工作区，分组执行完毕后由 SASDataProcessor 统一提交到 datasets"""
+
+    def __init__(self, datasets):
+        self.datasets = datasets
+        self.frames = {}       # 数据集名 -> 新的 raw_data（提交时 data 取其浅拷贝）
+        self.data_frames = {}  # 数据集名 -> 仅改写 data 的版本（来源主表键列规范化）
+        self.transposes = {}   # SUPP 名 -> 需重新生成转置预览的版本
+        self.versions = {}     # 数据集名 -> 本分组内的写入次数，用于连接结果缓存失效
+        self.join_cache = {}   # (来源, 来源版本, 连接键) -> 目标行对应的来源行位置
+        self.join_cache_hits = 0
+
+    def has(self, name):
+        return bool(name) and (name in self.frames or (name in self.datasets and 'data' in self.datasets[name]))
+
+    def raw(self, name):
+        if name in self.frames:
+            return self.frames[name]
+        entry = self.datasets[name]
+        return entry.get('raw_data', entry['data'])
+
+    def data(self, name):
+        if name in self.data_frames:
+            return self.data_frames[name]
+        if name in self.frames:
+            return self.frames[name]
+        return self.datasets[name]['data']
+
+    def commit(self, name, df):
+        self.frames[name] = df
+        self.data_frames.pop(name, None)
+        self.versions[name] = self.versions.get(name, 0) + 1
+
+    def set_data(self, name, df):
+        self.data_frames[name] = df
+
+    def invalidate_joins(self, columns):
+        """目标列被改写或删除后，丢弃以这些列为连接键的缓存"""
+        columns = set(columns)
+        for key in [k for k in self.join_cache if columns & set(k[2])]:
+            del self.join_cache[key]
+
+    def snapshot(self):
+        return dict(self.frames), dict(self.data_frames), dict(self.transposes)
+
 class SASDataProcessor:
+    # 全进程递增的数据集版本号：读取、刷新、合并提交及预览视图失效时为条目分配新版本，用于 ETag
+    _version_clock = itertools.count(1)
+
     def __init__(self):
         self.datasets = {}
         self.merged_datasets = {}
         self.hide_supp_in_preview = False
         self.translation_direction = 'zh_to_en'  # 默认中译英
+        self.read_stats = {}  # 最近一次读取的逐文件耗时统计
+        self.merge_stats = {}  # 最近一次合并的耗时与重建的预览视图
+        # 两阶段加载状态：idle/loading/ready/error；_load_generation 用于让过期的后台加载自行退出
+        self.load_state = 'idle'
+        self.load_errors = {}
+        self._load_generation = 0
+        self._load_done = threading.Event()
+        self._load_done.set()
+        # 后台加载每完成一个数据集通知一次，供只需要单个数据集的请求提前返回
+        self._load_progress = threading.Condition()
+        # 惰性模式：条目仅保存路径与元数据，首次访问时才加载数据；空闲数据集按内存预算（MB，0 表示不限）淘汰
+        self.lazy = False
+        self.memory_budget_mb = float(os.getenv('SAS_MEMORY_BUDGET_MB', '0'))
+        self._lazy_lock = threading.RLock()
+        # 正在被请求使用的数据集 {数据集名: 使用计数}，使用中的数据集不会被内存预算淘汰
+        self._pins = {}
+        # 超大文件拆分读取配置（默认取 SAS_LARGE_FILE_THRESHOLD_MB / SAS_LARGE_FILE_WORKERS 环境变量）
+        self.split_threshold_mb = sas_reader.LARGE_FILE_THRESHOLD_MB
+        self.split_workers = sas_reader.LARGE_FILE_WORKERS
+        # 已解析数据集的磁盘列式缓存（默认关闭，需安装 pyarrow 并设置 SAS_CACHE_ENABLED=True）
+        self.cache = sas_reader.DatasetCache.from_env()
+        # 增量刷新：记录读取目录、模式及各文件读取时的签名（大小/修改时间，可选内容哈希）
+        self.source_directory = None
+        self.source_mode = 'RAW'
+        self.file_signatures = {}
+        self.signature_use_hash = os.getenv('SAS_REFRESH_USE_HASH', 'False').lower() in ('1', 'true', 'yes')
+        # 读取后压缩数据类型（低基数字符列转 category、整数值浮点列降为整数），默认关闭
+        self.compact_dtypes = os.getenv('SAS_COMPACT_DTYPES', 'False').lower() in ('1', 'true', 'yes')
+        # 项目级锁：同一项目的读取、刷新与合并串行执行，不同项目互不阻塞
+        self.lock = threading.RLock()
+        # SUPP 行按 RDOMAIN/IDVAR 分区的索引 {supp_name: index}，SUPP 数据变更时失效
+        self._supp_index = {}
+        # 各数据集的连接键索引 {数据集名: KeyIndex}，重新读取或释放数据时丢弃
+        self._key_indexes = {}
+        # 各数据集预览的排序/筛选缓存 {数据集名: PreviewQuery}，预览表被替换时失效
+        self._preview_queries = {}
+        # 项目级键字典：STUDYID/USUBJID/IDVARVAL 编码为 int32，SUPP 转置与连接在编码上进行（SAS_KEY_ENCODING=False 关闭）
+        self.key_dictionary = StudyKeyDictionary()
+        self.key_encoding = os.getenv('SAS_KEY_ENCODING', 'True').lower() in ('1', 'true', 'yes')
+        # 批量合并时不同目标分组的并行线程数（1 表示按分组顺序执行）
+        self.merge_workers = max(1, int(os.getenv('SAS_MERGE_WORKERS', '1')))
+        # ETag 前缀：区分不同处理器实例（项目、服务重启），避免版本号相同的旧响应被误判为未变化
+        self.instance_id = os.urandom(4).hex()
+        # 已序列化预览页的 LRU 缓存（SAS_PAGE_CACHE_MB=0 关闭）与数据集信息缓存 (ETag, info)
+        self.page_cache = RenderedPageCache.from_env()
+        self._info_cache = None
+
+    @staticmethod
+    def _next_version():
+        return next(SASDataProcessor._version_clock)
 
     @staticmethod
     def _normalize_key_series(series: pd.Series) -> pd.Series:
-        """将键列标准化为可比对的字符串表示，例如将 1.0 规范为 '1'，去除首尾空白。"""
+        """将键列标准化为可比对的字符串表示，例如将 1.0 规范为 '1'，去除首尾空白。
+        键列取值重复度高（USUBJID、--SEQ、IDVARVAL），只规范化各不同取值后按编码展开；
+        字符列中首个非空白字符不是数字、正负号或小数点的取值不可能被数值化为整数，跳过数值转换"""
         if series is None:
             return series
+        if not isinstance(series.dtype, (np.dtype, pd.CategoricalDtype)):
+            return SASDataProcessor._normalize_key_values(series)
+        codes, uniques = pd.factorize(series)
+        uniques = pd.Series(np.asarray(uniques))
+        if uniques.dtype.kind == 'O':
+            if pd.api.types.infer_dtype(uniques, skipna=False) != 'string':
+                # 混合类型（如 1 与 True、1.0 取值相等）去重会合并不同的字符串形式，逐值处理
+                return SASDataProcessor._normalize_key_values(series)
+            candidate = uniques.str.match(r'\s*[-+.\d]').to_numpy(dtype=bool)
+        elif uniques.dtype.kind in 'iuf':
+            candidate = np.ones(len(uniques), dtype=bool)
+        else:
+            return SASDataProcessor._normalize_key_values(series)
+        missing = codes < 0
+        text = uniques.astype(str).str.strip()
+        numeric = pd.to_numeric(uniques[candidate], errors='coerce')
+        if not candidate.all() or missing.any():
+            # 整列数值化时非数值或缺失取值会使结果为浮点，保持与整列转换相同的精度
+            numeric = numeric.astype('float64')
+        mask_num = numeric.notna()
+        if mask_num.any():
+            rounded = numeric.round()
+            mask_int_like = mask_num & (np.abs(numeric - rounded) < 1e-9)
+            text.loc[mask_int_like[mask_int_like].index] = rounded.loc[mask_int_like].astype('Int64').astype(str)
+        values = text.to_numpy(dtype=object).take(codes, mode='clip') if len(text) else np.empty(len(codes), dtype=object)
+        if missing.any():
+            values[missing] = series[missing].astype(str).str.strip().to_numpy(dtype=object)
+        return pd.Series(values, index=series.index, name=series.name, dtype=object)
+
+    @staticmethod
+    def _normalize_key_values(series: pd.Series) -> pd.Series:
+        """_normalize_key_series 的逐值实现：整列转为字符串并数值化"""
         s = series.astype(str).str.strip()
         # 尝试数值化，若为整数值则转为不带小数的字符串
         numeric = pd.to_numeric(series, errors='coerce')
@@ -1077,23 +1741,276 @@ class SASDataProcessor:
             mask_int_like = mask_num & (np.abs(numeric - rounded) < 1e-9)
             s.loc[mask_int_like] = rounded.loc[mask_int_like].astype('Int64').astype(str)
         return s
+
+    @staticmethod
+    def _concat_non_empty(frame: pd.DataFrame, separator: str) -> pd.Series:
+        """按列顺序逐行拼接 frame 中的非空值：跳过缺失值、空字符串以及字符串形式为 'nan'（不区分大小写）的值。
+        按列向量化处理，结果与逐行 str() 后用 separator 拼接一致。"""
+        n = len(frame)
+        joined = np.full(n, '', dtype=object)
+        has_value = np.zeros(n, dtype=bool)
+        # 'nan' 的所有大小写形式，等价于 str.lower() == 'nan' 但无需逐个转小写
+        nan_spellings = [a + b + c for a in 'nN' for b in 'aA' for c in 'nN']
+        for col in frame.columns:
+            series = frame[col]
+            if series.dtype.kind in 'fiub':
+                # 数值列非空值的 str() 不会是空串或 'nan'，只需转换保留的值
+                keep = series.notna().to_numpy()
+                if not keep.any():
+                    continue
+                values = np.empty(n, dtype=object)
+                # 经 Series.tolist() 取 Python 标量：可空整数列 to_numpy() 会转为浮点（1 -> '1.0'）
+                values[keep] = [str(v) for v in series[keep].tolist()]
+            else:
+                # 先转为 object 再 str()，日期等类型与逐元素 str() 的格式保持一致
+                text = series.astype(object).astype(str)
+                keep = (series.notna() & (text != '') & ~text.isin(nan_spellings)).to_numpy()
+                if not keep.any():
+                    continue
+                values = text.to_numpy(dtype=object)
+            append = keep & has_value
+            if append.any():
+                joined[append] = joined[append] + separator + values[append]
+            first = keep & ~has_value
+            joined[first] = values[first]
+            has_value |= keep
+        return pd.Series(joined, index=frame.index, dtype=object)
         
     @staticmethod
-    def _read_single_sas_file(file_path):
-        """读取单个SAS文件的辅助函数，用于多线程处理"""
+    def _read_cached_file(file_path, cache):
+        """从磁盘缓存读取数据集，未命中返回 None"""
+        start = time.perf_counter()
+        cached = cache.load(file_path)
+        if cached is None:
+            return None
+        df, meta = cached
+        return Path(file_path).stem, {
+            'data': df,
+            'raw_data': _shared_copy(df),
+            'meta': meta,
+            'path': file_path,
+            'version': SASDataProcessor._next_version(),
+            'read_stats': {
+                'mode': 'cache',
+                'rows': len(df),
+                'split_workers': 0,
+                'read_seconds': round(time.perf_counter() - start, 4)
+            }
+        }, None
+
+    @staticmethod
+    def _read_single_sas_file(file_path, split_threshold_mb=None, split_workers=None, cache=None):
+        """读取单个SAS文件的辅助函数，用于多线程处理；超过阈值的大文件拆分为多进程读取。
+        提供 cache 时优先读取未变化文件的缓存，缓存未命中则读取后写入缓存"""
         try:
             dataset_name = Path(file_path).stem
-            df, meta = pyreadstat.read_sas7bdat(file_path)
+            if cache is not None:
+                cached = SASDataProcessor._read_cached_file(file_path, cache)
+                if cached is not None:
+                    return cached
+            start = time.perf_counter()
+            df, meta, workers = sas_reader.read_sas7bdat(file_path, split_threshold_mb, split_workers)
+            read_seconds = time.perf_counter() - start
+            if cache is not None:
+                cache.store(file_path, df, meta)
             return dataset_name, {
-                'data': df.copy(),
-                'raw_data': df.copy(),
+                'data': df,
+                'raw_data': _shared_copy(df),
                 'meta': meta,
-                'path': file_path
+                'path': file_path,
+                'version': SASDataProcessor._next_version(),
+                'read_stats': {
+                    'mode': 'thread',
+                    'rows': len(df),
+                    'split_workers': workers,
+                    'read_seconds': round(read_seconds, 4)
+                }
             }, None
         except Exception as e:
             return Path(file_path).stem, None, str(e)
+
+    def _read_files_with_processes(self, sas_files, max_workers):
+        """使用进程池读取SAS文件，列数据经共享内存回传，按完成顺序逐个产出 (dataset_name, dataset_data, error)"""
+        if self.cache is not None:
+            # 缓存命中的文件直接在主进程内存映射读取，仅未命中的文件提交到进程池（由子进程写入缓存）
+            pending_files = []
+            for file_path in sas_files:
+                cached = self._read_cached_file(file_path, self.cache)
+                if cached is None:
+                    pending_files.append(file_path)
+                else:
+                    yield cached
+            sas_files = pending_files
+            if not sas_files:
+                return
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # 进程池本身已按文件并行，子进程内不再拆分大文件（split_workers=1），
+            # 否则每个子进程各自再启动 SAS_LARGE_FILE_WORKERS 个进程，总进程数约为 CPU 核心数的平方
+            future_to_file = {executor.submit(sas_reader.read_sas_file_to_shared_memory, file_path,
+                                              self.split_threshold_mb, 1, self.cache): file_path
+                              for file_path in sas_files}
+            for future in as_completed(future_to_file):
+                file_path = future_to_file[future]
+                try:
+                    dataset_name, payload, error = future.result()
+                except Exception as e:
+                    yield Path(file_path).stem, None, str(e)
+                    continue
+                if error:
+                    yield dataset_name, None, error
+                    continue
+                try:
+                    start = time.perf_counter()
+                    df = sas_reader.rebuild_dataframe(payload)
+                    rebuild_seconds = time.perf_counter() - start
+                except Exception as e:
+                    yield dataset_name, None, str(e)
+                    continue
+                yield dataset_name, {
+                    'data': df,
+                    'raw_data': _shared_copy(df),
+                    'meta': payload['meta'],
+                    'path': file_path,
+                    'version': SASDataProcessor._next_version(),
+                    'read_stats': {
+                        'mode': 'process',
+                        'rows': payload['rows'],
+                        'split_workers': payload['split_workers'],
+                        'read_seconds': round(payload['read_seconds'], 4),
+                        'transfer_seconds': round(payload['export_seconds'] + rebuild_seconds, 4)
+                    }
+                }, None
+
+    def _compact_dataset(self, dataset_name, dataset_data):
+        """读取后的类型压缩阶段，压缩前后内存记录在 read_stats['compaction'] 中。
+        SUPP 数据集保持原始类型：合并时需按行改写 QVAL，转置也依赖原始取值。"""
+        if not self.compact_dtypes or dataset_name.upper().startswith('SUPP'):
+            return dataset_data
+        df, report = sas_reader.compact_dataframe(dataset_data.get('raw_data', dataset_data['data']))
+        dataset_data['raw_data'] = df
+        dataset_data['data'] = _shared_copy(df)
+        dataset_data['compaction'] = report
+        dataset_data.setdefault('read_stats', {})['compaction'] = {
+            'before_bytes': report['before_bytes'],
+            'after_bytes': report['after_bytes']
+        }
+        return dataset_data
+
+    def _iter_read_results(self, sas_files, use_multithread=True, max_workers=None, read_mode='thread'):
+        """按完成顺序逐个产出文件读取结果 (dataset_name, dataset_data, error)，启用时执行类型压缩"""
+        for dataset_name, dataset_data, error in self._iter_file_reads(sas_files, use_multithread, max_workers, read_mode):
+            if dataset_data is not None:
+                dataset_data = self._compact_dataset(dataset_name, dataset_data)
+            yield dataset_name, dataset_data, error
+
+    def _iter_file_reads(self, sas_files, use_multithread=True, max_workers=None, read_mode='thread'):
+        """按完成顺序逐个产出文件读取结果 (dataset_name, dataset_data, error)"""
+        if use_multithread and len(sas_files) > 1:
+            # 根据文件数量和CPU核心数自动选择并发数
+            if max_workers is None:
+                max_workers = min(len(sas_files), os.cpu_count() or 4)
+
+            if read_mode == 'process':
+                yield from self._read_files_with_processes(sas_files, max_workers)
+            else:
+                # 使用多线程读取
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    future_to_file = {executor.submit(self._read_single_sas_file, file_path,
+                                                      self.split_threshold_mb, self.split_workers, self.cache): file_path 
+                                    for file_path in sas_files}
+                    for future in as_completed(future_to_file):
+                        yield future.result()
+        else:
+            # 单线程读取（原有逻辑）
+            for file_path in sas_files:
+                yield self._read_single_sas_file(file_path, self.split_threshold_mb, self.split_workers, self.cache)
+
+    def wait_until_loaded(self, timeout=None):
+        """等待后台数据加载完成（两阶段加载时使用），非后台加载时立即返回"""
+        return self._load_done.wait(timeout)
+
+    def _dataset_loaded(self, dataset_name):
+        entry = self.datasets.get(dataset_name)
+        if entry is None or entry.get('status') == 'error':
+            return True
+        if 'data' not in entry and entry.get('status') != 'unloaded':
+            return False
+        if self.hide_supp_in_preview and not dataset_name.upper().startswith('SUPP'):
+            # SDTM 模式下主表视图合入所有 SUPP，SUPP 读取完成（或失败）后视图才完整
+            return all('data' in e or e.get('status') == 'error'
+                       for n, e in list(self.datasets.items()) if n.upper().startswith('SUPP'))
+        return True
+
+    def wait_until_dataset_loaded(self, dataset_name, timeout=None):
+        """等待两阶段加载中单个数据集（SDTM 主表还包括其视图依赖的 SUPP）读取完成或失败，
+        不等待其他数据集；数据集不存在、非后台加载或后台加载已结束时立即返回"""
+        with self._load_progress:
+            return self._load_progress.wait_for(
+                lambda: self._load_done.is_set() or self._dataset_loaded(dataset_name), timeout)
+
+    def _notify_load_progress(self):
+        with self._load_progress:
+            self._load_progress.notify_all()
+
+    def get_load_status(self):
+        """返回后台加载状态及各数据集状态，供前端轮询"""
+        statuses = {name: {'status': entry.get('status', 'ready')} for name, entry in list(self.datasets.items())}
+        for name, error in self.load_errors.items():
+            statuses[name] = {'status': 'error', 'error': error}
+        return {'load_state': self.load_state, 'datasets': statuses}
+
+    def _load_data_in_background(self, generation, sas_files, mode, use_multithread, max_workers, read_mode):
+        """两阶段加载的第二阶段：在后台线程中读取数据，逐个更新数据集状态"""
+        datasets = self.datasets
+        total_start = time.perf_counter()
+        try:
+            for entry in datasets.values():
+                entry['status'] = 'loading'
+            for dataset_name, dataset_data, error in self._iter_read_results(sas_files, use_multithread, max_workers, read_mode):
+                if generation != self._load_generation:
+                    # 已有新的读取请求，放弃本次加载
+                    return
+                entry = datasets.setdefault(dataset_name, {'meta': None, 'path': None})
+                if error:
+                    entry.update({'status': 'error', 'error': error})
+                    self._notify_load_progress()
+                    continue
+                self.read_stats[dataset_name] = dataset_data.pop('read_stats', {})
+                # SDTM 模式下需等待预览视图构建完成后才置为 ready
+                dataset_data['status'] = 'loaded' if mode == 'SDTM' else 'ready'
+                # 保留元数据阶段分配的版本号，加载完成前发出的 ETag 仍对应同一份数据
+                dataset_data['version'] = entry.get('version') or dataset_data['version']
+                entry.update(dataset_data)
+                self._notify_load_progress()
+            self.read_stats['_total_seconds'] = round(time.perf_counter() - total_start, 4)
+
+            if generation != self._load_generation:
+                return
+            # 读取失败的条目只有元数据，无法参与后续处理：从数据集中移除，错误信息保留在 load_errors 中供前端展示
+            self.load_errors = {n: e.get('error') for n, e in datasets.items() if e.get('status') == 'error'}
+            if self.load_errors:
+                datasets = {n: e for n, e in datasets.items() if e.get('status') != 'error'}
+                self.datasets = datasets
+            if mode == 'SDTM':
+                # 预览视图在首次访问时构建（_get_data_view）
+                for entry in datasets.values():
+                    if entry.get('status') == 'loaded':
+                        entry['status'] = 'ready'
+            self.load_state = 'ready'
+        except Exception as e:
+            print('background load error:', e)
+            if generation == self._load_generation:
+                self.load_state = 'error'
+                for entry in datasets.values():
+                    if entry.get('status') in ('pending', 'loading', 'loaded'):
+                        entry.update({'status': 'error', 'error': str(e)})
+        finally:
+            if generation == self._load_generation:
+                self._load_done.set()
+                self._notify_load_progress()
     
-    def read_sas_files(self, directory_path, mode='RAW', use_multithread=True, max_workers=None):
+    def read_sas_files(self, directory_path, mode='RAW', use_multithread=True, max_workers=None, read_mode=None,
+                       two_phase=False, lazy=None):
         """读取SAS数据集文件
         
         Args:
@@ -1101,50 +2018,67 @@ class SASDataProcessor:
             mode: 读取模式 ('RAW' 或 'SDTM')
             use_multithread: 是否使用多线程读取
             max_workers: 最大线程数，默认为None（自动选择）
+            read_mode: 并行方式 ('thread' 或 'process')，默认取 SAS_READ_MODE 环境变量；
+                'process' 使用进程池读取并通过共享内存回传数据，绕开GIL
+            two_phase: 两阶段加载。第一阶段仅读取元数据后立即返回，第二阶段在后台线程加载数据，
+                各数据集的 status 字段依次为 pending/loading/ready（或 error）
+            lazy: 惰性模式，仅读取元数据，数据在首次被预览、合并或生成清单时按需加载（status 为 unloaded/ready），
+                默认取 SAS_LAZY_LOAD 环境变量
         """
+        self._load_generation += 1
         self.datasets = {}
+        self._supp_index = {}
+        self._key_indexes = {}
+        self._preview_queries = {}
+        self.key_dictionary = StudyKeyDictionary()
+        self.read_stats = {}
+        self.load_errors = {}
+        self.file_signatures = {}
+        self.source_directory = directory_path
+        self.source_mode = mode
         self.hide_supp_in_preview = (mode == 'SDTM')
+        self.load_state = 'ready'
+        self._load_done.set()
+        self._notify_load_progress()
+        if lazy is None:
+            lazy = os.getenv('SAS_LAZY_LOAD', 'False').lower() in ('1', 'true', 'yes')
+        self.lazy = bool(lazy)
+        read_mode = (read_mode or os.getenv('SAS_READ_MODE', 'thread')).lower()
+        if read_mode not in ('thread', 'process'):
+            read_mode = 'thread'
         
         try:
             sas_files = glob.glob(os.path.join(directory_path, "*.sas7bdat"))
             
             if not sas_files:
                 return False, "未找到SAS数据集文件"
+            # 在读取数据之前记录签名，读取过程中被修改的文件会在下次增量刷新时重新加载
+            self.file_signatures = self._collect_file_signatures(sas_files)
+
+            if self.lazy:
+                failed_files = self._read_metadata_stubs(sas_files, max_workers, status='unloaded')
+                if not self.datasets:
+                    return False, f"读取元数据失败: {'; '.join(failed_files[:3])}"
+                message = f"已读取 {len(self.datasets)} 个数据集的元数据，数据将在首次访问时加载"
+                if failed_files:
+                    message += f"；{len(failed_files)} 个文件元数据读取失败: {'; '.join(failed_files[:3])}"
+                return True, message
+
+            if two_phase:
+                return self._read_metadata_and_schedule(sas_files, mode, use_multithread, max_workers, read_mode)
             
             failed_files = []
+            total_start = time.perf_counter()
+
+            for dataset_name, dataset_data, error in self._iter_read_results(sas_files, use_multithread, max_workers, read_mode):
+                if error:
+                    failed_files.append(f"{dataset_name}: {error}")
+                else:
+                    self.read_stats[dataset_name] = dataset_data.pop('read_stats', {})
+                    self.datasets[dataset_name] = dataset_data
+            self.read_stats['_total_seconds'] = round(time.perf_counter() - total_start, 4)
             
-            if use_multithread and len(sas_files) > 1:
-                # 使用多线程读取
-                if max_workers is None:
-                    # 根据文件数量和CPU核心数自动选择线程数
-                    max_workers = min(len(sas_files), os.cpu_count() or 4)
-                
-                with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                    # 提交所有读取任务
-                    future_to_file = {executor.submit(self._read_single_sas_file, file_path): file_path 
-                                    for file_path in sas_files}
-                    
-                    # 收集结果
-                    for future in as_completed(future_to_file):
-                        file_path = future_to_file[future]
-                        dataset_name, dataset_data, error = future.result()
-                        
-                        if error:
-                            failed_files.append(f"{dataset_name}: {error}")
-                        else:
-                            self.datasets[dataset_name] = dataset_data
-            else:
-                # 单线程读取（原有逻辑）
-                for file_path in sas_files:
-                    dataset_name, dataset_data, error = self._read_single_sas_file(file_path)
-                    if error:
-                        failed_files.append(f"{dataset_name}: {error}")
-                    else:
-                        self.datasets[dataset_name] = dataset_data
-            
-            if mode == 'SDTM':
-                # 仅构建预览视图，不直接改写主表
-                self._build_preview_views()
+            # SDTM 模式的预览视图不在读取时构建，首次访问时由 _get_data_view 构建并缓存
             
             success_count = len(self.datasets)
             total_count = len(sas_files)
@@ -1155,27 +2089,551 @@ class SASDataProcessor:
                     error_msg += f" 等{len(failed_files)}个文件"
                 return success_count > 0, error_msg
             else:
-                method = "多线程" if use_multithread and len(sas_files) > 1 else "单线程"
+                if use_multithread and len(sas_files) > 1:
+                    method = "多进程" if read_mode == 'process' else "多线程"
+                else:
+                    method = "单线程"
                 return True, f"成功使用{method}读取 {success_count} 个数据集"
                 
         except Exception as e:
             return False, f"读取文件失败: {str(e)}"
+
+    def _collect_file_signatures(self, sas_files):
+        """计算各文件签名 {dataset_name: signature}，无法访问的文件跳过"""
+        signatures = {}
+        for file_path in sas_files:
+            try:
+                signatures[Path(file_path).stem] = sas_reader.file_signature(file_path, self.signature_use_hash)
+            except OSError:
+                continue
+        return signatures
+
+    @staticmethod
+    def _signature_changed(old, new):
+        """判断文件是否变化：双方都有内容哈希时按大小+哈希比较（仅修改时间变化视为未变），否则按大小+修改时间比较"""
+        if not old:
+            return True
+        if old.get('size') != new.get('size'):
+            return True
+        if old.get('sha1') and new.get('sha1'):
+            return old['sha1'] != new['sha1']
+        return old.get('mtime_ns') != new.get('mtime_ns')
+
+    def _supp_domains(self, supp_name, entry):
+        """SUPP 数据集关联的主表域：按名称（SUPPAE -> AE）及已加载数据中的 RDOMAIN 取值"""
+        domains = {supp_name.upper()[4:]}
+        df = (entry or {}).get('raw_data', (entry or {}).get('data'))
+        if isinstance(df, pd.DataFrame) and 'RDOMAIN' in df.columns:
+            domains.update(str(v).upper() for v in df['RDOMAIN'].dropna().unique())
+        return domains
+
+    def refresh_sas_files(self, use_multithread=True, max_workers=None, read_mode=None):
+        """增量刷新当前目录：比较文件签名，仅重新读取新增/修改的文件，移除已删除的文件，
+        SDTM 模式下只让受影响主表的预览视图失效。
+
+        Returns:
+            (success, message, changes)，changes 包含 added/modified/deleted/unchanged/invalidated_views 列表
+        """
+        if not self.source_directory:
+            return False, "尚未读取数据集，无法增量刷新", {}
+        self.wait_until_loaded()
+        read_mode = (read_mode or os.getenv('SAS_READ_MODE', 'thread')).lower()
+        if read_mode not in ('thread', 'process'):
+            read_mode = 'thread'
+
+        with self._lazy_lock:
+            sas_files = glob.glob(os.path.join(self.source_directory, "*.sas7bdat"))
+            signatures = self._collect_file_signatures(sas_files)
+            files_by_name = {Path(f).stem: f for f in sas_files if Path(f).stem in signatures}
+
+            added = sorted(n for n in files_by_name if n not in self.datasets)
+            deleted = sorted(n for n in self.datasets if n not in files_by_name)
+            modified = sorted(n for n in files_by_name if n in self.datasets
+                              and self._signature_changed(self.file_signatures.get(n), signatures[n]))
+            changed = set(added) | set(modified) | set(deleted)
+
+            # 受影响的主表域：变化的主表本身，以及变化的 SUPP 刷新前后关联的 RDOMAIN
+            affected = set()
+            for name in changed:
+                if name.upper().startswith('SUPP'):
+                    affected |= self._supp_domains(name, self.datasets.get(name))
+                else:
+                    affected.add(name.upper())
+
+            for name in changed:
+                self._supp_index.pop(name, None)
+                self._key_indexes.pop(name, None)
+                self._preview_queries.pop(name, None)
+            for name in deleted:
+                self.datasets.pop(name, None)
+                self.file_signatures.pop(name, None)
+                self.read_stats.pop(name, None)
+
+            failed_files = []
+            to_load = [files_by_name[n] for n in added + modified]
+            if to_load and self.lazy:
+                stubs = {}
+                for file_path in to_load:
+                    meta, error = sas_reader.read_sas_metadata(file_path)
+                    if error:
+                        failed_files.append((Path(file_path).stem, error))
+                    else:
+                        stubs[Path(file_path).stem] = {'meta': meta, 'path': file_path, 'status': 'unloaded',
+                                                       'version': self._next_version()}
+                for name, stub in stubs.items():
+                    self.datasets[name] = stub
+                    self.file_signatures[name] = signatures[name]
+                    if self.hide_supp_in_preview and name.upper().startswith('SUPP') and self._load_lazy_entry(name):
+                        # SDTM 惰性模式下 SUPP 始终常驻：立即读取，新的 RDOMAIN 取值所指主表同样受影响
+                        affected |= self._supp_domains(name, stub)
+            elif to_load:
+                for name, dataset_data, error in self._iter_read_results(to_load, use_multithread, max_workers, read_mode):
+                    if error:
+                        failed_files.append((name, error))
+                        continue
+                    self.read_stats[name] = dataset_data.pop('read_stats', {})
+                    self.datasets[name] = dataset_data
+                    self.file_signatures[name] = signatures[name]
+                    if name.upper().startswith('SUPP'):
+                        affected |= self._supp_domains(name, dataset_data)
+
+            # 重新读取失败的文件不再保留旧数据，错误记录在 load_errors 中
+            for name, error in failed_files:
+                self.datasets.pop(name, None)
+                self.file_signatures.pop(name, None)
+                self.load_errors[name] = error
+            failed_names = {name for name, _ in failed_files}
+            for name in added + modified:
+                if name not in failed_names:
+                    self.load_errors.pop(name, None)
+
+            invalidated_views = []
+            if self.hide_supp_in_preview:
+                # 受影响主表的视图失效，下次访问时重建；未加载（惰性淘汰）的主表同样分配新版本号，
+                # 否则其 ETag 与数据集信息仍对应 SUPP 变化前的视图
+                invalidated_views = sorted(n for n in self.datasets
+                                           if n.upper() in affected and not n.upper().startswith('SUPP'))
+                self._invalidate_views(invalidated_views)
+
+        changes = {
+            'added': [n for n in added if n in self.datasets],
+            'modified': [n for n in modified if n in self.datasets],
+            'deleted': deleted,
+            'unchanged': sorted(n for n in self.datasets if n not in changed),
+            'invalidated_views': invalidated_views,
+            'failed': {name: error for name, error in failed_files}
+        }
+        if not changed:
+            return True, "数据集文件未发生变化", changes
+        message = (f"增量刷新完成：新增 {len(changes['added'])} 个，修改 {len(changes['modified'])} 个，"
+                   f"删除 {len(deleted)} 个数据集")
+        if failed_files:
+            message += f"；{len(failed_files)} 个文件读取失败: {'; '.join(f'{n}: {e}' for n, e in failed_files[:3])}"
+        return True, message, changes
+
+    SUPP_KEY_COLUMNS = ['STUDYID', 'RDOMAIN', 'USUBJID', 'IDVAR', 'IDVARVAL', 'QNAM', 'QVAL']
+
+    def _read_projected_file(self, file_path, columns):
+        """列投影读取单个文件：优先从磁盘缓存读取指定列，否则通过 pyreadstat usecols 只解析这些列"""
+        if self.cache is not None:
+            cached = self.cache.load(file_path, columns=list(columns))
+            if cached is not None:
+                return cached[0]
+        df, _, _ = sas_reader.read_sas7bdat(file_path, self.split_threshold_mb, self.split_workers, usecols=list(columns))
+        return df
+
+    def read_projected_views(self, directory_path, required_columns, mode='SDTM', max_workers=None):
+        """列投影读取：每个数据集只读取 required_columns（{dataset_name: 列名集合}）中存在的列。
+        SDTM 模式下若所需列不在主表中（来自 SUPP 的 QNAM），额外读取 SUPP 的键列及主表的合并键列，
+        按预览视图相同的规则合并。结果不写入 self.datasets，不影响已加载的数据。
+
+        Returns:
+            ({dataset_name: DataFrame}, failed_files)
+        """
+        files = {Path(f).stem: f for f in glob.glob(os.path.join(directory_path, "*.sas7bdat"))}
+        targets = [n for n in required_columns if n in files]
+        supp_names = [n for n in files if n.upper().startswith('SUPP')] if mode == 'SDTM' else []
+        meta_names = list(dict.fromkeys(targets + supp_names))
+        failed_files = []
+        if not meta_names:
+            return {}, failed_files
+
+        workers = min(len(meta_names), max_workers or os.cpu_count() or 4)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            metas = dict(zip(meta_names, executor.map(lambda n: sas_reader.read_sas_metadata(files[n]), meta_names)))
+        columns_of = {}
+        for name, (meta, error) in metas.items():
+            if error:
+                failed_files.append(f"{name}: {error}")
+            else:
+                columns_of[name] = list(meta.column_names)
+
+        # 所需列不在主表中的数据集需要合并 SUPP
+        need_supp = {n for n in targets if n in columns_of and mode == 'SDTM'
+                     and not n.upper().startswith('SUPP') and set(required_columns[n]) - set(columns_of[n])}
+        supp_frames = {}
+        if need_supp:
+            domains = {n.upper() for n in need_supp}
+            for supp_name in supp_names:
+                if supp_name not in columns_of:
+                    continue
+                usecols = [c for c in columns_of[supp_name] if c in self.SUPP_KEY_COLUMNS]
+                if 'RDOMAIN' not in usecols:
+                    continue
+                try:
+                    s_df = self._read_projected_file(files[supp_name], usecols)
+                except Exception as e:
+                    failed_files.append(f"{supp_name}: {e}")
+                    continue
+                s_df = s_df[s_df['RDOMAIN'].astype(str).str.upper().isin(domains)].reset_index(drop=True)
+                if not s_df.empty:
+                    supp_frames[supp_name] = s_df
+
+        # 主表投影列：所需列；合并 SUPP 时加上 STUDYID/USUBJID、IDVAR 指向的列、*SEQ 列及与 QNAM 同名的列（保证重名处理一致）
+        projections = {}
+        for name in targets:
+            if name not in columns_of:
+                continue
+            wanted = set(required_columns[name])
+            if name in need_supp:
+                wanted.update(['STUDYID', 'USUBJID'])
+                wanted.update(c for c in columns_of[name] if str(c).upper().endswith('SEQ'))
+                for s_df in supp_frames.values():
+                    sel = s_df[s_df['RDOMAIN'].astype(str).str.upper() == name.upper()]
+                    for col in ('IDVAR', 'QNAM'):
+                        if col in sel.columns:
+                            wanted.update(str(v) for v in sel[col].dropna().unique())
+            projections[name] = [c for c in columns_of[name] if c in wanted]
+
+        helper = SASDataProcessor()
+        helper.hide_supp_in_preview = (mode == 'SDTM')
+        helper.datasets = {}
+        to_read = [n for n, cols in projections.items() if cols]
+        if to_read:
+            with ThreadPoolExecutor(max_workers=min(len(to_read), max_workers or os.cpu_count() or 4)) as executor:
+                future_to_name = {executor.submit(self._read_projected_file, files[n], projections[n]): n for n in to_read}
+                for future in as_completed(future_to_name):
+                    name = future_to_name[future]
+                    try:
+                        df = future.result()
+                    except Exception as e:
+                        failed_files.append(f"{name}: {e}")
+                        continue
+                    helper.datasets[name] = {'data': df, 'raw_data': df}
+        for name, cols in projections.items():
+            if not cols:
+                # 所需列均不存在：返回空表，由调用方按"变量不存在"处理
+                helper.datasets[name] = {'data': pd.DataFrame(), 'raw_data': pd.DataFrame()}
+        for supp_name, s_df in supp_frames.items():
+            helper.datasets[supp_name] = {'data': s_df, 'raw_data': s_df}
+
+        view_targets = [n for n in need_supp if n in helper.datasets]
+        if view_targets:
+            helper._build_preview_views(targets=view_targets)
+        views = {n: helper.datasets[n].get('data_view', helper.datasets[n]['data'])
+                 for n in projections if n in helper.datasets}
+        return views, failed_files
+
+    def _read_metadata_stubs(self, sas_files, max_workers=None, status='pending'):
+        """仅读取元数据，为每个文件生成只含 meta/path/status 的数据集条目，返回失败文件列表"""
+        failed_files = []
+        workers = min(len(sas_files), max_workers or os.cpu_count() or 4)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for file_path, (meta, error) in zip(sas_files, executor.map(sas_reader.read_sas_metadata, sas_files)):
+                dataset_name = Path(file_path).stem
+                if error:
+                    failed_files.append(f"{dataset_name}: {error}")
+                    continue
+                self.datasets[dataset_name] = {'meta': meta, 'path': file_path, 'status': status,
+                                               'version': self._next_version()}
+        return failed_files
+
+    def _read_metadata_and_schedule(self, sas_files, mode, use_multithread, max_workers, read_mode):
+        """两阶段加载的第一阶段：仅读取元数据生成数据集条目，然后启动后台数据加载"""
+        failed_files = self._read_metadata_stubs(sas_files, max_workers)
+
+        if not self.datasets:
+            return False, f"读取元数据失败: {'; '.join(failed_files[:3])}"
+
+        self.load_state = 'loading'
+        self._load_done.clear()
+        loader = threading.Thread(
+            target=self._load_data_in_background,
+            args=(self._load_generation, [d['path'] for d in self.datasets.values()], mode,
+                  use_multithread, max_workers, read_mode),
+            daemon=True
+        )
+        loader.start()
+        message = f"已读取 {len(self.datasets)} 个数据集的元数据，数据正在后台加载"
+        if failed_files:
+            message += f"；{len(failed_files)} 个文件元数据读取失败: {'; '.join(failed_files[:3])}"
+        return True, message
     
+    def ensure_loaded(self, *dataset_names):
+        """惰性模式下按需加载数据集并记录访问时间；SDTM 模式下同时加载 SUPP 并构建对应主表的预览视图。
+        非惰性模式下直接返回。加载失败的数据集保持 error 状态，不抛出异常。"""
+        if not self.lazy:
+            return
+        with self._lazy_lock:
+            names = [n for n in dataset_names if n in self.datasets]
+            view_targets = []
+            for name in names:
+                entry = self.datasets[name]
+                if 'data' not in entry and not self._load_lazy_entry(name):
+                    continue
+                if self.hide_supp_in_preview and not name.upper().startswith('SUPP') and 'data_view' not in entry:
+                    view_targets.append(name)
+            protected = set(names)
+            if view_targets:
+                supp_names = [n for n in self.datasets if n.upper().startswith('SUPP')]
+                for supp_name in supp_names:
+                    if 'data' not in self.datasets[supp_name]:
+                        self._load_lazy_entry(supp_name)
+                protected.update(supp_names)
+                self._build_preview_views(targets=view_targets)
+                for name in view_targets:
+                    self.datasets[name]['memory_bytes'] = self._entry_memory_bytes(self.datasets[name])
+            now = time.monotonic()
+            for name in names:
+                self.datasets[name]['last_access'] = now
+            self._evict_idle_datasets(protected)
+
+    def _pin(self, *dataset_names):
+        """标记数据集正在使用（可重入计数），在 _unpin 之前不会被 _evict_idle_datasets 释放"""
+        with self._lazy_lock:
+            for name in dataset_names:
+                self._pins[name] = self._pins.get(name, 0) + 1
+
+    def _unpin(self, *dataset_names):
+        with self._lazy_lock:
+            for name in dataset_names:
+                count = self._pins.get(name, 0) - 1
+                if count > 0:
+                    self._pins[name] = count
+                else:
+                    self._pins.pop(name, None)
+
+    def _load_lazy_entry(self, dataset_name):
+        """读取惰性条目的数据，成功返回 True"""
+        entry = self.datasets[dataset_name]
+        _, dataset_data, error = self._read_single_sas_file(entry['path'], self.split_threshold_mb,
+                                                            self.split_workers, self.cache)
+        if error:
+            entry.update({'status': 'error', 'error': error})
+            return False
+        dataset_data = self._compact_dataset(dataset_name, dataset_data)
+        self.read_stats[dataset_name] = dataset_data.pop('read_stats', {})
+        # 文件内容与元数据阶段相同，保留条目版本号，使已发出的 ETag 在加载或淘汰后重新加载时仍然有效
+        dataset_data['version'] = entry.get('version', dataset_data['version'])
+        entry.update(dataset_data)
+        entry['status'] = 'ready'
+        entry['memory_bytes'] = self._entry_memory_bytes(entry)
+        entry['last_access'] = time.monotonic()
+        return True
+
+    def _commit_dataset(self, dataset_name, df):
+        """写入数据集的新版本：raw_data 与 data 为共享列缓冲区的两个浅拷贝（写时复制），分配新版本号"""
+        entry = self.datasets[dataset_name]
+        entry['raw_data'] = df
+        entry['data'] = _shared_copy(df)
+        entry['version'] = self._next_version()
+        entry['dirty'] = True
+        self._supp_index.pop(dataset_name, None)
+        self._preview_queries.pop(dataset_name, None)
+        key_index = self._key_indexes.get(dataset_name)
+        if key_index is not None:
+            key_index.prune(df)
+
+    def _key_index(self, dataset_name):
+        """获取数据集的连接键索引（不存在时创建）"""
+        index = self._key_indexes.get(dataset_name)
+        if index is None:
+            index = self._key_indexes.setdefault(dataset_name, KeyIndex(self._normalize_key_series, self.key_dictionary))
+        return index
+
+    def key_cache_stats(self):
+        """各数据集连接键缓存的命中统计及合计，供性能分析"""
+        datasets = {name: index.stats() for name, index in list(self._key_indexes.items())}
+        total = {key: sum(d[key] for d in datasets.values())
+                 for key in ('normalize_hits', 'normalize_misses', 'hits', 'cached_columns')}
+        return {**total, 'datasets': datasets}
+
+    def _attach_columns(self, dataset_name, left, right, keys, value_cols):
+        """将 right 的 value_cols 按 keys 左连接到 left（dataset_name 的某个版本），结果行数与 left 相同：
+        right 键唯一时用键索引查出行位置，与 left.merge(right[keys + value_cols], on=keys, how='left') 一致；
+        键有重复（如规范化后 '1' 与 '1.0' 相同）或类型无法比较时回退到 merge，重复键只取首行，不扩展 left 的行"""
+        positions = self._key_index(dataset_name).positions(left, keys, right, unique=True)
+        if positions is None:
+            return left.merge(right[keys + value_cols].drop_duplicates(subset=keys), on=keys, how='left')
+        result = left.reset_index(drop=True)
+        for col in value_cols:
+            result[col] = right[col].array.take(positions, allow_fill=True)
+        return result
+
+    def _combine_key_codes(self, columns, keys):
+        """按项目键字典各编码空间的大小合成组合编码；须在两侧都编码完成后调用，保证进制一致"""
+        sizes = [max(self.key_dictionary.size(k), 1) for k in keys]
+        if np.prod([float(n) for n in sizes]) >= 2 ** 62:
+            return None, None
+        combined = np.zeros(len(columns[0]) if columns else 0, dtype=np.int64)
+        for codes, n in zip(columns, sizes):
+            combined = combined * n + codes
+        return combined, int(np.prod(sizes, dtype=np.float64))
+
+    def _coded_supp_pivot(self, supp_name, rows, sub, keys):
+        """按项目键字典编码转置 SUPP 行（rows 为 sub 在 SUPP 中的行位置），转置表的键列为 int32 编码。
+        未启用键编码、缺少键列，或键规范化前后不一一对应（分组会与按原值转置不同）时返回 None"""
+        if not self.key_encoding or any(k not in sub.columns for k in keys):
+            return None
+        frame = self._get_supp_index(supp_name)['frame']
+        supp_keys = self._key_index(supp_name)
+        data = {}
+        for k in keys:
+            codes, injective = supp_keys.encoded(frame, k)
+            if not injective:
+                return None
+            data[k] = codes[rows]
+        data['QNAM'] = sub['QNAM'].to_numpy()
+        data['QVAL'] = sub['QVAL'].to_numpy()
+        coded = pd.DataFrame(data)
+        if 'IDVARVAL' in keys:
+            # 与按原值转置一致：IDVARVAL 为空的行不参与
+            coded = coded[sub['IDVARVAL'].notna().to_numpy()]
+        return pivot_first(coded, keys)
+
+    def _attach_coded(self, dataset_name, left, pvt, keys, value_cols):
+        """将键列为字典编码的转置表 pvt 按 keys 左连接到 left：left 的键按规范化值编码，
+        结果与两侧键规范化后 merge(how='left') 一致（pvt 的键由转置保证唯一）"""
+        left_columns = [self._key_index(dataset_name).encoded(left, k)[0] for k in keys]
+        left_codes, size = self._combine_key_codes(left_columns, keys)
+        if left_codes is None:
+            raise OverflowError('too many key combinations for coded join')
+        right_codes, _ = self._combine_key_codes([pvt[k].to_numpy(dtype=np.int64) for k in keys], keys)
+        table, _ = KeyIndex._first_rows(right_codes, np.arange(len(pvt)), size)
+        positions = KeyIndex._find(table, left_codes)
+        result = left.reset_index(drop=True)
+        for col in value_cols:
+            result[col] = pvt[col].array.take(positions, allow_fill=True)
+        return result
+
+    def _coded_supp_values(self, target_dataset, target_df, target_keys, supp_name, supp_df, supp_keys, positions, qnam):
+        """按键字典编码将 SUPP 指定行（positions）的 QVAL 对齐到目标各行：每个规范化键取首行，等价于
+        键规范化 -> drop_duplicates -> merge(how='left') 后取该 QNAM 列。未启用键编码、缺少键列或 QNAM 与键列重名时返回 None"""
+        if not self.key_encoding or qnam in target_keys or qnam in supp_keys or 'QVAL' not in supp_df.columns:
+            return None
+        if any(k not in target_df.columns for k in target_keys) or any(k not in supp_df.columns for k in supp_keys):
+            return None
+        if any(StudyKeyDictionary.domain(t) != StudyKeyDictionary.domain(k) for t, k in zip(target_keys, supp_keys)):
+            return None
+        supp_index = self._key_index(supp_name)
+        right = [supp_index.encoded(supp_df, k)[0][positions] for k in supp_keys]
+        left = [self._key_index(target_dataset).encoded(target_df, k)[0] for k in target_keys]
+        left_codes, size = self._combine_key_codes(left, target_keys)
+        if left_codes is None:
+            return None
+        right_codes, _ = self._combine_key_codes(right, target_keys)
+        table, _ = KeyIndex._first_rows(right_codes, positions, size)
+        return pd.Series(supp_df['QVAL'].array.take(KeyIndex._find(table, left_codes), allow_fill=True))
+
+    def _view_targets_for(self, dataset_name):
+        """返回预览视图依赖该数据集的主表名：主表即自身，SUPP 为其 RDOMAIN 覆盖的主表。
+        SUPP 需在提交新版本前调用，以便包含被整体删除的 RDOMAIN。"""
+        if not dataset_name.upper().startswith('SUPP'):
+            return {dataset_name}
+        index = self._get_supp_index(dataset_name)
+        domains = set(index['domains']) if index else set()
+        return {n for n in list(self.datasets) if not n.upper().startswith('SUPP') and n.upper() in domains}
+
+    @staticmethod
+    def _column_buffers(df):
+        """返回 DataFrame 各列底层缓冲区 {(地址, 字节数): 深度字节数}，用于识别多个视图间共享的列"""
+        buffers = {}
+        for i in range(df.shape[1]):
+            col = df.iloc[:, i]
+            values = col.array
+            arrays = [values.codes, np.asarray(values.categories)] if isinstance(values, pd.Categorical) else [np.asarray(values)]
+            for arr in arrays:
+                key = (arr.__array_interface__['data'][0], arr.nbytes)
+                if key in buffers:
+                    continue
+                if arr.dtype == object:
+                    buffers[key] = int(pd.Series(arr, copy=False).memory_usage(index=False, deep=True))
+                else:
+                    buffers[key] = int(arr.nbytes)
+        return buffers
+
+    @classmethod
+    def _dataset_memory_usage(cls, entry):
+        """统计单个数据集各表示（raw/data/view/SUPP转置）的内存占用，共享的列缓冲区只计一次"""
+        usage, unique = {}, {}
+        for key in ('raw_data', 'data', 'data_view', 'pivot_for_display'):
+            df = entry.get(key)
+            if not isinstance(df, pd.DataFrame):
+                continue
+            buffers = cls._column_buffers(df)
+            usage[f'{key}_bytes'] = sum(buffers.values())
+            unique.update(buffers)
+        total = sum(unique.values())
+        usage['total_bytes'] = total
+        usage['shared_bytes'] = sum(v for k, v in usage.items() if k.endswith('_bytes') and k != 'total_bytes') - total
+        usage['version'] = entry.get('version', 0)
+        if 'compaction' in entry:
+            usage['compaction'] = entry['compaction']
+        return usage
+
+    def get_memory_usage(self):
+        """获取每个已加载数据集的内存占用（字节）"""
+        result = {}
+        for name, entry in list(self.datasets.items()):
+            if 'data' in entry:
+                result[name] = self._dataset_memory_usage(entry)
+        return result
+
+    @classmethod
+    def _entry_memory_bytes(cls, entry):
+        """估算条目实际占用的内存（共享的列缓冲区只计一次）"""
+        return cls._dataset_memory_usage(entry)['total_bytes']
+
+    def _evict_idle_datasets(self, protected=()):
+        """超出内存预算时按最久未访问顺序释放数据集数据，仅淘汰未被合并修改过且未在使用中的条目。
+        被释放的条目整体替换为只含元数据的新条目（不在原条目上删除字段），已取得原条目的请求仍读到完整数据，
+        数据内存在最后一个持有者用完后回收"""
+        if not self.lazy or self.memory_budget_mb <= 0:
+            return
+        with self._lazy_lock:
+            budget = self.memory_budget_mb * 1024 * 1024
+            loaded = [(n, e) for n, e in list(self.datasets.items()) if 'data' in e]
+            used = sum(e.get('memory_bytes', 0) for _, e in loaded)
+            for name, entry in sorted(loaded, key=lambda item: item[1].get('last_access', 0)):
+                if used <= budget:
+                    break
+                # SDTM 模式下 SUPP 参与所有主表视图的重建，不淘汰
+                if name in protected or self._pins.get(name) or entry.get('dirty') \
+                        or (self.hide_supp_in_preview and name.upper().startswith('SUPP')):
+                    continue
+                released = ('data', 'raw_data', 'data_view', 'pivot_for_display', 'use_pivot_preview', 'memory_bytes')
+                stub = {k: v for k, v in entry.items() if k not in released}
+                stub['status'] = 'unloaded'
+                self.datasets[name] = stub
+                self._key_indexes.pop(name, None)
+                self._preview_queries.pop(name, None)
+                used -= entry.get('memory_bytes', 0)
+
     def _process_sdtm_datasets(self):
         """兼容方法：仅为 SUPP 生成转置预览，不改写主表。"""
-        for supp_name, supp_data in {n: d for n, d in self.datasets.items() if n.upper().startswith('SUPP')}.items():
+        for supp_name, supp_data in {n: d for n, d in list(self.datasets.items()) if n.upper().startswith('SUPP')}.items():
             df = supp_data.get('raw_data', supp_data['data'])
             self._transpose_supp_for_display(supp_name, df)
     
     def _merge_supp_data(self, supp_name, target_name, supp_df):
         """合并SUPP数据到目标数据集（符合SDTM规范的转置逻辑）"""
-        target_df = self.datasets[target_name]['data'].copy()
+        target_df = _shared_copy(self.datasets[target_name]['data'])
 
-        # 仅处理与目标域匹配的SUPP记录（不区分大小写）
-        rdomain_series = supp_df['RDOMAIN'].astype(str).str.upper() if 'RDOMAIN' in supp_df.columns else pd.Series([], dtype=str)
-        filtered_supp = supp_df[rdomain_series == str(target_name).upper()].copy()
-        if filtered_supp.empty:
+        # 仅处理与目标域匹配的SUPP记录（不区分大小写），使用 RDOMAIN 分区索引
+        filtered_supp, _ = self._supp_rows_for_domain(supp_name, target_name, supp_df)
+        if filtered_supp is None or filtered_supp.empty:
             return
+        filtered_supp = filtered_supp.copy()
 
         # 规范关键列类型，避免连接时类型不一致
         for col in ['STUDYID', 'USUBJID', 'IDVAR', 'IDVARVAL', 'QNAM', 'QVAL']:
@@ -1205,15 +2663,7 @@ class SASDataProcessor:
                     continue
 
                 # 以 STUDYID, USUBJID, IDVARVAL 为索引，将 QNAM 转列，QVAL 为值（包含所有 QNAM，如 AEYNDESC 等）
-                pvt = (
-                    sub.pivot_table(
-                        index=['STUDYID', 'USUBJID', 'IDVARVAL'],
-                        columns='QNAM',
-                        values='QVAL',
-                        aggfunc='first'
-                    )
-                    .reset_index()
-                )
+                pvt = pivot_first(sub, ['STUDYID', 'USUBJID', 'IDVARVAL'])
 
                 # 将 IDVARVAL 列重命名为以 IDVAR 的值命名的新列（例如 AESEQ）
                 pvt = pvt.rename(columns={'IDVARVAL': idvar_name})
@@ -1241,7 +2691,7 @@ class SASDataProcessor:
                 # 键列统一为字符串并标准化（处理 '1' vs '1.0'）
                 for key in ['STUDYID', 'USUBJID', idvar_name]:
                     if key in updated_target.columns:
-                        updated_target[key] = self._normalize_key_series(updated_target[key])
+                        updated_target[key] = self._key_index(target_name).normalized(updated_target, key)
                     if key in pvt.columns:
                         pvt[key] = self._normalize_key_series(pvt[key])
 
@@ -1259,8 +2709,8 @@ class SASDataProcessor:
                     else:
                         continue
 
-                updated_target = updated_target.merge(
-                    pvt, on=['STUDYID', 'USUBJID', idvar_name], how='left'
+                updated_target = self._attach_columns(
+                    target_name, updated_target, pvt, ['STUDYID', 'USUBJID', idvar_name], final_value_cols
                 )
 
                 # 记录来源映射：这些新增列来自于 SUPP 数据集
@@ -1283,17 +2733,10 @@ class SASDataProcessor:
                             }
 
             self.datasets[target_name]['data'] = updated_target
+            self.datasets[target_name]['version'] = self._next_version()
         else:
             # 无IDVAR时，按 STUDYID, USUBJID 粒度转置并合并
-            pvt = (
-                filtered_supp.pivot_table(
-                    index=['STUDYID', 'USUBJID'],
-                    columns='QNAM',
-                    values='QVAL',
-                    aggfunc='first'
-                )
-                .reset_index()
-            )
+            pvt = pivot_first(filtered_supp, ['STUDYID', 'USUBJID'])
             # 处理列名冲突（保留所有 QNAM），并规范键列
             keep_cols = ['STUDYID', 'USUBJID']
             value_cols = [c for c in pvt.columns if c not in keep_cols]
@@ -1316,13 +2759,14 @@ class SASDataProcessor:
             # 标准化键列以保证连接
             for key in ['STUDYID', 'USUBJID']:
                 if key in target_df.columns:
-                    target_df[key] = self._normalize_key_series(target_df[key])
+                    target_df[key] = self._key_index(target_name).normalized(target_df, key)
                 if key in pvt.columns:
                     pvt[key] = self._normalize_key_series(pvt[key])
             pvt = pvt[keep_cols + final_value_cols]
 
-            merged = target_df.merge(pvt, on=['STUDYID', 'USUBJID'], how='left')
+            merged = self._attach_columns(target_name, target_df, pvt, keep_cols, final_value_cols)
             self.datasets[target_name]['data'] = merged
+            self.datasets[target_name]['version'] = self._next_version()
 
             # 记录来源映射
             if final_value_cols:
@@ -1350,6 +2794,8 @@ class SASDataProcessor:
         """生成并缓存SUPP数据集的转置宽表，仅用于前端展示选择变量（变量名=QNAM）。"""
         if 'QNAM' not in supp_df.columns or 'QVAL' not in supp_df.columns:
             return
+        # 浅拷贝后再做类型转换，避免改写调用方传入的 raw_data
+        supp_df = _shared_copy(supp_df)
         base_index = ['STUDYID', 'USUBJID']
         if 'RDOMAIN' in supp_df.columns:
             base_index.append('RDOMAIN')
@@ -1362,50 +2808,209 @@ class SASDataProcessor:
                 supp_df[col] = supp_df[col].astype(str)
 
         try:
-            pvt = (
-                supp_df.pivot_table(
-                    index=[c for c in base_index if c in supp_df.columns],
-                    columns='QNAM',
-                    values='QVAL',
-                    aggfunc='first'
-                )
-                .reset_index()
-            )
+            pvt = pivot_first(supp_df, [c for c in base_index if c in supp_df.columns])
         except Exception:
             # 回退：只用必需键
             fallback_index = [c for c in ['STUDYID', 'USUBJID'] if c in supp_df.columns]
-            pvt = (
-                supp_df.pivot_table(
-                    index=fallback_index,
-                    columns='QNAM',
-                    values='QVAL',
-                    aggfunc='first'
-                )
-                .reset_index()
-            )
+            pvt = pivot_first(supp_df, fallback_index)
 
         # 缓存转置结果并标记仅用于预览
         self.datasets[supp_name]['pivot_for_display'] = pvt
         self.datasets[supp_name]['use_pivot_preview'] = True
+        self.datasets[supp_name]['version'] = self._next_version()
+
+    @staticmethod
+    def _build_supp_index(s_df):
+        """按 RDOMAIN（大写）与 IDVAR 对 SUPP 行分区，保存位置下标：
+        {'frame': s_df, 'domains': {域: {'rows': 行下标, 'has_idvar': bool, 'idvars': {IDVAR: 域内行下标}}}}。
+        IDVAR 为空白/'nan'/'None' 的行视为无 IDVAR。"""
+        index = {'frame': s_df, 'domains': {}}
+        if 'RDOMAIN' not in s_df.columns or s_df.empty:
+            return index
+        codes, domains = pd.factorize(s_df['RDOMAIN'].astype(str).str.upper())
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(domains) + 1))
+        if 'IDVAR' in s_df.columns:
+            idvar_values = s_df['IDVAR'].to_numpy(dtype=object)
+            idvar_blank = (s_df['IDVAR'].isna() |
+                           s_df['IDVAR'].astype(str).str.strip().isin(['', 'nan', 'None'])).to_numpy()
+        for i, domain in enumerate(domains):
+            rows = order[bounds[i]:bounds[i + 1]]
+            info = {'rows': rows, 'has_idvar': False, 'idvars': {}}
+            if 'IDVAR' in s_df.columns:
+                valid = ~idvar_blank[rows]
+                if valid.any():
+                    values = idvar_values[rows]
+                    info['has_idvar'] = True
+                    for value in pd.unique(values[valid]):
+                        key = str(value)
+                        if key not in info['idvars']:
+                            info['idvars'][key] = np.flatnonzero(valid & (values == key))
+            index['domains'][domain] = info
+        return index
+
+    def _get_supp_index(self, supp_name, s_df=None):
+        """获取 SUPP 分区索引；索引与 raw_data 对象绑定，数据集被替换后自动重建。
+        传入的 s_df 不是该 SUPP 当前数据时构建临时索引（不缓存）"""
+        entry = self.datasets.get(supp_name) or {}
+        current = entry.get('raw_data', entry.get('data'))
+        if s_df is None:
+            s_df = current
+        if s_df is None:
+            return None
+        cached = self._supp_index.get(supp_name)
+        if cached is not None and cached['frame'] is s_df:
+            return cached
+        index = self._build_supp_index(s_df)
+        if s_df is current:
+            self._supp_index[supp_name] = index
+        return index
+
+    def _supp_rows_for_domain(self, supp_name, domain, s_df=None):
+        """返回 SUPP 中 RDOMAIN 与 domain 匹配（不区分大小写）的行及其 IDVAR 分区信息；无匹配返回 (None, None)"""
+        index = self._get_supp_index(supp_name, s_df)
+        info = index['domains'].get(str(domain).upper()) if index else None
+        if info is None:
+            return None, None
+        return index['frame'].iloc[info['rows']], info
+
+    @staticmethod
+    def _supp_column_names(existing, qnams):
+        """为 SUPP 转置出的 QNAM 列分配视图列名：与已有列或本批列重名时追加 _SUPP、_SUPP2...
+        返回 ({QNAM: 列名}, [列名])"""
+        ren, finals = {}, []
+        for c in qnams:
+            newc = str(c)
+            if newc in existing or newc in finals:
+                i = 1
+                cand = f"{newc}_SUPP"
+                while cand in existing or cand in finals:
+                    i += 1
+                    cand = f"{newc}_SUPP{i}"
+                newc = cand
+            ren[c] = newc
+            finals.append(newc)
+        return ren, finals
 
-    def _build_preview_views(self) -> None:
-        """基于 raw_data 构建仅用于预览展示的主表视图，把 SUPP 合并进对应 RDOMAIN。"""
+    def _invalidate_views(self, targets=None):
+        """丢弃主表的预览视图及其来源映射，下次访问时按需重建；targets 为 None 表示全部。
+        视图内容（合入的 SUPP 列）随之变化，为条目分配新版本号。
+        两阶段加载的后台线程会同时插入条目，遍历条目快照"""
+        for name, entry in list(self.datasets.items()):
+            if targets is not None and name not in targets:
+                continue
+            entry.pop('data_view', None)
+            entry['version'] = self._next_version()
+            self._preview_queries.pop(name, None)
+            extra_meta = entry.get('extra_meta')
+            if isinstance(extra_meta, dict):
+                extra_meta.pop('preview_origin_map', None)
+
+    def _get_data_view(self, dataset_name):
+        """返回数据集用于预览/清单的视图。SDTM 模式下主表视图在首次访问时构建并缓存，
+        数据集或其 SUPP 变更后由 _invalidate_views 失效；其他情况直接返回 data。未加载返回 None"""
+        entry = self.datasets.get(dataset_name)
+        if entry is None:
+            return None
+        if self.hide_supp_in_preview and not dataset_name.upper().startswith('SUPP') and 'data_view' not in entry:
+            if self.lazy:
+                # 惰性模式由 ensure_loaded 先加载数据与 SUPP 再构建视图
+                self.ensure_loaded(dataset_name)
+            elif 'data' in entry:
+                self._build_preview_views(targets=[dataset_name])
+        if 'data' not in entry:
+            return None
+        return entry.get('data_view', entry['data'])
+
+    def _preview_view_schema(self, target_name):
+        """不执行合并，仅推算主表预览视图的列名与来源映射（与 _build_preview_views 的列规则一致），
+        供视图尚未构建时的数据集信息使用。返回 (列名列表, 来源映射)"""
+        entry = self.datasets[target_name]
+        frame = entry.get('raw_data', entry.get('data'))
+        if frame is not None:
+            columns = list(frame.columns)
+        else:
+            # 主表未加载（两阶段加载第一阶段或惰性模式下被淘汰）：按元数据中的列名推算
+            columns = list(getattr(entry.get('meta'), 'column_names', None) or [])
+        origin_map = {}
+        blank = ['', 'nan', 'None']
+        for supp_name, supp in list(self.datasets.items()):
+            if not supp_name.upper().startswith('SUPP') or 'data' not in supp:
+                continue
+            sel, supp_rows = self._supp_rows_for_domain(supp_name, target_name)
+            if sel is None or sel.empty or not {'STUDYID', 'USUBJID', 'QNAM', 'QVAL'}.issubset(sel.columns):
+                continue
+            qnams = sel['QNAM'].astype(str).to_numpy(dtype=object)
+            groups = []
+            if 'IDVAR' in sel.columns and supp_rows['has_idvar']:
+                if 'IDVARVAL' not in sel.columns:
+                    continue
+                # 转置时 IDVARVAL 为空的行被丢弃，其 QNAM 不会成为列
+                idvarval = sel['IDVARVAL']
+                valid = (idvarval.notna() & ~idvarval.astype(str).str.strip().isin(blank)).to_numpy()
+                for idv, idv_rows in supp_rows['idvars'].items():
+                    if len(idv_rows) == 0:
+                        continue
+                    groups.append((idv, qnams[idv_rows][valid[idv_rows]]))
+            else:
+                groups.append((None, qnams))
+            for idv, group_qnams in groups:
+                keep = ['STUDYID', 'USUBJID'] + ([idv] if idv is not None else [])
+                vals = [c for c in sorted(pd.unique(group_qnams)) if c not in keep]
+                ren, finals = self._supp_column_names(columns, vals)
+                if idv is not None and idv not in columns \
+                        and not any(str(c).upper().endswith('SEQ') for c in columns):
+                    # 主表既无 IDVAR 指向的列也无 *SEQ 列时不合并
+                    continue
+                columns.extend(finals)
+                for oc, nc in ren.items():
+                    origin_map[nc] = {'supp_ds': supp_name, 'qnam': str(oc), 'idvar': idv}
+        return columns, origin_map
+
+    @staticmethod
+    def _supp_failed_columns(preview_df, origin_map):
+        """从 SUPP 合入的列在主表中全部为空时视为合并失败，返回失败明细列表"""
+        failed = []
+        total_rows = len(preview_df)
+        if not isinstance(origin_map, dict) or total_rows == 0:
+            return failed
+        for col, meta in origin_map.items():
+            if col in preview_df.columns:
+                non_null = int(preview_df[col].notna().sum())
+                if non_null == 0:
+                    failed.append({
+                        'column': col,
+                        'non_null': non_null,
+                        'total': total_rows,
+                        'supp_ds': meta.get('supp_ds'),
+                        'qnam': meta.get('qnam'),
+                        'idvar': meta.get('idvar')
+                    })
+        return failed
+
+    def _build_preview_views(self, targets=None) -> None:
+        """基于 raw_data 构建仅用于预览展示的主表视图，把 SUPP 合并进对应 RDOMAIN。
+        targets 指定仅重建哪些主表的视图，None 表示全部；尚未加载数据的（惰性）条目跳过。"""
         # 为主表生成视图
-        supp_entries = {n: d for n, d in self.datasets.items() if n.upper().startswith('SUPP')}
-        for target_name, entry in self.datasets.items():
+        # 后台加载线程可能同时插入条目，遍历条目快照
+        entries = list(self.datasets.items())
+        supp_entries = {n: d for n, d in entries if n.upper().startswith('SUPP') and 'data' in d}
+        for target_name, entry in entries:
+            if targets is not None and target_name not in targets:
+                continue
+            if 'data' not in entry:
+                continue
             if target_name.upper().startswith('SUPP'):
                 entry.pop('data_view', None)
                 continue
             target_raw = entry.get('raw_data', entry['data'])
-            view_df = target_raw.copy()
+            view_df = _shared_copy(target_raw)
             origin_map = {}
+            key_index = self._key_index(target_name)
 
             for supp_name, supp in supp_entries.items():
-                s_df = supp.get('raw_data', supp['data'])
-                if 'RDOMAIN' not in s_df.columns:
-                    continue
-                sel = s_df[s_df['RDOMAIN'].astype(str).str.upper() == str(target_name).upper()].copy()
-                if sel.empty:
+                sel, supp_rows = self._supp_rows_for_domain(supp_name, target_name)
+                if sel is None or sel.empty:
                     continue
                 # 先将稳定键与取值转为字符串，避免类型不一致；IDVAR/IDVARVAL 保持缺失为真正的NA
                 for c in ['STUDYID','USUBJID','QNAM','QVAL']:
@@ -1420,32 +3025,31 @@ class SASDataProcessor:
 
                 # 仅在存在 IDVAR 时走 IDVAR 路径；不再额外进行“无 IDVAR”回退合并，避免重复/错误合并
                 processed_qnams_with_idvar: set[str] = set()
-                if 'IDVAR' in sel.columns and sel['IDVAR'].notna().any():
-                    for idv in [str(v) for v in sel['IDVAR'].dropna().unique()]:
-                        sub = sel[sel['IDVAR']==idv]
+                if 'IDVAR' in sel.columns and supp_rows['has_idvar']:
+                    for idv, idv_rows in supp_rows['idvars'].items():
+                        sub = sel.iloc[idv_rows]
                         if sub.empty:
                             continue
                         # 记录该分组涉及的 QNAM，供后续无 IDVAR 部分排除，避免同一 QNAM 因两类合并被加入两次
                         processed_qnams_with_idvar.update(sub['QNAM'].astype(str).unique().tolist())
-                        pvt = sub.pivot_table(index=['STUDYID','USUBJID','IDVARVAL'], columns='QNAM', values='QVAL', aggfunc='first').reset_index()
+                        # 目标含 IDVAR 指向的列时按键字典编码转置与连接，跳过转置表键列的规范化
+                        pvt = None
+                        if all(k in view_df.columns for k in ('STUDYID', 'USUBJID', idv)) and \
+                                StudyKeyDictionary.domain(idv) == StudyKeyDictionary.domain('IDVARVAL'):
+                            pvt = self._coded_supp_pivot(supp_name, supp_rows['rows'][idv_rows], sub, ['STUDYID','USUBJID','IDVARVAL'])
+                        coded = pvt is not None
+                        if not coded:
+                            pvt = pivot_first(sub, ['STUDYID','USUBJID','IDVARVAL'])
                         pvt = pvt.rename(columns={'IDVARVAL': idv})
                         keep = ['STUDYID','USUBJID', idv]
                         vals = [c for c in pvt.columns if c not in keep]
                         # 重名处理
-                        ren, finals = {}, []
-                        for c in vals:
-                            newc = str(c)
-                            if newc in view_df.columns or newc in finals:
-                                i=1; cand=f"{newc}_SUPP"
-                                while cand in view_df.columns or cand in finals:
-                                    i+=1; cand=f"{newc}_SUPP{i}"
-                                newc=cand
-                            ren[c]=newc; finals.append(newc)
+                        ren, finals = self._supp_column_names(view_df.columns, vals)
                         if ren: pvt=pvt.rename(columns=ren)
                         # 标准化键
                         for k in ['STUDYID','USUBJID', idv]:
-                            if k in view_df.columns: view_df[k]=self._normalize_key_series(view_df[k])
-                            if k in pvt.columns: pvt[k]=self._normalize_key_series(pvt[k])
+                            if k in view_df.columns: view_df[k]=key_index.normalized(view_df, k)
+                            if k in pvt.columns and not coded: pvt[k]=self._normalize_key_series(pvt[k])
                         join_id = idv if idv in view_df.columns else None
                         if not join_id:
                             # 回退 *SEQ
@@ -1456,107 +3060,364 @@ class SASDataProcessor:
                                     join_id=c; break
                         if not join_id: 
                             continue
-                        view_df = view_df.merge(pvt[['STUDYID','USUBJID', join_id] + finals], left_on=['STUDYID','USUBJID', join_id], right_on=['STUDYID','USUBJID', join_id], how='left')
+                        if coded:
+                            view_df = self._attach_coded(target_name, view_df, pvt, keep, finals)
+                        else:
+                            view_df = self._attach_columns(target_name, view_df, pvt, ['STUDYID','USUBJID', join_id], finals)
                         for oc, nc in ren.items(): origin_map[nc]={'supp_ds':supp_name,'qnam':str(oc),'idvar':idv}
                         for nc in finals:
                             if nc not in origin_map: origin_map[nc]={'supp_ds':supp_name,'qnam':nc,'idvar':idv}
                 # 仍需处理 IDVAR 为空的行：按 STUDYID/USUBJID 合并
                 # 若完全不存在 IDVAR 列，才按 STUDYID/USUBJID 合并（兼容极少量数据集）
                 elif 'IDVAR' not in sel.columns:
-                    pvt = sel.pivot_table(index=['STUDYID','USUBJID'], columns='QNAM', values='QVAL', aggfunc='first').reset_index()
                     keep=['STUDYID','USUBJID']
+                    pvt = self._coded_supp_pivot(supp_name, supp_rows['rows'], sel, keep) if all(k in view_df.columns for k in keep) else None
+                    coded = pvt is not None
+                    if not coded:
+                        pvt = pivot_first(sel, keep)
                     vals=[c for c in pvt.columns if c not in keep]
-                    ren, finals = {}, []
-                    for c in vals:
-                        newc=str(c)
-                        if newc in view_df.columns or newc in finals:
-                            i=1; cand=f"{newc}_SUPP"
-                            while cand in view_df.columns or cand in finals:
-                                i+=1; cand=f"{newc}_SUPP{i}"
-                            newc=cand
-                        ren[c]=newc; finals.append(newc)
+                    ren, finals = self._supp_column_names(view_df.columns, vals)
                     if ren: pvt=pvt.rename(columns=ren)
                     for k in ['STUDYID','USUBJID']:
-                        if k in view_df.columns: view_df[k]=self._normalize_key_series(view_df[k])
-                        if k in pvt.columns: pvt[k]=self._normalize_key_series(pvt[k])
-                    view_df=view_df.merge(pvt[keep+finals], on=['STUDYID','USUBJID'], how='left')
+                        if k in view_df.columns: view_df[k]=key_index.normalized(view_df, k)
+                        if k in pvt.columns and not coded: pvt[k]=self._normalize_key_series(pvt[k])
+                    if coded:
+                        view_df=self._attach_coded(target_name, view_df, pvt, keep, finals)
+                    else:
+                        view_df=self._attach_columns(target_name, view_df, pvt, keep, finals)
                     for oc,nc in ren.items(): origin_map[nc]={'supp_ds':supp_name,'qnam':str(oc),'idvar':None}
                     for nc in finals:
                         if nc not in origin_map: origin_map[nc]={'supp_ds':supp_name,'qnam':nc,'idvar':None}
                 else:
-                    pvt = sel.pivot_table(index=['STUDYID','USUBJID'], columns='QNAM', values='QVAL', aggfunc='first').reset_index()
                     keep=['STUDYID','USUBJID']
+                    pvt = self._coded_supp_pivot(supp_name, supp_rows['rows'], sel, keep) if all(k in view_df.columns for k in keep) else None
+                    coded = pvt is not None
+                    if not coded:
+                        pvt = pivot_first(sel, keep)
                     vals=[c for c in pvt.columns if c not in keep]
-                    ren, finals = {}, []
-                    for c in vals:
-                        newc=str(c)
-                        if newc in view_df.columns or newc in finals:
-                            i=1; cand=f"{newc}_SUPP"
-                            while cand in view_df.columns or cand in finals:
-                                i+=1; cand=f"{newc}_SUPP{i}"
-                            newc=cand
-                        ren[c]=newc; finals.append(newc)
+                    ren, finals = self._supp_column_names(view_df.columns, vals)
                     if ren: pvt=pvt.rename(columns=ren)
                     for k in ['STUDYID','USUBJID']:
-                        if k in view_df.columns: view_df[k]=self._normalize_key_series(view_df[k])
-                        if k in pvt.columns: pvt[k]=self._normalize_key_series(pvt[k])
-                    view_df=view_df.merge(pvt[keep+finals], on=['STUDYID','USUBJID'], how='left')
+                        if k in view_df.columns: view_df[k]=key_index.normalized(view_df, k)
+                        if k in pvt.columns and not coded: pvt[k]=self._normalize_key_series(pvt[k])
+                    if coded:
+                        view_df=self._attach_coded(target_name, view_df, pvt, keep, finals)
+                    else:
+                        view_df=self._attach_columns(target_name, view_df, pvt, keep, finals)
                     for oc,nc in ren.items(): origin_map[nc]={'supp_ds':supp_name,'qnam':str(oc),'idvar':None}
                     for nc in finals:
                         if nc not in origin_map: origin_map[nc]={'supp_ds':supp_name,'qnam':nc,'idvar':None}
 
-            entry['data_view']=view_df
-            entry.setdefault('extra_meta',{})['preview_origin_map']=origin_map
-    
-    def get_dataset_preview(self, dataset_name, limit=10, offset=0):
-        """获取数据集预览，支持分页 limit/offset，limit<=0 或 None 表示全量。SUPP使用转置预览。"""
-        if dataset_name in self.datasets:
-            entry = self.datasets[dataset_name]
-            if self.hide_supp_in_preview:
-                if dataset_name.upper().startswith('SUPP'):
-                    return {
-                        'columns': ['MESSAGE'],
-                        'data': [{'MESSAGE': 'SUPP 数据已合并至对应 RDOMAIN 展示'}],
-                        'total_rows': 1,
-                        'dataset_name': dataset_name
-                    }
-                df = entry.get('data_view', entry['data'])
-            else:
-                df = entry['data']
-                if dataset_name.upper().startswith('SUPP') and entry.get('use_pivot_preview') and 'pivot_for_display' in entry:
-                    df = entry['pivot_for_display']
-            total_rows = len(df)
-            # 为确保JSON有效性，将NaN/NaT/Inf等值转换为null，并规范时间格式
-            if limit is None or limit <= 0:
-                sample = df.copy()
+            entry['data_view']=view_df
+            entry.setdefault('extra_meta',{})['preview_origin_map']=origin_map
+    
+    def get_dataset_preview(self, dataset_name, limit=10, offset=0, query=None):
+        """获取数据集预览，支持分页 limit/offset，limit<=0 或 None 表示全量。SUPP使用转置预览。
+        query 为 {'sort', 'filters', 'search'}（见 PreviewQuery.parse），给出时按查询结果分页，total_rows 为结果行数"""
+        page = self._preview_page(dataset_name, limit, offset, query)
+        if page is None:
+            return None
+        df, sample, extra, total = page
+        return {
+            'columns': list(df.columns),
+            'data': self._records_for_json(sample),
+            'total_rows': total,
+            'dataset_name': dataset_name,
+            **extra
+        }
+
+    def get_dataset_preview_json(self, dataset_name, limit=10, offset=0, shape='records', query=None):
+        """与 get_dataset_preview 相同的预览，直接序列化为 JSON 响应字节（不经 Python 对象中转）。
+        shape='columns' 时 data 为按 columns 顺序排列的列数组（[[第1列各行值], ...]）而非行对象；
+        limit>0 时附带分页字段 page/page_size/total_pages。数据集不存在时返回 None"""
+        page = self._preview_page(dataset_name, limit, offset, query)
+        if page is None:
+            return None
+        df, sample, extra, total = page
+        meta = {'columns': list(df.columns), 'total_rows': total, 'dataset_name': dataset_name, **extra}
+        if limit is not None and limit > 0:
+            meta.update({
+                'page': (offset // limit) + 1,
+                'page_size': limit,
+                'total_pages': (total + limit - 1) // limit
+            })
+        if shape == 'columns':
+            meta['format'] = 'columns'
+        data_json = self._frame_json(sample, shape)
+        return ('{"data":' + data_json + ',' + json.dumps(meta, ensure_ascii=False)[1:]).encode('utf-8')
+
+    def iter_dataset_preview(self, dataset_name, shape='records', chunk_rows=10000, query=None):
+        """全量预览的流式输出：返回逐块生成 NDJSON 文本的生成器，数据集不存在时返回 None。
+        首行为元数据（columns/total_rows/dataset_name/format 等）；shape='records' 时其后每行一个行对象，
+        shape='columns' 时其后每行为一块 {"offset": 起始行, "data": [列数组, ...]}。
+        各块在迭代到时才序列化，客户端断开（生成器被关闭）后不再处理剩余行"""
+        source = self._preview_source(dataset_name)
+        if source is None:
+            return None
+        df, downcast_columns, extra = source
+        rows = self._preview_rows(dataset_name, df, query)
+        total = len(df) if rows is None else len(rows)
+        if rows is not None:
+            extra = {**extra, 'unfiltered_rows': len(df)}
+        chunk_rows = max(1, int(chunk_rows))
+        header = {'columns': list(df.columns), 'total_rows': total, 'dataset_name': dataset_name,
+                  'format': shape, 'chunk_rows': chunk_rows, **extra}
+
+        def chunks():
+            yield json.dumps(header, ensure_ascii=False) + '\n'
+            for start in range(0, total, chunk_rows):
+                chunk = df.iloc[start:start + chunk_rows] if rows is None else df.take(rows[start:start + chunk_rows])
+                chunk = sas_reader.restore_compacted_dtypes(chunk, downcast_columns)
+                if shape == 'columns':
+                    yield '{"offset":%d,"data":%s}\n' % (start, self._frame_json(chunk, 'columns'))
+                else:
+                    yield self._frame_json(chunk, 'lines')
+        return chunks()
+
+    def _preview_page(self, dataset_name, limit, offset, query=None):
+        """预览的数据来源与当前页：返回 (完整预览表, 当前页, 附加字段, 结果行数)，数据集不存在时返回 None"""
+        source = self._preview_source(dataset_name)
+        if source is None:
+            return None
+        df, downcast_columns, extra = source
+        rows = self._preview_rows(dataset_name, df, query)
+        total = len(df) if rows is None else len(rows)
+        if limit is None or limit <= 0:
+            start, end = 0, total
+        else:
+            start = max(0, int(offset))
+            end = max(start, start + int(limit))
+        if rows is None:
+            sample = df.iloc[start:end]
+        else:
+            # 按缓存的结果行顺序只取当前页
+            sample = df.take(rows[start:end])
+            extra = {**extra, 'unfiltered_rows': len(df)}
+        # 类型压缩过的整数列按原始 float64 输出，保证预览JSON与未压缩时一致
+        sample = sas_reader.restore_compacted_dtypes(sample, downcast_columns)
+        return df, sample, extra, total
+
+    def get_dataset_schema(self, dataset_name, query=None):
+        """预览表的轻量结构信息：结果行数与各列的名称/类型/标签，不序列化任何数据行。
+        列类型为 number/datetime/string；给出 query 时 total_rows 为查询结果行数。数据集不存在时返回 None"""
+        source = self._preview_source(dataset_name)
+        if source is None:
+            return None
+        df, _, extra = source
+        rows = self._preview_rows(dataset_name, df, query)
+        if rows is not None:
+            extra = {**extra, 'unfiltered_rows': len(df)}
+        labels = getattr(self.datasets[dataset_name].get('meta'), 'column_names_to_labels', None) or {}
+        columns = []
+        for name, dtype in df.dtypes.items():
+            if pd.api.types.is_bool_dtype(dtype) or not pd.api.types.is_numeric_dtype(dtype):
+                kind = 'datetime' if pd.api.types.is_datetime64_any_dtype(dtype) else 'string'
             else:
-                start = max(0, int(offset))
-                end = max(start, start + int(limit))
-                sample = df.iloc[start:end].copy()
-            # 修复Pandas未来版本兼容性警告 - 使用更安全的方法处理无穷值
-            for col in sample.select_dtypes(include=[np.number]).columns:
-                sample[col] = sample[col].where(~np.isinf(sample[col]), pd.NA)
-            # 使用pandas内置to_json处理缺失值为null，再反序列化回Python对象
-            records_json = sample.to_json(orient='records', date_format='iso', force_ascii=False)
-            safe_records = json.loads(records_json)
+                kind = 'number'
+            columns.append({'name': name, 'dtype': kind, 'label': labels.get(name) or ''})
+        return {
+            'dataset_name': dataset_name,
+            'total_rows': len(df) if rows is None else len(rows),
+            'total_columns': len(columns),
+            'columns': columns,
+            **extra
+        }
+
+    def get_dataset_viewport_json(self, dataset_name, row_start=0, row_count=100, columns=None,
+                                  col_start=0, col_count=None, shape='columns', query=None):
+        """预览表中一个矩形区域（行窗口 x 列子集）的 JSON 响应字节，供前端虚拟滚动按需取数。
+        columns 为列名列表时按给定顺序取列，否则取第 col_start 列起的 col_count 列（None 表示到最后一列）；
+        行窗口作用于查询（排序/筛选/搜索）结果。只对选中的列取行与序列化，宽表横向滚动时不必输出整行。
+        列名无效时抛出 ValueError，数据集不存在时返回 None"""
+        source = self._preview_source(dataset_name, with_extra=False)
+        if source is None:
+            return None
+        df, downcast_columns, _ = source
+        if columns:
+            missing = [c for c in columns if c not in df.columns]
+            if missing:
+                raise ValueError(f"列不存在: {', '.join(map(str, missing))}")
+            positions = df.columns.get_indexer(columns).tolist()
+            col_start = 0
+        else:
+            col_start = min(max(0, int(col_start)), df.shape[1])
+            col_end = df.shape[1] if col_count is None else min(df.shape[1], col_start + max(0, int(col_count)))
+            positions = list(range(col_start, col_end))
+        rows = self._preview_rows(dataset_name, df, query)
+        total = len(df) if rows is None else len(rows)
+        start = min(max(0, int(row_start)), total)
+        end = min(total, start + max(0, int(row_count)))
+        window = slice(start, end) if rows is None else rows[start:end]
+        sample = sas_reader.restore_compacted_dtypes(df.iloc[window, positions], downcast_columns)
+        meta = {
+            'columns': list(sample.columns),
+            'row_start': start,
+            'row_count': end - start,
+            'col_start': col_start,
+            'total_rows': total,
+            'total_columns': df.shape[1],
+            'dataset_name': dataset_name
+        }
+        if rows is not None:
+            meta['unfiltered_rows'] = len(df)
+        if shape == 'columns':
+            meta['format'] = 'columns'
+        data_json = self._frame_json(sample, shape)
+        return ('{"data":' + data_json + ',' + json.dumps(meta, ensure_ascii=False)[1:]).encode('utf-8')
+
+    def _preview_rows(self, dataset_name, df, query):
+        """预览查询（排序/筛选/搜索）结果的行位置，无查询条件时返回 None；
+        同一预览表上的查询结果由 PreviewQuery 缓存，预览表被替换后重新计算"""
+        if not query:
+            return None
+        parsed = PreviewQuery.parse(df.columns, query.get('sort'), query.get('filters'), query.get('search'))
+        if parsed is None:
+            return None
+        cache = self._preview_queries.get(dataset_name)
+        if cache is None or cache.frame is not df:
+            cache = self._preview_queries[dataset_name] = PreviewQuery(df)
+        return cache.rows(parsed)
+
+    def _preview_source(self, dataset_name, with_extra=True):
+        """预览使用的完整表：返回 (预览表, 类型压缩降为整数的列, 附加字段)，数据集不存在时返回 None；
+        with_extra=False 时不计算附加字段（SUPP 合并失败列需扫描整列，视窗请求不需要）"""
+        if dataset_name in self.datasets and self.datasets[dataset_name].get('status', 'ready') != 'ready':
+            # 两阶段加载中该数据集尚未就绪，只等待它（及 SDTM 视图所需的 SUPP）读取完成
+            self.wait_until_dataset_loaded(dataset_name)
+        # 取出预览表期间标记为使用中，避免其他请求触发的内存淘汰在加载与读取之间释放它
+        self._pin(dataset_name)
+        try:
+            return self._preview_source_loaded(dataset_name, with_extra)
+        finally:
+            self._unpin(dataset_name)
+
+    def _preview_source_loaded(self, dataset_name, with_extra):
+        self.ensure_loaded(dataset_name)
+        if dataset_name not in self.datasets or 'data' not in self.datasets[dataset_name]:
+            return None
+        entry = self.datasets[dataset_name]
+        if self.hide_supp_in_preview:
+            if dataset_name.upper().startswith('SUPP'):
+                return pd.DataFrame({'MESSAGE': ['SUPP 数据已合并至对应 RDOMAIN 展示']}), [], {}
+            df = self._get_data_view(dataset_name)
+        else:
+            df = entry['data']
+            if dataset_name.upper().startswith('SUPP') and entry.get('use_pivot_preview') and 'pivot_for_display' in entry:
+                df = entry['pivot_for_display']
+        extra = {}
+        if self.hide_supp_in_preview and with_extra:
+            # 视图在首次预览时才构建，随预览返回 SUPP 合并失败的列
+            origin_map = entry.get('extra_meta', {}).get('preview_origin_map', {})
+            extra['supp_failed_columns'] = self._supp_failed_columns(df, origin_map)
+        return df, entry.get('compaction', {}).get('downcast_columns', []), extra
+
+    @staticmethod
+    def _frame_json(sample, shape='records'):
+        """将 DataFrame 序列化为 JSON 文本：NaN/NaT/Inf 为 null，时间为 ISO 格式。
+        shape='records' 为行对象数组，shape='columns' 为按列顺序的列数组，shape='lines' 为每行一个行对象的 NDJSON"""
+        # 无穷值按缺失值输出；只替换确实含无穷值的数值列，其余列不复制
+        replaced = {}
+        for position, dtype in enumerate(sample.dtypes):
+            if pd.api.types.is_float_dtype(dtype):
+                values = sample.iloc[:, position].to_numpy(dtype='float64', na_value=np.nan)
+                if np.isinf(values).any():
+                    replaced[position] = np.where(np.isinf(values), np.nan, values)
+        if replaced:
+            sample = _shared_copy(sample)
+            for position, values in replaced.items():
+                sample.isetitem(position, values)
+        if shape == 'columns':
+            return '[' + ','.join(sample.iloc[:, position].to_json(orient='values', date_format='iso', force_ascii=False)
+                                  for position in range(sample.shape[1])) + ']'
+        if shape == 'lines':
+            return sample.to_json(orient='records', lines=True, date_format='iso', force_ascii=False) if len(sample) else ''
+        return sample.to_json(orient='records', date_format='iso', force_ascii=False)
+
+    @staticmethod
+    def _records_for_json(sample):
+        """将 DataFrame 转为 JSON 安全的行记录：NaN/NaT/Inf 转为 null，时间为 ISO 格式"""
+        return json.loads(SASDataProcessor._frame_json(sample))
+
+    def dataset_etag(self, dataset_name):
+        """单个数据集预览/结构/变量列表响应的 ETag（处理器实例、条目版本号与预览模式），数据集不存在时返回 None。
+        只读取条目元数据，不等待或触发加载：两阶段加载与惰性加载（含淘汰后重新加载）保留元数据阶段分配的版本号，
+        数据只在需要输出 200 响应时加载"""
+        entry = self.datasets.get(dataset_name)
+        if entry is None:
+            return None
+        return f"{self.instance_id}-{entry.get('version', 0)}-{int(self.hide_supp_in_preview)}"
+
+    def datasets_info_etag(self):
+        """数据集信息与加载状态的 ETag：由各条目的版本号、状态、数据/视图是否已加载及整体加载状态计算"""
+        state = (self.hide_supp_in_preview, self.lazy, self.load_state, sorted(self.load_errors.items()),
+                 [(name, e.get('version', 0), e.get('status', 'ready'), 'data' in e, 'data_view' in e)
+                  for name, e in list(self.datasets.items())])
+        return f"{self.instance_id}-{hashlib.sha1(repr(state).encode('utf-8')).hexdigest()[:16]}"
 
-            return {
-                'columns': list(df.columns),
-                'data': safe_records,
-                'total_rows': total_rows,
-                'dataset_name': dataset_name
-            }
-        return None
-    
     def get_all_datasets_info(self):
-        """获取所有数据集的基本信息。SUPP显示使用转置列做选择；在SDTM模式下不单独展示SUPP。"""
+        """获取所有数据集的基本信息；各数据集版本与状态未变化时直接返回上次计算的结果（调用方不应修改）"""
+        etag = self.datasets_info_etag()
+        cached = self._info_cache
+        if cached is not None and cached[0] == etag:
+            return cached[1]
+        info = self._build_datasets_info()
+        # 计算信息时可能顺带构建了预览视图，按计算后的状态记录
+        self._info_cache = (self.datasets_info_etag(), info)
+        return info
+
+    def _build_datasets_info(self):
+        """计算所有数据集的基本信息。SUPP显示使用转置列做选择；在SDTM模式下不单独展示SUPP。"""
         info = {}
-        for name, data in self.datasets.items():
+        supp_loaded = False
+        for name, data in list(self.datasets.items()):
             if self.hide_supp_in_preview and name.upper().startswith('SUPP'):
                 # 在SDTM模式下不单独展示SUPP数据集
                 continue
+            if self.hide_supp_in_preview and 'data_view' not in data and not supp_loaded:
+                # 推算视图列需要 SUPP 数据（SUPP 在 SDTM 模式下不被淘汰）；非惰性模式下 ensure_loaded 直接返回
+                self.ensure_loaded(*[n for n in self.datasets if n.upper().startswith('SUPP')])
+                supp_loaded = True
+            if 'data' not in data:
+                # 两阶段加载的第一阶段或惰性模式下未加载/已淘汰：仅有元数据
+                info[name] = self._metadata_only_info(name, data)
+                if self.hide_supp_in_preview:
+                    # 按元数据列名与 SUPP 的 RDOMAIN 索引推算视图列与来源映射，使主表未加载时仍可选择 SUPP 合入的 QNAM 列
+                    column_names, origin_map = self._preview_view_schema(name)
+                    info[name].update({
+                        'columns': len(column_names),
+                        'column_names': column_names,
+                        'selectable_columns': column_names,
+                        'supp_origin_columns': list(origin_map.keys()),
+                        # 合并失败列待视图构建后随预览/结构接口返回，此前为 None（未知）
+                        'supp_failed_columns': None,
+                        'supp_origin_detail': origin_map,
+                        'view_ready': False,
+                    })
+                continue
+            if self.hide_supp_in_preview and 'data_view' not in data:
+                # 视图尚未构建（含惰性模式下合并或刷新使视图失效）：按列规则推算列名与来源映射，不为此触发合并。
+                # 视图由原始表按行位置附加 SUPP 列构建（_attach_columns 回退到 merge 时重复键只取首行，
+                # _attach_coded 按首行对齐，均不增删行），行数即原始表行数；
+                # 合并失败列只有构建视图后才能判断，此前为 None（未知），首次预览/结构请求构建视图时随响应返回，
+                # 之后数据集信息（ETag 随视图构建变化）也给出失败列
+                column_names, origin_map = self._preview_view_schema(name)
+                info[name] = {
+                    'rows': len(data.get('raw_data', data['data'])),
+                    'columns': len(column_names),
+                    'column_names': column_names,
+                    'selectable_columns': column_names,
+                    'supp_origin_columns': list(origin_map.keys()),
+                    'supp_failed_columns': None,
+                    'supp_origin_detail': origin_map,
+                    'view_ready': False,
+                    'status': data.get('status', 'ready'),
+                    'label': getattr(data.get('meta'), 'file_label', None) or '',
+                    'column_labels': dict(getattr(data.get('meta'), 'column_names_to_labels', None) or {})
+                }
+                continue
             if self.hide_supp_in_preview:
-                preview_df = data.get('data_view', data['data'])
+                # 只读取已构建的视图，数据集信息不触发视图构建
+                preview_df = data['data_view']
             else:
                 preview_df = data['data']
                 if name.upper().startswith('SUPP') and data.get('use_pivot_preview') and 'pivot_for_display' in data:
@@ -1573,22 +3434,8 @@ class SASDataProcessor:
             # 计算从SUPP合入列的失败情况（在目标主表中：值全为空视为失败）
             extra_meta = data.get('extra_meta', {}) if isinstance(data, dict) else {}
             origin_map = (extra_meta.get('preview_origin_map', {}) if self.hide_supp_in_preview else extra_meta.get('supp_origin_map', {})) if isinstance(extra_meta, dict) else {}
-            supp_failed_columns = []
+            supp_failed_columns = self._supp_failed_columns(preview_df, origin_map)
             supp_origin_columns = list(origin_map.keys()) if isinstance(origin_map, dict) else []
-            if isinstance(origin_map, dict) and len(origin_map) > 0:
-                total_rows = len(preview_df)
-                for col, meta in origin_map.items():
-                    if col in preview_df.columns:
-                        non_null = int(preview_df[col].notna().sum())
-                        if total_rows > 0 and non_null == 0:
-                            supp_failed_columns.append({
-                                'column': col,
-                                'non_null': non_null,
-                                'total': total_rows,
-                                'supp_ds': meta.get('supp_ds'),
-                                'qnam': meta.get('qnam'),
-                                'idvar': meta.get('idvar')
-                            })
 
             info[name] = {
                 'rows': len(preview_df),
@@ -1598,314 +3445,690 @@ class SASDataProcessor:
                 'supp_origin_columns': supp_origin_columns,
                 'supp_failed_columns': supp_failed_columns,
                 # 暴露列→来源明细，供前端在选择源变量时映射回 SUPP.QNAM
-                'supp_origin_detail': origin_map
+                'supp_origin_detail': origin_map,
+                'view_ready': True,
+                'status': data.get('status', 'ready'),
+                'label': getattr(data.get('meta'), 'file_label', None) or '',
+                'column_labels': dict(getattr(data.get('meta'), 'column_names_to_labels', None) or {})
             }
         return info
+
+    @staticmethod
+    def _metadata_only_info(name, entry):
+        """根据元数据生成数据集基本信息（数据尚未加载时使用）"""
+        meta = entry.get('meta')
+        column_names = list(getattr(meta, 'column_names', None) or [])
+        selectable_columns = column_names
+        if name.upper().startswith('SUPP'):
+            exclude_cols = {
+                'STUDYID', 'USUBJID', 'RDOMAIN', 'IDVAR', 'IDVARVAL',
+                'QNAM', 'QVAL', 'QLABEL', 'QORIG'
+            }
+            selectable_columns = [c for c in column_names if str(c).upper() not in exclude_cols]
+        return {
+            'rows': getattr(meta, 'number_rows', None) or 0,
+            'columns': len(column_names),
+            'column_names': column_names,
+            'selectable_columns': selectable_columns,
+            'supp_origin_columns': [],
+            'supp_failed_columns': [],
+            'supp_origin_detail': {},
+            'status': entry.get('status', 'pending'),
+            'label': getattr(meta, 'file_label', None) or '',
+            'column_labels': dict(getattr(meta, 'column_names_to_labels', None) or {})
+        }
     
-    def merge_variables(self, merge_config):
+    @staticmethod
+    def _parse_merge_config(config):
+        """解析单条合并配置（兼容旧版），返回 (目标数据集, 目标变量, 来源列表[{dataset, column}])"""
+        if isinstance(config.get('target'), dict):
+            target_dataset = config['target'].get('dataset')
+            target_var = config['target'].get('column')
+            sources_desc = config.get('sources', [])  # list of {dataset,column}
+        else:
+            target_dataset = config.get('dataset')
+            target_var = config.get('target')
+            sources_desc = [{'dataset': target_dataset, 'column': col} for col in config.get('sources', [])]
+        return target_dataset, target_var, sources_desc
+
+    def _merge_config_datasets(self, merge_config):
+        """合并配置涉及的数据集名（目标与全部来源）"""
+        parsed = [self._parse_merge_config(config) for config in merge_config]
+        return {n for target, _, sources in parsed for n in [target] + [s.get('dataset') for s in sources] if n}
+
+    def _compile_merge_plan(self, merge_config):
+        """把合并配置编译为执行计划：阶段列表，每个阶段内按目标数据集分组。
+        同一阶段的分组读写的数据集互不冲突，可各自一次性执行（也可并行）；阶段按顺序执行，
+        且后一阶段的配置在原顺序中都位于前一阶段之后，因此结果与逐条顺序执行一致。"""
+        parsed = [self._parse_merge_config(config) for config in merge_config]
+        # 惰性模式：先加载所有配置涉及的数据集（SUPP 来源需要其完整结构）
+        names = self._merge_config_datasets(merge_config)
+        if names:
+            self.ensure_loaded(*names)
+
+        stages = []
+        for index, (target_dataset, target_var, sources_desc) in enumerate(parsed):
+            if not target_dataset or not target_var or target_dataset not in self.datasets \
+                    or 'data' not in self.datasets[target_dataset]:
+                # 忽略无效配置
+                continue
+            source_names = {s.get('dataset') for s in sources_desc if s.get('dataset')}
+            reads = {target_dataset} | source_names
+            writes = {target_dataset} | {n for n in source_names if n.upper().startswith('SUPP')}
+            if target_dataset.upper().startswith('SUPP'):
+                # SUPP 目标会就地规范化来源主表 data 的键列
+                writes |= source_names
+            item = (index, target_dataset, target_var, sources_desc)
+
+            stage = stages[-1] if stages else None
+            if stage is not None:
+                others = [g for g in stage if g['target'] != target_dataset]
+                conflict = any(reads & g['writes'] or writes & (g['reads'] | g['writes']) for g in others)
+                if not conflict:
+                    group = next((g for g in stage if g['target'] == target_dataset), None)
+                    if group is None:
+                        group = {'target': target_dataset, 'items': [], 'reads': set(), 'writes': set()}
+                        stage.append(group)
+                    group['items'].append(item)
+                    group['reads'] |= reads
+                    group['writes'] |= writes
+                    continue
+            stages.append([{'target': target_dataset, 'items': [item], 'reads': set(reads), 'writes': set(writes)}])
+        return stages
+
+    def _run_merge_group(self, group):
+        """在独立工作区中依次执行一个分组的配置。
+        返回 (工作区, [(配置序号, 执行后快照)], 失败信息 (配置序号, 异常) 或 None)"""
+        overlay = MergeOverlay(self.datasets)
+        snapshots = []
+        for index, target_dataset, target_var, sources_desc in group['items']:
+            try:
+                self._apply_merge_config(overlay, target_dataset, target_var, sources_desc)
+            except Exception as e:
+                # 失败前已完成的写入与逐条执行时一样保留
+                snapshots.append((index, overlay.snapshot()))
+                return overlay, snapshots, (index, e)
+            snapshots.append((index, overlay.snapshot()))
+        return overlay, snapshots, None
+
+    def _commit_merge_snapshot(self, snapshot):
+        """把分组工作区的快照提交到 datasets，返回需失效的主表视图"""
+        frames, data_frames, transposes = snapshot
+        touched_views = set()
+        for name, df in frames.items():
+            touched_views |= self._view_targets_for(name)
+            self._commit_dataset(name, df)
+        for name, df in data_frames.items():
+            self.datasets[name]['data'] = df
+            self.datasets[name]['version'] = self._next_version()
+        for name, df in transposes.items():
+            # 更新SUPP的转置供选择器使用
+            self._transpose_supp_for_display(name, df)
+        return touched_views
+
+    def merge_variables(self, merge_config, workers=None):
         """根据配置合并变量。
         支持两种配置格式：
         1) 旧格式：{'dataset': 'CM', 'target': 'NEW', 'sources': ['A','B']}
         2) 新格式：{'target': {'dataset': 'CM', 'column': 'NEW'}, 'sources': [{'dataset':'CM','column':'A'}, ...]}
         当来源变量来自其他数据集时，将按公共键对齐（默认使用 STUDYID、USUBJID 及双方共同的 *SEQ 键）。
         仅在目标数据集内删除被合并的源变量。
+        配置先编译为按目标分组的执行计划，同一目标的多条配置一次读出、一次提交，结果与逐条执行一致；
+        workers（默认 SAS_MERGE_WORKERS）大于 1 时互不依赖的分组并行执行。
         """
+        self.wait_until_loaded()
+        total_start = time.perf_counter()
+        invalidated_views = set()
+        stages = []
+        join_cache_hits = 0
+        key_cache_before = self.key_cache_stats()
+        self.merge_stats = {}
+        workers = self.merge_workers if workers is None else max(1, int(workers))
+        # 合并期间涉及的数据集标记为使用中，不被其他请求触发的内存淘汰释放
+        pinned = self._merge_config_datasets(merge_config)
+        self._pin(*pinned)
         try:
-            for config in merge_config:
-                # 解析配置（兼容旧版）
-                if isinstance(config.get('target'), dict):
-                    target_dataset = config['target'].get('dataset')
-                    target_var = config['target'].get('column')
-                    sources_desc = config.get('sources', [])  # list of {dataset,column}
+            stages = self._compile_merge_plan(merge_config)
+            for stage in stages:
+                if workers > 1 and len(stage) > 1:
+                    with ThreadPoolExecutor(max_workers=min(workers, len(stage))) as executor:
+                        results = list(executor.map(self._run_merge_group, stage))
                 else:
-                    target_dataset = config.get('dataset')
-                    target_var = config.get('target')
-                    sources_desc = [{'dataset': target_dataset, 'column': col} for col in config.get('sources', [])]
+                    results = []
+                    for group in stage:
+                        results.append(self._run_merge_group(group))
+                        if results[-1][2] is not None:
+                            break
+                failures = [r[2] for r in results if r[2] is not None]
+                # 某条配置失败时，只提交原顺序中位于它之前的配置结果（以及它失败前已完成的写入）
+                fail_index = min(index for index, _ in failures) if failures else None
+                if fail_index is not None and len(results) < len(stage):
+                    # 顺序执行在失败处提前结束：其余分组只执行失败配置之前的部分
+                    for group in stage[len(results):]:
+                        results.append(self._run_merge_group(
+                            {**group, 'items': [i for i in group['items'] if i[0] < fail_index]}))
+                for overlay, snapshots, _ in results:
+                    join_cache_hits += overlay.join_cache_hits
+                    done = [snap for index, snap in snapshots if fail_index is None or index <= fail_index]
+                    if done:
+                        touched_views = self._commit_merge_snapshot(done[-1])
+                        # 受影响主表的预览视图失效，下次访问时按最初合并规则与键重新映射 SUPP
+                        self._invalidate_views(touched_views)
+                        invalidated_views |= touched_views
+                if failures:
+                    raise dict(failures)[fail_index]
 
-                if not target_dataset or not target_var or target_dataset not in self.datasets:
-                    # 忽略无效配置
-                    continue
+            return True, "变量合并成功"
+        except Exception as e:
+            # 将异常同时打印到控制台，便于调试
+            print('merge_variables error:', e)
+            return False, f"变量合并失败: {str(e)}"
+        finally:
+            self._unpin(*pinned)
+            self.merge_stats = {
+                'total_seconds': round(time.perf_counter() - total_start, 4),
+                'invalidated_views': sorted(invalidated_views),
+                'view_count': sum(1 for n in self.datasets if not n.upper().startswith('SUPP')),
+                'plan': {
+                    'stages': len(stages),
+                    'groups': sum(len(stage) for stage in stages),
+                    'workers': workers,
+                    'join_cache_hits': join_cache_hits
+                },
+                'key_cache': self._key_cache_delta(key_cache_before)
+            }
+
+    def merge_dry_run(self, merge_config, sample_subjects=20, preview_rows=50, translation_direction=None,
+                      estimate_rows=100000):
+        """合并试运行：按受试者（USUBJID）抽样各相关数据集，在独立的处理器上执行同一合并计划，
+        返回各目标列的合并结果预览，并按行数与连接规模估算全量合并的耗时与新增内存。
+        估算时另取连接规模约 estimate_rows 的较大样本再运行一次，两次运行拟合固定开销与每行耗时。
+        不修改本处理器的 datasets（raw_data/data/视图均不变）。
+        返回 (是否成功, 消息, {'preview', 'estimate', 'sample'})"""
+        self.wait_until_loaded()
+        try:
+            stages = self._compile_merge_plan(merge_config)
+            groups = [group for stage in stages for group in stage]
+            items = sorted(item for group in groups for item in group['items'])
+            names = sorted({n for group in groups for n in group['reads'] if n in self.datasets and 'data' in self.datasets[n]})
+            direction = translation_direction or self.translation_direction
+            full_rows = {name: len(self.datasets[name].get('raw_data', self.datasets[name]['data'])) for name in names}
+
+            # 受试者按固定种子打乱，取前 k 名作为样本（较大样本包含较小样本）
+            pool = self._subject_pool(names, groups)
+            order = np.random.default_rng(0).permutation(len(pool)) if pool is not None else None
+
+            def pick(count):
+                if pool is None or count >= len(pool):
+                    return None
+                return set(pool[order[:max(1, int(count))]].tolist())
+
+            subjects = pick(sample_subjects)
+            sandbox, sample_rows, before = self._dry_run_sandbox(names, subjects, merge_config, direction)
+            success, message = sandbox.last_merge_result
+            if not success:
+                return False, message, None
+            runs = [(sandbox.merge_stats.get('total_seconds', 0.0), sample_rows)]
+            if subjects is not None:
+                work_full = self._merge_work(items, full_rows)
+                larger = int(np.ceil(len(pool) * min(1.0, estimate_rows / max(work_full, 1))))
+                if larger > len(subjects):
+                    calibration, calibration_rows, _ = self._dry_run_sandbox(names, pick(larger), merge_config, direction)
+                    if calibration.last_merge_result[0]:
+                        runs.append((calibration.merge_stats.get('total_seconds', 0.0), calibration_rows))
+
+            preview = [self._dry_run_preview(sandbox, before, item, preview_rows) for item in items]
+            estimate = self._estimate_merge_cost(items, full_rows, sample_rows, preview, runs)
+            for result in preview:
+                result.pop('_column_bytes', None)
+            return True, "变量合并试运行完成（未修改数据）", {
+                'preview': preview,
+                'estimate': estimate,
+                'sample': {
+                    'subjects': None if subjects is None else len(subjects),
+                    'rows': sample_rows,
+                    'seconds': runs[0][0]
+                }
+            }
+        except Exception as e:
+            print('merge_dry_run error:', e)
+            return False, f"变量合并试运行失败: {str(e)}", None
+
+    def _dry_run_sandbox(self, names, subjects, merge_config, translation_direction):
+        """在只含抽样行的独立处理器上执行合并，返回 (处理器, 各数据集抽样行数, 合并前的 raw_data)；
+        合并结果 (是否成功, 消息) 记录在处理器的 last_merge_result 中"""
+        sandbox = SASDataProcessor()
+        sandbox.translation_direction = translation_direction
+        sandbox.hide_supp_in_preview = self.hide_supp_in_preview
+        sandbox.key_encoding = self.key_encoding
+        for name in names:
+            entry = self.datasets[name]
+            sandbox.datasets[name] = {
+                'data': self._subject_rows(name, entry['data'], subjects),
+                'raw_data': self._subject_rows(name, entry.get('raw_data', entry['data']), subjects),
+                'meta': entry.get('meta'),
+            }
+        before = {name: sandbox.datasets[name]['raw_data'] for name in names}
+        sample_rows = {name: len(df) for name, df in before.items()}
+        sandbox.last_merge_result = sandbox.merge_variables(merge_config, workers=1)
+        return sandbox, sample_rows, before
+
+    def _subject_pool(self, names, groups):
+        """抽样用的受试者：首个含 USUBJID 的目标（其次为其他相关数据集）中规范化后的 USUBJID，排序后返回；
+        相关数据集都没有 USUBJID 时返回 None（使用全部行）"""
+        for name in [g['target'] for g in groups] + names:
+            df = self.datasets[name].get('raw_data', self.datasets[name]['data'])
+            if 'USUBJID' in df.columns:
+                values = self._key_index(name).normalized(df, 'USUBJID')
+                return np.sort(pd.unique(values.to_numpy(dtype=object)).astype(str))
+        return None
+
+    def _subject_rows(self, name, df, subjects):
+        """df 中属于抽样受试者的行（无 USUBJID 的数据集如试验设计域保留全部行）"""
+        if subjects is None or 'USUBJID' not in df.columns:
+            return _shared_copy(df)
+        keep = self._key_index(name).normalized(df, 'USUBJID').isin(subjects).to_numpy()
+        return df[keep].reset_index(drop=True)
+
+    @staticmethod
+    def _dry_run_preview(sandbox, before, item, preview_rows):
+        """单条合并配置在抽样数据上的结果：目标列（SUPP 目标为对应 QNAM 的 QVAL）连同键列的前 preview_rows 行"""
+        index, target_dataset, target_var, sources_desc = item
+        df = sandbox.datasets[target_dataset]['raw_data']
+        if target_dataset.upper().startswith('SUPP'):
+            rows = df[df['QNAM'].astype(str) == str(target_var)] if 'QNAM' in df.columns else df.iloc[:0]
+            value_col = 'QVAL'
+            existed = 'QNAM' in before[target_dataset].columns and \
+                bool((before[target_dataset]['QNAM'].astype(str) == str(target_var)).any())
+        else:
+            rows = df
+            value_col = target_var
+            existed = target_var in before[target_dataset].columns
+        keys = [c for c in df.columns if c in ('STUDYID', 'USUBJID', 'IDVAR', 'IDVARVAL') or str(c).upper().endswith('SEQ')]
+        columns = keys + ([value_col] if value_col in rows.columns else [])
+        values = rows[value_col] if value_col in rows.columns else pd.Series([], dtype=object)
+        return {
+            'config_index': index,
+            'target': {'dataset': target_dataset, 'column': target_var},
+            'sources': sources_desc,
+            'new_column': not existed,
+            'columns': columns,
+            'data': SASDataProcessor._records_for_json(rows[columns].iloc[:preview_rows]),
+            'sample_rows': len(rows),
+            'non_empty_rows': int((values.notna() & (values.astype(str) != '')).sum()),
+            '_column_bytes': int(values.memory_usage(index=False, deep=True)),
+        }
+
+    @staticmethod
+    def _merge_work(items, rows):
+        """合并的连接规模：各配置目标行数与跨数据集来源行数之和"""
+        total = 0
+        for _, target_dataset, _, sources_desc in items:
+            total += rows.get(target_dataset, 0)
+            for source in {s.get('dataset') for s in sources_desc if s.get('dataset')} - {target_dataset}:
+                total += rows.get(source, 0)
+        return total
+
+    @staticmethod
+    def _estimate_merge_cost(items, full_rows, sample_rows, preview, runs):
+        """按抽样结果估算全量合并。runs 为各次抽样运行的 (耗时, 各数据集行数)：
+        有两次运行时按 固定开销 + 每单位连接规模耗时 × 规模 拟合，只有一次时按规模等比放大。
+        新增内存为目标列的放大字节数，加上每个跨数据集连接的行位置数组（int64，每目标行 8 字节）"""
+        work_full = SASDataProcessor._merge_work(items, full_rows)
+        points = sorted((SASDataProcessor._merge_work(items, rows), seconds) for seconds, rows in runs)
+        (work_small, small_seconds), (work_large, large_seconds) = points[0], points[-1]
+        per_unit = large_seconds / max(work_large, 1)
+        fixed = 0.0
+        if work_large > work_small and large_seconds > small_seconds:
+            per_unit = (large_seconds - small_seconds) / (work_large - work_small)
+            fixed = max(0.0, large_seconds - per_unit * work_large)
+
+        joins = []
+        memory = 0
+        for (index, target_dataset, target_var, sources_desc), result in zip(items, preview):
+            memory += result['_column_bytes'] * full_rows.get(target_dataset, 0) / max(sample_rows.get(target_dataset, 0), 1)
+            for source in {s.get('dataset') for s in sources_desc if s.get('dataset')} - {target_dataset}:
+                memory += 8 * full_rows.get(target_dataset, 0)
+                joins.append({
+                    'config_index': index,
+                    'target': target_dataset,
+                    'source': source,
+                    'target_rows': full_rows.get(target_dataset, 0),
+                    'source_rows': full_rows.get(source, 0),
+                    # 每个目标行平均对应的来源行数（SUPP 来源为各 QNAM 合计）
+                    'source_rows_per_target_row': round(full_rows.get(source, 0) / max(full_rows.get(target_dataset, 0), 1), 3),
+                })
+        return {
+            'seconds': round(fixed + per_unit * work_full, 3),
+            'memory_bytes': int(memory),
+            'work_rows': work_full,
+            'calibration_runs': len(runs),
+            'rows': {name: {'full': full_rows[name], 'sample': sample_rows[name]} for name in full_rows},
+            'joins': joins,
+        }
 
-                # 对主表目标：一律在 raw_data 上操作
-                target_df = self.datasets[target_dataset].get('raw_data', self.datasets[target_dataset]['data']).copy()
-                # 规范化主表基本键
-                for kc in ['STUDYID', 'USUBJID']:
-                    if kc in target_df.columns:
-                        target_df[kc] = self._normalize_key_series(target_df[kc])
-
-                # 情况A：目标在SUPP中（target_var 为 QNAM）。合并到 SUPP 的 QVAL，并删除源 SUPP QNAM 行
-                if target_dataset.upper().startswith('SUPP'):
-                    supp_entry = self.datasets[target_dataset]
-                    # 始终以 raw_data 为基准进行变更，这样预览重建才能完全生效
-                    supp_df = supp_entry.get('raw_data', supp_entry['data']).copy()
-
-                    # 目标行
-                    if 'QNAM' not in supp_df.columns or 'QVAL' not in supp_df.columns:
+    def _key_cache_delta(self, before):
+        """自 before（key_cache_stats 的结果）以来的连接键缓存命中/计算次数"""
+        after = self.key_cache_stats()
+        return {key: after[key] - before[key] for key in ('normalize_hits', 'normalize_misses', 'hits')}
+
+    def _apply_merge_config(self, overlay, target_dataset, target_var, sources_desc):
+        """在工作区上执行单条合并配置；读写都经由 overlay，不直接修改 datasets"""
+        # 情况A：目标在SUPP中（target_var 为 QNAM）。合并到 SUPP 的 QVAL，并删除源 SUPP QNAM 行
+        if target_dataset.upper().startswith('SUPP'):
+            # 始终以 raw_data 为基准进行变更，这样预览重建才能完全生效
+            supp_df = _shared_copy(overlay.raw(target_dataset))
+
+            # 目标行
+            if 'QNAM' not in supp_df.columns or 'QVAL' not in supp_df.columns:
+                return
+            target_mask = supp_df['QNAM'] == target_var
+            target_rows = supp_df[target_mask].copy()
+            if target_rows.empty:
+                return
+
+            # 规范化键（整列规范化结果缓存在 SUPP 的键索引中，再取目标行）
+            supp_keys = self._key_index(target_dataset)
+            for kc in ['STUDYID', 'USUBJID', 'IDVARVAL']:
+                if kc in target_rows.columns:
+                    target_rows[kc] = supp_keys.normalized(supp_df, kc)[target_mask]
+
+            # 为每个来源构建按键对齐的 Series；保留原有 QVAL 作为首列
+            aligned_series = [target_rows['QVAL']]
+            supp_to_drop_map: dict[str, set] = {}
+            for src in sources_desc:
+                src_ds = src.get('dataset')
+                src_col = src.get('column')
+                if not src_ds or not src_col or not overlay.has(src_ds):
+                    aligned_series.append(pd.Series([pd.NA] * len(target_rows), index=target_rows.index))
+                    continue
+                if src_ds.upper().startswith('SUPP'):
+                    s_df = overlay.raw(src_ds)
+                    if 'QNAM' not in s_df.columns or 'QVAL' not in s_df.columns:
+                        aligned_series.append(pd.Series([pd.NA] * len(target_rows), index=target_rows.index))
                         continue
-                    target_rows = supp_df[supp_df['QNAM'] == target_var].copy()
-                    if target_rows.empty:
+                    rows_mask = s_df['QNAM'] == src_col
+                    rows = s_df[rows_mask].copy()
+                    if rows.empty:
+                        aligned_series.append(pd.Series([pd.NA] * len(target_rows), index=target_rows.index))
                         continue
-
-                    # 键集合
-                    key_cols = [c for c in ['STUDYID', 'USUBJID', 'RDOMAIN', 'IDVAR', 'IDVARVAL'] if c in supp_df.columns]
                     # 规范化键
+                    src_keys = self._key_index(src_ds)
                     for kc in ['STUDYID', 'USUBJID', 'IDVARVAL']:
-                        if kc in target_rows.columns:
-                            target_rows[kc] = self._normalize_key_series(target_rows[kc])
-
-                    # 为每个来源构建按键对齐的 Series；保留原有 QVAL 作为首列
-                    aligned_series = [target_rows['QVAL']]
-                    supp_to_drop_map: dict[str, set] = {}
-                    for src in sources_desc:
-                        src_ds = src.get('dataset')
-                        src_col = src.get('column')
-                        if not src_ds or not src_col or src_ds not in self.datasets:
-                            aligned_series.append(pd.Series([pd.NA] * len(target_rows), index=target_rows.index))
-                            continue
-                        if src_ds.upper().startswith('SUPP'):
-                            s_entry = self.datasets[src_ds]
-                            s_df = s_entry.get('raw_data', s_entry['data']).copy()
-                            if 'QNAM' not in s_df.columns or 'QVAL' not in s_df.columns:
-                                aligned_series.append(pd.Series([pd.NA] * len(target_rows), index=target_rows.index))
-                                continue
-                            rows = s_df[s_df['QNAM'] == src_col].copy()
-                            if rows.empty:
-                                aligned_series.append(pd.Series([pd.NA] * len(target_rows), index=target_rows.index))
-                                continue
-                            # 规范化键
-                            for kc in ['STUDYID', 'USUBJID', 'IDVARVAL']:
-                                if kc in rows.columns:
-                                    rows[kc] = self._normalize_key_series(rows[kc])
-                            # 选择连接键
-                            join_keys = [k for k in ['STUDYID', 'USUBJID'] if k in target_rows.columns and k in rows.columns]
-                            if 'IDVAR' in target_rows.columns and 'IDVAR' in rows.columns and 'IDVARVAL' in target_rows.columns and 'IDVARVAL' in rows.columns:
-                                join_keys += ['IDVAR', 'IDVARVAL']
-                            elif 'IDVARVAL' in target_rows.columns and 'IDVARVAL' in rows.columns:
-                                join_keys += ['IDVARVAL']
-                            # 合并
-                            slim = rows[join_keys + ['QVAL']].drop_duplicates(subset=join_keys)
-                            merged = target_rows[join_keys].merge(slim, on=join_keys, how='left')
-                            ser = merged['QVAL'] if 'QVAL' in merged.columns else pd.Series([pd.NA] * len(target_rows))
-                            ser.index = target_rows.index
-                            aligned_series.append(ser)
-                            # 标记删除来源 QNAM
-                            supp_to_drop_map.setdefault(src_ds, set()).add(src_col)
-                        else:
-                            # 来源为主表：按 STUDYID/USUBJID 及 IDVAR 指定的键对齐
-                            s_df = self.datasets[src_ds]['data']
-                            # 连接键
-                            join_keys = [k for k in ['STUDYID', 'USUBJID'] if k in target_rows.columns and k in s_df.columns]
-                            if 'IDVAR' in target_rows.columns:
-                                idvar_values = target_rows['IDVAR'].dropna().unique().tolist()
-                                chosen = None
-                                for cand in idvar_values:
-                                    if cand in s_df.columns and 'IDVARVAL' in target_rows.columns:
-                                        chosen = cand
-                                        break
-                                if chosen:
-                                    # 用 chosen 与 IDVARVAL 对齐
-                                    tmp_left = target_rows[join_keys + ['IDVARVAL']].copy()
-                                    tmp_left = tmp_left.rename(columns={'IDVARVAL': chosen})
-                                    for kc in [chosen]:
-                                        if kc in s_df.columns:
-                                            s_df[kc] = self._normalize_key_series(s_df[kc])
-                                        if kc in tmp_left.columns:
-                                            tmp_left[kc] = self._normalize_key_series(tmp_left[kc])
-                                    merged = tmp_left.merge(s_df[join_keys + [chosen, src_col]] if src_col in s_df.columns else tmp_left.assign(**{src_col: pd.NA}),
-                                                           on=join_keys + [chosen], how='left')
-                                    ser = merged[src_col] if src_col in merged.columns else pd.Series([pd.NA] * len(target_rows))
-                                    ser.index = target_rows.index
-                                    aligned_series.append(ser)
-                                    continue
-                            # 退化为只按 STUDYID/USUBJID
-                            merged = target_rows[join_keys].merge(s_df[join_keys + [src_col]] if src_col in s_df.columns else target_rows.assign(**{src_col: pd.NA}),
-                                                               on=join_keys, how='left')
-                            ser = merged[src_col] if src_col in merged.columns else pd.Series([pd.NA] * len(target_rows))
+                        if kc in rows.columns:
+                            rows[kc] = src_keys.normalized(s_df, kc)[rows_mask]
+                    # 选择连接键
+                    join_keys = [k for k in ['STUDYID', 'USUBJID'] if k in target_rows.columns and k in rows.columns]
+                    if 'IDVAR' in target_rows.columns and 'IDVAR' in rows.columns and 'IDVARVAL' in target_rows.columns and 'IDVARVAL' in rows.columns:
+                        join_keys += ['IDVAR', 'IDVARVAL']
+                    elif 'IDVARVAL' in target_rows.columns and 'IDVARVAL' in rows.columns:
+                        join_keys += ['IDVARVAL']
+                    # 合并
+                    slim = rows[join_keys + ['QVAL']].drop_duplicates(subset=join_keys)
+                    merged = target_rows[join_keys].merge(slim, on=join_keys, how='left')
+                    ser = merged['QVAL'] if 'QVAL' in merged.columns else pd.Series([pd.NA] * len(target_rows))
+                    ser.index = target_rows.index
+                    aligned_series.append(ser)
+                    # 标记删除来源 QNAM
+                    supp_to_drop_map.setdefault(src_ds, set()).add(src_col)
+                else:
+                    # 来源为主表：按 STUDYID/USUBJID 及 IDVAR 指定的键对齐
+                    s_df = overlay.data(src_ds)
+                    # 连接键
+                    join_keys = [k for k in ['STUDYID', 'USUBJID'] if k in target_rows.columns and k in s_df.columns]
+                    if 'IDVAR' in target_rows.columns:
+                        idvar_values = target_rows['IDVAR'].dropna().unique().tolist()
+                        chosen = None
+                        for cand in idvar_values:
+                            if cand in s_df.columns and 'IDVARVAL' in target_rows.columns:
+                                chosen = cand
+                                break
+                        if chosen:
+                            # 用 chosen 与 IDVARVAL 对齐
+                            tmp_left = target_rows[join_keys + ['IDVARVAL']].copy()
+                            tmp_left = tmp_left.rename(columns={'IDVARVAL': chosen})
+                            for kc in [chosen]:
+                                if kc in s_df.columns:
+                                    # 来源主表 data 的键列同步规范化（提交时写回 data）
+                                    s_df = _shared_copy(s_df)
+                                    s_df[kc] = self._key_index(src_ds).normalized(s_df, kc)
+                                    overlay.set_data(src_ds, s_df)
+                                if kc in tmp_left.columns:
+                                    tmp_left[kc] = self._normalize_key_series(tmp_left[kc])
+                            ser = self._lookup_aligned(src_ds, s_df, join_keys + [chosen], tmp_left, src_col)
+                            if ser is None:
+                                merged = tmp_left.merge(s_df[join_keys + [chosen, src_col]] if src_col in s_df.columns else tmp_left.assign(**{src_col: pd.NA}),
+                                                       on=join_keys + [chosen], how='left')
+                                ser = merged[src_col] if src_col in merged.columns else pd.Series([pd.NA] * len(target_rows))
                             ser.index = target_rows.index
                             aligned_series.append(ser)
+                            continue
+                    # 退化为只按 STUDYID/USUBJID
+                    ser = self._lookup_aligned(src_ds, s_df, join_keys, target_rows, src_col)
+                    if ser is None:
+                        merged = target_rows[join_keys].merge(s_df[join_keys + [src_col]] if src_col in s_df.columns else target_rows.assign(**{src_col: pd.NA}),
+                                                           on=join_keys, how='left')
+                        ser = merged[src_col] if src_col in merged.columns else pd.Series([pd.NA] * len(target_rows))
+                    ser.index = target_rows.index
+                    aligned_series.append(ser)
+
+            # 拼接并写回 QVAL
+            concat_df = pd.DataFrame({f'_s{i}': s for i, s in enumerate(aligned_series)})
+            # 类型压缩后的整数列按原始浮点值拼接（如 1.0），与未压缩时结果一致
+            concat_df = concat_df.astype({c: 'float64' for c in concat_df.columns if concat_df[c].dtype.kind in 'iu'})
+            # 根据翻译方向决定是否使用空格间隔
+            separator = ' ' if self.translation_direction == 'en_to_zh' else ''
+            target_rows['QVAL'] = self._concat_non_empty(concat_df, separator).values
+            # 写回原表（整列替换，其余列与旧版本共享）
+            qval = supp_df['QVAL'].copy()
+            qval.loc[target_rows.index] = target_rows['QVAL']
+            supp_df['QVAL'] = qval
+            overlay.commit(target_dataset, supp_df)
 
-                    # 拼接并写回 QVAL
-                    concat_df = pd.DataFrame({f'_s{i}': s for i, s in enumerate(aligned_series)})
-                    def _join_parts(row):
-                        parts = []
-                        for v in row.values.tolist():
-                            if pd.notna(v):
-                                sv = str(v)
-                                if sv.lower() != 'nan' and sv != '':
-                                    parts.append(sv)
-                        # 根据翻译方向决定是否使用空格间隔
-                        separator = ' ' if self.translation_direction == 'en_to_zh' else ''
-                        return separator.join(parts)
-                    target_rows['QVAL'] = concat_df.apply(_join_parts, axis=1).values
-                    # 写回原表
-                    supp_df.loc[target_rows.index, 'QVAL'] = target_rows['QVAL']
-                    # 回写 raw 与 data
-                    self.datasets[target_dataset]['raw_data'] = supp_df.copy()
-                    self.datasets[target_dataset]['data'] = supp_df.copy()
-
-                    # 删除源 SUPP QNAM
-                    for s_ds, qnams in supp_to_drop_map.items():
-                        e = self.datasets.get(s_ds)
-                        if not e:
+            # 删除源 SUPP QNAM
+            self._drop_merged_qnams(overlay, supp_to_drop_map)
+            return
+
+        # 对主表目标：一律在 raw_data 上操作
+        target_df = _shared_copy(overlay.raw(target_dataset))
+        target_keys = self._key_index(target_dataset)
+        # 规范化主表基本键
+        for kc in ['STUDYID', 'USUBJID']:
+            if kc in target_df.columns:
+                target_df[kc] = target_keys.normalized(target_df, kc)
+
+        # 预备：目标列若不存在则创建空字符串列
+        if target_var not in target_df.columns:
+            target_df[target_var] = ''
+
+        # 组装每个来源列，按顺序对齐到目标数据集；保留原有目标列值作为首列
+        aligned_source_series: list[pd.Series] = [target_df[target_var]]
+
+        # 记录需要从SUPP原始结构中删除的QNAM
+        supp_to_drop_map: dict[str, set] = {}
+
+        for src in sources_desc:
+            src_dataset = src.get('dataset')
+            src_col = src.get('column')
+            if not src_dataset or not src_col or not overlay.has(src_dataset):
+                # 无效来源，追加空系列
+                aligned_source_series.append(pd.Series([pd.NA] * len(target_df), index=target_df.index))
+                continue
+
+            source_df = _shared_copy(overlay.raw(src_dataset))
+
+            if src_dataset == target_dataset:
+                # 同表直接取列
+                series = source_df[src_col] if src_col in source_df.columns else pd.Series([pd.NA]*len(target_df), index=target_df.index)
+                aligned_source_series.append(series)
+                continue
+
+            # 跨表：基于公共键对齐
+            # 选择键：STUDYID、USUBJID，以及共同存在、名字以SEQ结尾的列（如 CMSEQ）
+            common_keys = [k for k in ['STUDYID', 'USUBJID'] if k in target_df.columns and k in source_df.columns]
+            seq_keys = [c for c in target_df.columns.intersection(source_df.columns) if str(c).upper().endswith('SEQ')]
+            join_keys = common_keys + (seq_keys[:1] if seq_keys else [])
+
+            # 对 SUPP* 特例：来源的“列名”实际上是 QNAM；需从原始SUPP结构中抽取 QVAL 并按键对齐
+            if src_dataset.upper().startswith('SUPP'):
+                qnam = src_col
+                if 'QNAM' in source_df.columns and 'QVAL' in source_df.columns:
+                    qnam_mask = source_df['QNAM'] == qnam
+                    rows = source_df[qnam_mask].copy()
+                    row_positions = np.flatnonzero(qnam_mask.to_numpy())
+                    # 若 SUPP 中有 RDOMAIN，则限定为与目标主表一致
+                    if 'RDOMAIN' in rows.columns:
+                        domain_mask = rows['RDOMAIN'].astype(str).str.upper() == str(target_dataset).upper()
+                        rows = rows[domain_mask].copy()
+                        row_positions = row_positions[domain_mask.to_numpy()]
+                    if not rows.empty:
+                        # 标记删除该QNAM
+                        supp_to_drop_map.setdefault(src_dataset, set()).add(qnam)
+                        # 若有IDVAR，则优先用 IDVAR 与 IDVARVAL 指向的目标键列（如 CMSEQ）
+                        chosen_idvar = None
+                        if 'IDVAR' in rows.columns and rows['IDVAR'].notna().any():
+                            for cand in rows['IDVAR'].dropna().unique().tolist():
+                                if cand in target_df.columns:
+                                    chosen_idvar = cand
+                                    break
+                        if chosen_idvar and 'IDVARVAL' in rows.columns:
+                            if chosen_idvar in target_df.columns:
+                                target_df[chosen_idvar] = target_keys.normalized(target_df, chosen_idvar)
+                                overlay.invalidate_joins([chosen_idvar])
+                            series = self._coded_supp_values(target_dataset, target_df, ['STUDYID', 'USUBJID', chosen_idvar],
+                                                             src_dataset, source_df, ['STUDYID', 'USUBJID', 'IDVARVAL'],
+                                                             row_positions, qnam)
+                            if series is not None:
+                                aligned_source_series.append(series)
+                                continue
+                            eff = rows[['STUDYID','USUBJID','IDVARVAL','QVAL']].copy()
+                            eff = eff.rename(columns={'IDVARVAL': chosen_idvar, 'QVAL': qnam})
+                            # 规范化对齐键（STUDYID/USUBJID/CMSEQ 等）
+                            for k in ['STUDYID','USUBJID']:
+                                if k in eff.columns:
+                                    eff[k] = self._normalize_key_series(eff[k])
+                            if chosen_idvar in eff.columns:
+                                eff[chosen_idvar] = self._normalize_key_series(eff[chosen_idvar])
+                            eff = eff.drop_duplicates(subset=['STUDYID','USUBJID', chosen_idvar])
+                            left_keys = [k for k in ['STUDYID','USUBJID', chosen_idvar] if k in target_df.columns and k in eff.columns]
+                            series = self._positions_aligned(target_dataset, target_df, left_keys, eff, qnam)
+                            if series is None:
+                                merged = target_df[left_keys].merge(eff, on=left_keys, how='left')
+                                series = merged[qnam] if qnam in merged.columns else pd.Series([pd.NA]*len(target_df))
+                            aligned_source_series.append(series)
+                            continue
+                        else:
+                            series = self._coded_supp_values(target_dataset, target_df, ['STUDYID', 'USUBJID'],
+                                                             src_dataset, source_df, ['STUDYID', 'USUBJID'],
+                                                             row_positions, qnam)
+                            if series is not None:
+                                aligned_source_series.append(series)
+                                continue
+                            eff = rows[['STUDYID','USUBJID','QVAL']].copy()
+                            eff = eff.rename(columns={'QVAL': qnam})
+                            for k in ['STUDYID','USUBJID']:
+                                if k in eff.columns:
+                                    eff[k] = self._normalize_key_series(eff[k])
+                            eff = eff.drop_duplicates(subset=['STUDYID','USUBJID'])
+                            left_keys = [k for k in ['STUDYID','USUBJID'] if k in target_df.columns and k in eff.columns]
+                            series = self._positions_aligned(target_dataset, target_df, left_keys, eff, qnam)
+                            if series is None:
+                                merged = target_df[left_keys].merge(eff, on=left_keys, how='left')
+                                series = merged[qnam] if qnam in merged.columns else pd.Series([pd.NA]*len(target_df))
+                            aligned_source_series.append(series)
                             continue
-                        src_df = e.get('raw_data', e['data']).copy()
-                        if 'QNAM' in src_df.columns:
-                            filtered = src_df[~src_df['QNAM'].isin(list(qnams))].copy()
-                            e['raw_data'] = filtered.copy()
-                            e['data'] = filtered.copy()
-                            # 更新SUPP的转置供选择器使用
-                            self._transpose_supp_for_display(s_ds, filtered)
-
-                    # 关键：重新映射当前所有 SUPP → 主表 的视图，保持最初合并规则与键不变
-                    self._build_preview_views()
-
-                    # 进入下一条配置
-                    continue
 
-                # 预备：目标列若不存在则创建空字符串列
-                if target_var not in target_df.columns:
-                    target_df[target_var] = ''
+            if not join_keys:
+                # 无法对齐，追加空
+                aligned_source_series.append(pd.Series([pd.NA]*len(target_df), index=target_df.index))
+                continue
 
-                # 组装每个来源列，按顺序对齐到目标数据集；保留原有目标列值作为首列
-                aligned_source_series: list[pd.Series] = [target_df[target_var]]
+            if src_col not in source_df.columns:
+                aligned_source_series.append(pd.Series([pd.NA]*len(target_df), index=target_df.index))
+                continue
+            if src_col in join_keys:
+                # 来源列本身是连接键时保持原有的合并方式
+                src_slim = source_df[join_keys + [src_col]].copy().drop_duplicates(subset=join_keys)
+                merged = target_df[join_keys].merge(src_slim, on=join_keys, how='left')
+                aligned_source_series.append(merged[src_col] if src_col in merged.columns else pd.Series([pd.NA]*len(target_df)))
+                continue
 
-                # 记录需要从SUPP原始结构中删除的QNAM
-                supp_to_drop_map: dict[str, set] = {}
+            # 多对一：每个键取来源中第一行；同一分组内相同来源与键的对齐位置只计算一次
+            positions = self._join_positions(overlay, target_dataset, target_df, src_dataset, source_df, join_keys)
+            aligned_source_series.append(pd.Series(source_df[src_col].array.take(positions, allow_fill=True)))
 
-                for src in sources_desc:
-                    src_dataset = src.get('dataset')
-                    src_col = src.get('column')
-                    if not src_dataset or not src_col or src_dataset not in self.datasets:
-                        # 无效来源，追加空系列
-                        aligned_source_series.append(pd.Series([pd.NA] * len(target_df), index=target_df.index))
-                        continue
+        # 生成目标列：按顺序拼接非空值
+        aligned_frame = pd.DataFrame({f'_s{i}': s for i, s in enumerate(aligned_source_series)})
+        # 类型压缩后的整数列按原始浮点值拼接（如 1.0），与未压缩时结果一致
+        aligned_frame = aligned_frame.astype({c: 'float64' for c in aligned_frame.columns if aligned_frame[c].dtype.kind in 'iu'})
 
-                    source_entry = self.datasets[src_dataset]
-                    source_df = source_entry.get('raw_data', source_entry['data']).copy()
+        # 根据翻译方向决定是否使用空格间隔
+        separator = ' ' if self.translation_direction == 'en_to_zh' else ''
+        target_df[target_var] = self._concat_non_empty(aligned_frame, separator)
 
-                    if src_dataset == target_dataset:
-                        # 同表直接取列
-                        series = source_df[src_col] if src_col in source_df.columns else pd.Series([pd.NA]*len(target_df), index=target_df.index)
-                        aligned_source_series.append(series)
-                        continue
+        # 在目标数据集中删除与目标同表的源列
+        same_table_source_cols = [s.get('column') for s in sources_desc if s.get('dataset') == target_dataset]
+        if same_table_source_cols:
+            target_df.drop(columns=same_table_source_cols, inplace=True, errors='ignore')
+        overlay.invalidate_joins([target_var] + same_table_source_cols)
 
-                    # 跨表：基于公共键对齐
-                    # 选择键：STUDYID、USUBJID，以及共同存在、名字以SEQ结尾的列（如 CMSEQ）
-                    common_keys = [k for k in ['STUDYID', 'USUBJID'] if k in target_df.columns and k in source_df.columns]
-                    seq_keys = [c for c in target_df.columns.intersection(source_df.columns) if str(c).upper().endswith('SEQ')]
-                    join_keys = common_keys + (seq_keys[:1] if seq_keys else [])
-
-                    # 对 SUPP* 特例：来源的“列名”实际上是 QNAM；需从原始SUPP结构中抽取 QVAL 并按键对齐
-                    if src_dataset.upper().startswith('SUPP'):
-                        qnam = src_col
-                        if 'QNAM' in source_df.columns and 'QVAL' in source_df.columns:
-                            rows = source_df[source_df['QNAM'] == qnam].copy()
-                            # 若 SUPP 中有 RDOMAIN，则限定为与目标主表一致
-                            if 'RDOMAIN' in rows.columns:
-                                rows = rows[rows['RDOMAIN'].astype(str).str.upper() == str(target_dataset).upper()].copy()
-                            if not rows.empty:
-                                # 标记删除该QNAM
-                                supp_to_drop_map.setdefault(src_dataset, set()).add(qnam)
-                                # 若有IDVAR，则优先用 IDVAR 与 IDVARVAL 指向的目标键列（如 CMSEQ）
-                                chosen_idvar = None
-                                if 'IDVAR' in rows.columns and rows['IDVAR'].notna().any():
-                                    for cand in rows['IDVAR'].dropna().unique().tolist():
-                                        if cand in target_df.columns:
-                                            chosen_idvar = cand
-                                            break
-                                if chosen_idvar and 'IDVARVAL' in rows.columns:
-                                    eff = rows[['STUDYID','USUBJID','IDVARVAL','QVAL']].copy()
-                                    eff = eff.rename(columns={'IDVARVAL': chosen_idvar, 'QVAL': qnam})
-                                    # 规范化对齐键（STUDYID/USUBJID/CMSEQ 等）
-                                    for k in ['STUDYID','USUBJID']:
-                                        if k in eff.columns:
-                                            eff[k] = self._normalize_key_series(eff[k])
-                                    if chosen_idvar in target_df.columns:
-                                        target_df[chosen_idvar] = self._normalize_key_series(target_df[chosen_idvar])
-                                    if chosen_idvar in eff.columns:
-                                        eff[chosen_idvar] = self._normalize_key_series(eff[chosen_idvar])
-                                    eff = eff.drop_duplicates(subset=['STUDYID','USUBJID', chosen_idvar])
-                                    left_keys = [k for k in ['STUDYID','USUBJID', chosen_idvar] if k in target_df.columns and k in eff.columns]
-                                    merged = target_df[left_keys].merge(eff, on=left_keys, how='left')
-                                    series = merged[qnam] if qnam in merged.columns else pd.Series([pd.NA]*len(target_df))
-                                    aligned_source_series.append(series)
-                                    continue
-                                else:
-                                    eff = rows[['STUDYID','USUBJID','QVAL']].copy()
-                                    eff = eff.rename(columns={'QVAL': qnam})
-                                    for k in ['STUDYID','USUBJID']:
-                                        if k in eff.columns:
-                                            eff[k] = self._normalize_key_series(eff[k])
-                                    eff = eff.drop_duplicates(subset=['STUDYID','USUBJID'])
-                                    left_keys = [k for k in ['STUDYID','USUBJID'] if k in target_df.columns and k in eff.columns]
-                                    merged = target_df[left_keys].merge(eff, on=left_keys, how='left')
-                                    series = merged[qnam] if qnam in merged.columns else pd.Series([pd.NA]*len(target_df))
-                                    aligned_source_series.append(series)
-                                    continue
-
-                    if not join_keys:
-                        # 无法对齐，追加空
-                        aligned_source_series.append(pd.Series([pd.NA]*len(target_df), index=target_df.index))
-                        continue
+        # 回写目标（raw 与 data）
+        overlay.commit(target_dataset, target_df)
 
-                    # 多对一：先根据 join_keys 聚合取第一个
-                    src_slim = source_df[join_keys + ([src_col] if src_col in source_df.columns else [])].copy() if src_col in source_df.columns else None
-                    if src_slim is None:
-                        aligned_source_series.append(pd.Series([pd.NA]*len(target_df), index=target_df.index))
-                        continue
-                    src_slim = src_slim.drop_duplicates(subset=join_keys)
-
-                    left_keys = [k for k in join_keys if k in target_df.columns]
-                    merged = target_df[left_keys].merge(src_slim, on=left_keys, how='left')
-                    series = merged[src_col] if src_col in merged.columns else pd.Series([pd.NA]*len(target_df))
-                    aligned_source_series.append(series)
-
-                # 生成目标列：按顺序拼接非空值
-                aligned_frame = pd.DataFrame({f'_s{i}': s for i, s in enumerate(aligned_source_series)})
-
-                def concat_row(row):
-                    parts = []
-                    for val in row.values.tolist():
-                        if pd.notna(val):
-                            sval = str(val)
-                            if sval.lower() != 'nan' and sval != '':
-                                parts.append(sval)
-                    # 根据翻译方向决定是否使用空格间隔
-                    separator = ' ' if self.translation_direction == 'en_to_zh' else ''
-                    return separator.join(parts)
-
-                target_df[target_var] = aligned_frame.apply(concat_row, axis=1)
-
-                # 在目标数据集中删除与目标同表的源列
-                same_table_source_cols = [s.get('column') for s in sources_desc if s.get('dataset') == target_dataset]
-                if same_table_source_cols:
-                    target_df.drop(columns=same_table_source_cols, inplace=True, errors='ignore')
-
-                # 回写目标（raw 与 data）
-                self.datasets[target_dataset]['raw_data'] = target_df.copy()
-                self.datasets[target_dataset]['data'] = target_df.copy()
-
-                # 从各SUPP原始结构中删除已合并的 QNAM，并同步更新其转置预览
-                for supp_ds, qnams in supp_to_drop_map.items():
-                    entry = self.datasets.get(supp_ds)
-                    if not entry:
-                        continue
-                    raw = entry.get('raw_data', entry['data']).copy()
-                    if 'QNAM' in raw.columns:
-                        filtered = raw[~raw['QNAM'].isin(list(qnams))].copy()
-                        entry['raw_data'] = filtered.copy()
-                        entry['data'] = filtered.copy()
-                        # 重新生成预览转置
-                        self._transpose_supp_for_display(supp_ds, filtered)
+        # 从各SUPP原始结构中删除已合并的 QNAM，并同步更新其转置预览
+        self._drop_merged_qnams(overlay, supp_to_drop_map)
 
-                # 重新构建主表预览视图
-                self._build_preview_views()
+    @staticmethod
+    def _drop_merged_qnams(overlay, supp_to_drop_map):
+        """从来源 SUPP 中删除已合并的 QNAM 行，并记录需重新生成的转置预览"""
+        for supp_ds, qnams in supp_to_drop_map.items():
+            if not overlay.has(supp_ds):
+                continue
+            raw = overlay.raw(supp_ds)
+            if 'QNAM' in raw.columns:
+                filtered = raw[~raw['QNAM'].isin(list(qnams))]
+                overlay.commit(supp_ds, filtered)
+                overlay.transposes[supp_ds] = filtered
 
-            return True, "变量合并成功"
-        except Exception as e:
-            # 将异常同时打印到控制台，便于调试
-            print('merge_variables error:', e)
-            return False, f"变量合并失败: {str(e)}"
+    def _positions_aligned(self, target_dataset, target_df, keys, right, value_col):
+        """按 keys 将 right[value_col] 对齐到目标数据集各行（等价于 merge how='left' 后取该列）；
+        right 中被匹配的键有重复、键为空或类型无法比较时返回 None，由调用方回退到 merge"""
+        if not keys or value_col in keys or value_col not in right.columns:
+            return None
+        positions = self._key_index(target_dataset).positions(target_df, keys, right, unique=True)
+        if positions is None:
+            return None
+        return pd.Series(right[value_col].array.take(positions, allow_fill=True))
+
+    def _lookup_aligned(self, src_dataset, source_df, keys, probe, value_col):
+        """在来源数据集的键索引中查找 probe 各行，返回对齐的 source_df[value_col]（等价于
+        probe.merge(source_df, how='left') 后取该列）；来源键有重复、键为空或类型无法比较时返回 None"""
+        if not keys or value_col in keys or value_col not in source_df.columns:
+            return None
+        positions = self._key_index(src_dataset).lookup(source_df, keys, probe, unique=True)
+        if positions is None:
+            return None
+        return pd.Series(source_df[value_col].array.take(positions, allow_fill=True))
+
+    def _join_positions(self, overlay, target_dataset, target_df, src_dataset, source_df, join_keys):
+        """目标每行在来源中按 join_keys 匹配到的第一行位置，未匹配为 -1；结果缓存在分组工作区中，
+        来源被改写或目标键列变化时失效。目标键编码由数据集键索引提供"""
+        key = (src_dataset, overlay.versions.get(src_dataset, 0), tuple(join_keys))
+        positions = overlay.join_cache.get(key)
+        if positions is not None and len(positions) == len(target_df):
+            overlay.join_cache_hits += 1
+            return positions
+        positions = self._key_index(target_dataset).positions(target_df, join_keys, source_df)
+        if positions is not None:
+            overlay.join_cache[key] = positions
+            return positions
+        src_keys = source_df[join_keys].copy()
+        src_keys['__pos'] = np.arange(len(source_df))
+        src_keys = src_keys.drop_duplicates(subset=join_keys)
+        merged = target_df[join_keys].merge(src_keys, on=join_keys, how='left')
+        positions = merged['__pos'].fillna(-1).to_numpy(dtype=np.int64)
+        overlay.join_cache[key] = positions
+        return positions
 
     def _refresh_main_from_supp(self, supp_name: str, affected_qnams: set) -> None:
         """将指定 SUPP 的受影响 QNAM 刷新到各主表已存在的映射列（覆盖写入）。"""
@@ -1918,8 +4141,8 @@ class SASDataProcessor:
         # 准备规范化键
         for c in ['STUDYID', 'USUBJID', 'IDVARVAL']:
             if c in supp_df.columns:
-                supp_df[c] = self._normalize_key_series(supp_df[c])
-        for ds_name, entry in self.datasets.items():
+                supp_df[c] = self._key_index(supp_name).normalized(supp_df, c)
+        for ds_name, entry in list(self.datasets.items()):
             if ds_name.upper().startswith('SUPP'):
                 continue
             meta = entry.setdefault('extra_meta', {})
@@ -1927,6 +4150,7 @@ class SASDataProcessor:
             if not origin_map:
                 continue
             target_df = entry['data']
+            key_index = self._key_index(ds_name)
             for col, m in origin_map.items():
                 if m.get('supp_ds') != supp_name:
                     continue
@@ -1943,20 +4167,155 @@ class SASDataProcessor:
                 join_keys = [k for k in ['STUDYID', 'USUBJID'] if k in target_df.columns and k in rows.columns]
                 if m.get('idvar') and m['idvar'] in target_df.columns and 'IDVARVAL' in rows.columns:
                     # 用 idvar 与 IDVARVAL 对齐
-                    tmp_left = target_df[join_keys + [m['idvar']]].copy()
+                    tmp_left = _shared_copy(target_df[join_keys + [m['idvar']]])
                     # 规范化
-                    tmp_left[m['idvar']] = self._normalize_key_series(tmp_left[m['idvar']])
-                    merged = tmp_left.merge(rows[join_keys + ['IDVARVAL','QVAL']], left_on=join_keys + [m['idvar']], right_on=join_keys + ['IDVARVAL'], how='left')
-                    vals = merged['QVAL'] if 'QVAL' in merged.columns else pd.Series([pd.NA] * len(target_df))
+                    tmp_left[m['idvar']] = key_index.normalized(target_df, m['idvar'])
+                    positions = key_index.positions(tmp_left, join_keys + [m['idvar']], rows, join_keys + ['IDVARVAL'], unique=True)
+                    if positions is not None:
+                        vals = pd.Series(rows['QVAL'].array.take(positions, allow_fill=True))
+                    else:
+                        merged = tmp_left.merge(rows[join_keys + ['IDVARVAL','QVAL']], left_on=join_keys + [m['idvar']], right_on=join_keys + ['IDVARVAL'], how='left')
+                        vals = merged['QVAL'] if 'QVAL' in merged.columns else pd.Series([pd.NA] * len(target_df))
                 else:
-                    merged = target_df[join_keys].merge(rows[join_keys + ['QVAL']], on=join_keys, how='left')
-                    vals = merged['QVAL'] if 'QVAL' in merged.columns else pd.Series([pd.NA] * len(target_df))
+                    positions = key_index.positions(target_df, join_keys, rows, unique=True) if join_keys else None
+                    if positions is not None:
+                        vals = pd.Series(rows['QVAL'].array.take(positions, allow_fill=True))
+                    else:
+                        merged = target_df[join_keys].merge(rows[join_keys + ['QVAL']], on=join_keys, how='left')
+                        vals = merged['QVAL'] if 'QVAL' in merged.columns else pd.Series([pd.NA] * len(target_df))
                 target_df[col] = vals.reset_index(drop=True)
             entry['data'] = target_df
+            entry['version'] = self._next_version()
+
+class ProcessorRegistry:
+    """按研究路径管理多个项目的 SASDataProcessor。
+
+    每个路径对应一个处理器（自带项目级锁），按最近使用顺序排列；项目数超过上限或
+    总内存超过预算时淘汰最久未使用的项目（优先淘汰没有未保存合并结果的项目）。
+    """
+
+    def __init__(self, max_projects=None, memory_budget_mb=None):
+        self.max_projects = max_projects if max_projects is not None else int(os.getenv('SAS_MAX_PROJECTS', '4'))
+        self.memory_budget_mb = memory_budget_mb if memory_budget_mb is not None else \
+            float(os.getenv('SAS_PROJECTS_MEMORY_MB', '0'))
+        self._projects = OrderedDict()  # key -> {'processor', 'path', 'last_access'}
+        self._lock = threading.Lock()
+        self.active_key = None
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def get(self, path=None, create=False):
+        """获取路径对应的处理器。未指定路径时返回最近使用的项目；
+        项目不存在时 create=True 则创建并登记，否则返回 None"""
+        with self._lock:
+            key = self._key(path) if path else self.active_key
+            project = self._projects.get(key) if key else None
+            if project is not None:
+                self.stats['hits'] += 1
+                self._projects.move_to_end(key)
+                project['last_access'] = time.time()
+                self.active_key = key
+                return project['processor']
+            self.stats['misses'] += 1
+            if not (create and path):
+                return None
+            processor = SASDataProcessor()
+            self._projects[key] = {'processor': processor, 'path': path, 'last_access': time.time()}
+            self.active_key = key
+            return processor
+
+    @staticmethod
+    def _processor_memory_bytes(processor):
+        return sum(u['total_bytes'] for u in processor.get_memory_usage().values())
+
+    def evict(self, keep=None):
+        """项目数或总内存超限时按 LRU 淘汰项目；正在后台加载或被占用（持有项目锁）的项目跳过"""
+        with self._lock:
+            keep_key = self._key(keep) if keep else self.active_key
+            budget = self.memory_budget_mb * 1024 * 1024
+            # 统计内存需遍历所有数据集的列，只在设置了内存预算时计算
+            usage = {k: self._processor_memory_bytes(p['processor']) for k, p in self._projects.items()} if budget > 0 else {}
+            total = sum(usage.values())
+
+            def over_limit():
+                return (self.max_projects > 0 and len(self._projects) > self.max_projects) or \
+                    (budget > 0 and total > budget)
+
+            # 有未保存合并结果（dirty）的项目排在后面，同类按最近访问时间从旧到新
+            order = sorted(
+                (k for k in self._projects if k != keep_key),
+                key=lambda k: (any(e.get('dirty') for e in self._projects[k]['processor'].datasets.values()),
+                               self._projects[k]['last_access'])
+            )
+            for key in order:
+                if not over_limit():
+                    break
+                processor = self._projects[key]['processor']
+                if processor.load_state == 'loading' or not processor.lock.acquire(blocking=False):
+                    continue
+                try:
+                    # 只解除登记，不清空处理器：仍持有该处理器的请求继续读到完整数据，内存在其用完后回收
+                    del self._projects[key]
+                finally:
+                    processor.lock.release()
+                freed = usage.pop(key, 0)
+                total -= freed
+                self.stats['evictions'] += 1
+                print(f"已释放项目 {key}（{freed / 1024 / 1024:.1f} MB）" if budget > 0 else f"已释放项目 {key}")
+            if self.active_key not in self._projects:
+                self.active_key = keep_key if keep_key in self._projects else None
 
-# 全局处理器实例
-processor = SASDataProcessor()
+    def get_stats(self):
+        """返回命中/未命中/淘汰统计及各项目概况"""
+        with self._lock:
+            projects = [{
+                'path': p['path'],
+                'datasets': len(p['processor'].datasets),
+                'load_state': p['processor'].load_state,
+                'memory_bytes': self._processor_memory_bytes(p['processor']),
+                'last_access': p['last_access'],
+                'active': k == self.active_key
+            } for k, p in reversed(self._projects.items())]
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'hit_rate': round(self.stats['hits'] / lookups, 4) if lookups else 0.0,
+                'max_projects': self.max_projects,
+                'memory_budget_mb': self.memory_budget_mb,
+                'projects': projects
+            }
+
+
+# 全局项目注册表与数据库实例
+processor_registry = ProcessorRegistry()
 db_manager = DatabaseManager()
+# 请求的路径未登记为项目时使用的空处理器（不登记、所有未命中共用一个，避免每次未命中都构建新处理器）
+_unregistered_processor = None
+
+
+def get_project_processor(path=None, create=False):
+    """按研究路径定位项目处理器：优先使用参数 path，其次请求中的 path（查询参数或JSON），
+    均未指定时使用最近使用的项目。create=False 且项目未登记时返回共用的空处理器，
+    只可读取；会修改处理器的调用方需先用 _is_registered 检查"""
+    if not path:
+        path = request.args.get('path')
+    if not path and request.is_json:
+        path = (request.get_json(silent=True) or {}).get('path')
+    processor = processor_registry.get(path, create=create)
+    if processor is None:
+        global _unregistered_processor
+        if _unregistered_processor is None:
+            _unregistered_processor = SASDataProcessor()
+        processor = _unregistered_processor
+    return processor
+
+
+def _is_registered(processor):
+    """处理器是否为已登记的项目（而非未命中时共用的空处理器）"""
+    return processor is not _unregistered_processor
 
 @app.route('/')
 def index():
@@ -1970,27 +4329,162 @@ def read_datasets():
     directory_path = data.get('path', '')
     mode = data.get('mode', 'RAW')
     translation_direction = data.get('translation_direction', 'zh_to_en')
+    read_mode = data.get('read_mode')  # 'thread' 或 'process'
+    two_phase = bool(data.get('two_phase', False))  # 先返回元数据，数据在后台加载
+    lazy = data.get('lazy')  # 惰性模式：数据在首次访问时加载
     
     if not directory_path or not os.path.exists(directory_path):
         return jsonify({'success': False, 'message': '路径不存在或为空'})
     
-    # 设置翻译方向
-    processor.translation_direction = translation_direction
-    success, message = processor.read_sas_files(directory_path, mode)
+    processor = get_project_processor(directory_path, create=True)
+    with processor.lock:
+        # 设置翻译方向
+        processor.translation_direction = translation_direction
+        success, message = processor.read_sas_files(directory_path, mode, read_mode=read_mode,
+                                                   two_phase=two_phase, lazy=lazy)
+    processor_registry.evict(keep=directory_path)
     
     if success:
         datasets_info = processor.get_all_datasets_info()
         return jsonify({
             'success': True,
             'message': message,
-            'datasets': datasets_info
+            'datasets': datasets_info,
+            'load_state': processor.load_state,
+            'read_stats': processor.read_stats
+        })
+    else:
+        return jsonify({'success': False, 'message': message})
+
+@app.route('/refresh_datasets', methods=['POST'])
+def refresh_datasets():
+    """增量刷新已读取的目录：仅重新读取新增/修改的文件，移除已删除的文件"""
+    data = request.get_json(silent=True) or {}
+    read_mode = data.get('read_mode')  # 'thread' 或 'process'
+
+    processor = get_project_processor()
+    with processor.lock:
+        success, message, changes = processor.refresh_sas_files(read_mode=read_mode)
+    processor_registry.evict(keep=processor.source_directory)
+    if success:
+        return jsonify({
+            'success': True,
+            'message': message,
+            'changes': changes,
+            'datasets': processor.get_all_datasets_info(),
+            'read_stats': processor.read_stats
         })
     else:
         return jsonify({'success': False, 'message': message})
 
+@app.route('/datasets_status', methods=['GET'])
+def datasets_status():
+    """两阶段加载时供前端轮询：返回整体加载状态与各数据集状态，加载完成后附带完整数据集信息"""
+    processor = get_project_processor()
+
+    def render():
+        status = processor.get_load_status()
+        if status['load_state'] == 'ready':
+            status['datasets_info'] = processor.get_all_datasets_info()
+            status['read_stats'] = processor.read_stats
+        return jsonify(status)
+    # 状态与数据集信息未变化时返回 304（轮询期间数据集状态变化会改变 ETag）
+    return _etag_response(processor.datasets_info_etag(), render)
+
+@app.route('/api/memory_usage', methods=['GET'])
+def get_memory_usage():
+    """获取各数据集的内存占用（raw/data/view 共享的列只计一次）"""
+    try:
+        processor = get_project_processor()
+        usage = processor.get_memory_usage()
+        return jsonify({
+            'success': True,
+            'datasets': usage,
+            'total_bytes': sum(u['total_bytes'] for u in usage.values()),
+            'disk_cache': processor.cache.stats() if processor.cache is not None else None,
+            'key_dictionary': processor.key_dictionary.stats(),
+            'key_cache': processor.key_cache_stats(),
+            'page_cache': processor.page_cache.stats() if processor.page_cache is not None else None
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/projects', methods=['GET'])
+def get_projects():
+    """获取已加载项目列表及注册表命中/未命中/淘汰统计"""
+    try:
+        return jsonify({'success': True, **processor_registry.get_stats()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+def _ndjson_response(chunks, use_gzip, label=''):
+    """将逐块生成的 NDJSON 文本包装为流式响应；use_gzip 时逐块压缩并同步刷新，客户端可边收边解析。
+    客户端断开时 WSGI 服务器关闭响应迭代器，生成器随之关闭，剩余块不再序列化"""
+    def generate():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+        finished = False
+        try:
+            for text in chunks:
+                data = text.encode('utf-8')
+                if compressor is not None:
+                    data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+            if compressor is not None:
+                yield compressor.flush()
+            finished = True
+        finally:
+            chunks.close()
+            if not finished:
+                print(f'预览流已取消（客户端断开）: {label}')
+
+    response = app.response_class(generate(), mimetype='application/x-ndjson')
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-store'
+    # 关闭反向代理缓冲，保证分块及时到达浏览器
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _etag_response(etag, render):
+    """条件 GET：If-None-Match 含当前 ETag 时直接返回 304，不调用 render；否则以 render() 的返回值生成响应，
+    成功时附带 ETag 与 Cache-Control: no-cache（浏览器缓存响应，但每次携带 ETag 向服务端验证）"""
+    if etag is not None and request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.make_response(render())
+        if response.status_code != 200:
+            return response
+    if etag is not None:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _cached_page(processor, etag, render):
+    """从项目的页缓存按 ETag 与请求路径、参数取已序列化的预览响应字节，未命中时 render() 生成；未启用缓存时直接生成"""
+    if processor.page_cache is None or etag is None:
+        return render()
+    key = (etag, request.path, tuple(sorted(request.args.items(multi=True))))
+    return processor.page_cache.get(key, render)
+
+def _preview_query_args():
+    """从请求参数解析预览查询，无排序/筛选/搜索条件时返回 None。
+    服务端排序/筛选/搜索：sort=COL,-COL2；filters 为 JSON 数组
+    [{"column": "AETERM", "op": "contains", "value": "头痛"}, {"column": "AGE", "op": "range", "min": 18, "max": 65},
+     {"column": "AEENDTC", "op": "null"}, {"column": "SEX", "op": "equals", "value": ["M", "F"]}]；search 为全局搜索文本"""
+    if not any(request.args.get(k) for k in ('sort', 'filters', 'search')):
+        return None
+    try:
+        filters = json.loads(request.args['filters']) if request.args.get('filters') else None
+    except ValueError:
+        raise ValueError('filters 参数不是有效的 JSON')
+    return {'sort': request.args.get('sort'), 'filters': filters, 'search': request.args.get('search')}
+
 @app.route('/get_dataset/<dataset_name>')
 def get_dataset(dataset_name):
     # 支持查询参数：?all=1 或 ?page=1&page_size=100 或 ?limit=100&offset=0
+    # ?all=1&stream=1 以 NDJSON 流式输出（可选 chunk_rows，Accept-Encoding 含 gzip 时压缩，gzip=0 关闭）
     all_flag = request.args.get('all', default='0')
     if all_flag in ('1', 'true', 'True'):
         limit = None
@@ -2009,26 +4503,87 @@ def get_dataset(dataset_name):
             limit = request.args.get('limit', default=100, type=int)
             offset = request.args.get('offset', default=0, type=int)
 
-    preview = processor.get_dataset_preview(dataset_name, limit=limit, offset=offset)
-    if preview:
-        # 附加分页元数据（当非全量时）
-        if limit is not None and limit > 0:
-            total_rows = preview['total_rows']
-            current_page = (offset // limit) + 1
-            total_pages = (total_rows + limit - 1) // limit if limit else 1
-            preview.update({
-                'page': current_page,
-                'page_size': limit,
-                'total_pages': total_pages
-            })
-        return jsonify(preview)
-    else:
-        return jsonify({'error': '数据集未找到'}), 404
+    # format=columns 时 data 为列数组（[[第1列各行值], ...]），否则为行对象数组
+    shape = 'columns' if request.args.get('format') == 'columns' else 'records'
+    try:
+        query = _preview_query_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    processor = get_project_processor()
+    try:
+        if limit is None and request.args.get('stream') in ('1', 'true', 'True'):
+            # 全量预览的流式版本：NDJSON 分块输出，不在内存中拼出整个 JSON 文档
+            chunks = processor.iter_dataset_preview(dataset_name, shape=shape, query=query,
+                                                    chunk_rows=request.args.get('chunk_rows', default=10000, type=int))
+            if chunks is None:
+                return jsonify({'error': '数据集未找到'}), 404
+            use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '') and request.args.get('gzip') not in ('0', 'false', 'False')
+            return _ndjson_response(chunks, use_gzip, dataset_name)
+        etag = processor.dataset_etag(dataset_name)
+
+        def render():
+            # 预览直接序列化为响应字节，避免 to_json -> json.loads -> jsonify 的三次转换；数据未变化时命中页缓存
+            body = _cached_page(processor, etag, lambda: processor.get_dataset_preview_json(
+                dataset_name, limit=limit, offset=offset, shape=shape, query=query))
+            if body is None:
+                return jsonify({'error': '数据集未找到'}), 404
+            return app.response_class(body, mimetype='application/json')
+        return _etag_response(etag, render)
+    except ValueError as e:
+        # 查询中的列名或筛选条件无效
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/get_dataset_schema/<dataset_name>')
+def get_dataset_schema(dataset_name):
+    # 预览表的结果行数与列结构（名称/类型/标签），供前端虚拟滚动确定滚动区域大小；支持与 /get_dataset 相同的查询参数
+    processor = get_project_processor()
+
+    def render():
+        schema = processor.get_dataset_schema(dataset_name, query=_preview_query_args())
+        if schema is None:
+            return jsonify({'error': '数据集未找到'}), 404
+        return jsonify(schema)
+    try:
+        return _etag_response(processor.dataset_etag(dataset_name), render)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/get_dataset_viewport/<dataset_name>')
+def get_dataset_viewport(dataset_name):
+    # 预览表的一个矩形区域：?row_start=0&row_count=100 行窗口（单次最多 5000 行），
+    # 列由 columns=COL1,COL2 指定，或以 col_start/col_count 给出列窗口（省略时为全部列）；
+    # 默认输出列数组（format=records 时为行对象），支持与 /get_dataset 相同的查询参数
+    row_count = min(max(0, request.args.get('row_count', default=100, type=int)), 5000)
+    columns = [c for c in request.args.get('columns', default='').split(',') if c] or None
+    shape = 'records' if request.args.get('format') == 'records' else 'columns'
+    processor = get_project_processor()
+    etag = processor.dataset_etag(dataset_name)
+
+    def render():
+        body = _cached_page(processor, etag, lambda: processor.get_dataset_viewport_json(
+            dataset_name,
+            row_start=request.args.get('row_start', default=0, type=int),
+            row_count=row_count,
+            columns=columns,
+            col_start=request.args.get('col_start', default=0, type=int),
+            col_count=request.args.get('col_count', default=None, type=int),
+            shape=shape,
+            query=_preview_query_args()
+        ))
+        if body is None:
+            return jsonify({'error': '数据集未找到'}), 404
+        return app.response_class(body, mimetype='application/json')
+    try:
+        return _etag_response(etag, render)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 @app.route('/get_source_variables/<main_dataset>', methods=['GET'])
 def get_source_variables(main_dataset):
     """获取指定主数据集对应的SUPP数据集中可用的源变量"""
     try:
+        processor = get_project_processor()
+        processor.wait_until_loaded()
         if main_dataset not in processor.datasets:
             return jsonify({'error': f'数据集 {main_dataset} 不存在'})
         
@@ -2061,43 +4616,49 @@ def get_source_variables(main_dataset):
                 'message': f'未找到与 {main_dataset} 对应的SUPP数据集'
             })
         
-        # 获取SUPP数据集信息
-        supp_data = processor.datasets.get(supp_dataset_name)
-        if not supp_data:
-            return jsonify({'error': f'SUPP数据集 {supp_dataset_name} 数据为空'})
-        
-        # 优先从原始数据获取QNAM值，如果没有则从处理后的数据获取
-        raw_df = supp_data.get('raw_data')
-        df = raw_df if raw_df is not None else supp_data.get('data')
-        
-        if df is None or df.empty:
-            return jsonify({'error': f'SUPP数据集 {supp_dataset_name} 无有效数据'})
-        
-        # 从QNAM列获取唯一值作为源变量（这是SDTM SUPP数据集的标准结构）
-        if 'QNAM' in df.columns:
-            # 过滤与主数据集相关的SUPP记录
-            filtered_df = df
-            if 'RDOMAIN' in df.columns:
-                # 只保留与主数据集RDOMAIN匹配的记录
-                filtered_df = df[df['RDOMAIN'].astype(str).str.upper() == main_dataset.upper()]
-            
-            if not filtered_df.empty:
-                # 从QNAM列获取唯一值作为源变量
-                qnam_values = filtered_df['QNAM'].dropna().unique().tolist()
-                available_columns = [str(val).strip() for val in qnam_values 
-                                   if str(val).strip() not in ['', 'nan', 'None', 'NaN']]
+        # 获取SUPP数据集信息；SUPP 数据集版本未变化时返回 304，不再重新提取源变量
+        etag = processor.dataset_etag(supp_dataset_name)
+
+        def render():
+            supp_data = processor.datasets.get(supp_dataset_name)
+            if not supp_data:
+                return jsonify({'error': f'SUPP数据集 {supp_dataset_name} 数据为空'})
+        
+            # 优先从原始数据获取QNAM值，如果没有则从处理后的数据获取
+            raw_df = supp_data.get('raw_data')
+            df = raw_df if raw_df is not None else supp_data.get('data')
+        
+            if df is None or df.empty:
+                return jsonify({'error': f'SUPP数据集 {supp_dataset_name} 无有效数据'})
+        
+            # 从QNAM列获取唯一值作为源变量（这是SDTM SUPP数据集的标准结构）
+            if 'QNAM' in df.columns:
+                # 过滤与主数据集相关的SUPP记录
+                filtered_df = df
+                if 'RDOMAIN' in df.columns:
+                    # 只保留与主数据集RDOMAIN匹配的记录（使用 RDOMAIN 分区索引）
+                    filtered_df, _ = processor._supp_rows_for_domain(supp_dataset_name, main_dataset, df)
+                    if filtered_df is None:
+                        filtered_df = df.iloc[0:0]
+            
+                if not filtered_df.empty:
+                    # 从QNAM列获取唯一值作为源变量
+                    qnam_values = filtered_df['QNAM'].dropna().unique().tolist()
+                    available_columns = [str(val).strip() for val in qnam_values 
+                                       if str(val).strip() not in ['', 'nan', 'None', 'NaN']]
+                else:
+                    available_columns = []
             else:
-                available_columns = []
-        else:
-            # 如果没有QNAM列，尝试从转置后的列名获取
-            base_columns = {'STUDYID', 'USUBJID', 'RDOMAIN', 'IDVAR', 'IDVARVAL', 'QNAM', 'QVAL', 'QLABEL', 'QORIG'}
-            available_columns = [col for col in df.columns if col not in base_columns and not str(col).startswith('_')]
+                # 如果没有QNAM列，尝试从转置后的列名获取
+                base_columns = {'STUDYID', 'USUBJID', 'RDOMAIN', 'IDVAR', 'IDVARVAL', 'QNAM', 'QVAL', 'QLABEL', 'QORIG'}
+                available_columns = [col for col in df.columns if col not in base_columns and not str(col).startswith('_')]
         
-        return jsonify({
-            'source_variables': available_columns,
-            'supp_dataset': supp_dataset_name,
-            'message': f'找到 {len(available_columns)} 个可用源变量'
-        })
+            return jsonify({
+                'source_variables': available_columns,
+                'supp_dataset': supp_dataset_name,
+                'message': f'找到 {len(available_columns)} 个可用源变量'
+            })
+        return _etag_response(etag, render)
         
     except Exception as e:
         return jsonify({'error': f'获取源变量失败: {str(e)}'})
@@ -2108,16 +4669,33 @@ def merge_variables():
     merge_config = data.get('config', [])
     translation_direction = data.get('translation_direction', 'zh_to_en')
     
-    # 设置翻译方向
-    processor.translation_direction = translation_direction
-    success, message = processor.merge_variables(merge_config)
+    processor = get_project_processor()
+    if not _is_registered(processor):
+        return jsonify({'success': False, 'message': '尚未读取数据集，无法合并变量'})
+    if data.get('dry_run'):
+        # 试运行：在抽样受试者上执行合并计划并估算全量耗时/内存，不修改数据、不改变翻译方向设置
+        with processor.lock:
+            success, message, result = processor.merge_dry_run(
+                merge_config,
+                sample_subjects=max(1, int(data.get('sample_subjects', 20))),
+                preview_rows=max(0, int(data.get('preview_rows', 50))),
+                translation_direction=translation_direction)
+        if not success:
+            return jsonify({'success': False, 'message': message})
+        return jsonify({'success': True, 'dry_run': True, 'message': message, **result})
+
+    with processor.lock:
+        # 设置翻译方向
+        processor.translation_direction = translation_direction
+        success, message = processor.merge_variables(merge_config)
     
     if success:
         datasets_info = processor.get_all_datasets_info()
         resp = jsonify({
             'success': True,
             'message': message,
-            'datasets': datasets_info
+            'datasets': datasets_info,
+            'timing': processor.merge_stats
         })
         # 明确禁用缓存，确保前端立即拿到最新视图
         resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
@@ -2134,12 +4712,16 @@ def execute_merge():
         merge_config = data.get('merge_config', [])
         translation_config = data.get('translation_config', {})
         
-        # 设置翻译方向
-        translation_direction = translation_config.get('translation_direction', 'zh_to_en')
-        processor.translation_direction = translation_direction
-        
-        # 执行合并
-        success, message = processor.merge_variables(merge_config)
+        processor = get_project_processor(translation_config.get('path'))
+        if not _is_registered(processor):
+            return jsonify({'success': False, 'message': '尚未读取数据集，无法合并变量'}), 400
+        with processor.lock:
+            # 设置翻译方向
+            translation_direction = translation_config.get('translation_direction', 'zh_to_en')
+            processor.translation_direction = translation_direction
+            
+            # 执行合并
+            success, message = processor.merge_variables(merge_config)
         
         if success:
             # 获取处理后的数据集信息
@@ -2147,7 +4729,8 @@ def execute_merge():
             return jsonify({
                 'success': True,
                 'message': message,
-                'data': datasets_info
+                'data': datasets_info,
+                'timing': processor.merge_stats
             })
         else:
             return jsonify({'success': False, 'message': message}), 500
@@ -2466,25 +5049,32 @@ def get_dataset_variables_by_name():
         dataset_name = request.args.get('dataset_name')
         file_path = request.args.get('file_path')
         
+        processor = get_project_processor()
         print(f"[DEBUG] get_dataset_variables_by_name called with dataset_name={dataset_name}, file_path={file_path}")
         print(f"[DEBUG] processor.datasets keys: {list(processor.datasets.keys()) if processor.datasets else 'None'}")
         
         if dataset_name:
             # 通过数据集名称获取
+            processor.wait_until_dataset_loaded(dataset_name)
             if dataset_name not in processor.datasets:
                 print(f"[ERROR] 数据集 {dataset_name} 不存在于 processor.datasets 中")
                 return jsonify({'success': False, 'error': f'数据集 {dataset_name} 不存在'}), 400
             
+            etag = processor.dataset_etag(dataset_name)
             dataset_info = processor.datasets[dataset_name]
-            if processor.hide_supp_in_preview:
-                df = dataset_info.get('data_view', dataset_info['data'])
-            else:
-                df = dataset_info['data']
-                if dataset_name.upper().startswith('SUPP') and dataset_info.get('use_pivot_preview') and 'pivot_for_display' in dataset_info:
-                    df = dataset_info['pivot_for_display']
-            
-            variables = list(df.columns)
-            return jsonify({'success': True, 'variables': variables})
+            if 'data' not in dataset_info:
+                return jsonify({'success': False, 'error': f'数据集 {dataset_name} 加载失败: {dataset_info.get("error", "")}'}), 400
+
+            def render():
+                if processor.hide_supp_in_preview:
+                    df = processor._get_data_view(dataset_name)
+                else:
+                    df = dataset_info['data']
+                    if dataset_name.upper().startswith('SUPP') and dataset_info.get('use_pivot_preview') and 'pivot_for_display' in dataset_info:
+                        df = dataset_info['pivot_for_display']
+                return jsonify({'success': True, 'variables': list(df.columns)})
+            # 数据集版本未变化时返回 304
+            return _etag_response(etag, render)
             
         elif file_path:
             # 通过文件路径获取（兼容旧接口）
@@ -2610,13 +5200,39 @@ def generate_coded_list():
         
         # 使用全局processor实例获取合并后的数据
         # 检查是否已经加载了相同路径的数据
-        if not processor.datasets or getattr(processor, 'current_path', None) != path:
-            print(f'开始读取SAS文件: {path}')
-            success, message = processor.read_sas_files(path, mode='SDTM')
-            if not success:
-                return jsonify({'success': False, 'message': f'读取SAS文件失败: {message}'}), 500
-            processor.current_path = path  # 记录当前路径
-            print(f'SAS文件读取完成，共加载 {len(processor.datasets)} 个数据集')
+        processor = get_project_processor(path)
+        processor.wait_until_loaded()
+        path_loaded = bool(processor.datasets) and processor.source_mode == 'SDTM'
+        projected_views = None
+        if not path_loaded:
+            # 未加载该路径时只按配置读取 name_column/code_column（及合并 SUPP 所需的键列），不替换已加载的数据集
+            required_columns = {}
+            for item in meddra_config + whodrug_config:
+                if item.get('table_path'):
+                    required_columns.setdefault(item['table_path'], set()).update(
+                        c for c in (item.get('name_column'), item.get('code_column')) if c)
+            print(f'开始列投影读取SAS文件: {path}')
+            projected_views, failed_files = processor.read_projected_views(path, required_columns)
+            if not projected_views and failed_files:
+                return jsonify({'success': False, 'message': f"读取SAS文件失败: {'; '.join(failed_files[:3])}"}), 500
+            print(f'SAS文件列投影读取完成，共读取 {len(projected_views)} 个数据集')
+
+        def load_dataset_frames(dataset_names):
+            """获取配置涉及数据集的预览视图（SUPP 已合并）"""
+            if projected_views is not None:
+                return {n: projected_views[n] for n in dataset_names if n in projected_views}
+            processor._pin(*dataset_names)
+            try:
+                processor.ensure_loaded(*dataset_names)
+                frames = {}
+                for ds_name in dataset_names:
+                    if ds_name in processor.datasets and 'data' in processor.datasets[ds_name]:
+                        frames[ds_name] = processor._get_data_view(ds_name)
+                return frames
+            finally:
+                processor._unpin(*dataset_names)
+
+        available_datasets = projected_views.keys() if projected_views is not None else processor.datasets.keys()
         
         coded_items = []
         # 统一收集所有未匹配的项目，用于批量AI翻译
@@ -2637,7 +5253,7 @@ def generate_coded_list():
             meddra_df['translation_direction'] = config.get('translation_direction', 'zh_to_en')
             
             # 批量验证数据集存在性
-            meddra_df['dataset_exists'] = meddra_df['table_path'].isin(processor.datasets.keys())
+            meddra_df['dataset_exists'] = meddra_df['table_path'].isin(available_datasets)
             valid_meddra_configs = meddra_df[meddra_df['dataset_exists']].copy()
             
             if len(valid_meddra_configs) == 0:
@@ -2647,11 +5263,7 @@ def generate_coded_list():
                 
                 # 预加载所有需要的数据集
                 unique_datasets = valid_meddra_configs['table_path'].unique()
-                dataset_cache = {}
-                for ds_name in unique_datasets:
-                    if ds_name in processor.datasets:
-                        dataset_info = processor.datasets[ds_name]
-                        dataset_cache[ds_name] = dataset_info.get('data_view', dataset_info['data'])
+                dataset_cache = load_dataset_frames(unique_datasets)
                 
                 # 批量收集所有唯一值和代码映射
                 all_unique_values = set()
@@ -2889,7 +5501,7 @@ def generate_coded_list():
             whodrug_df['translation_direction'] = config.get('translation_direction', 'zh_to_en')
             
             # 批量验证数据集存在性
-            whodrug_df['dataset_exists'] = whodrug_df['table_path'].isin(processor.datasets.keys())
+            whodrug_df['dataset_exists'] = whodrug_df['table_path'].isin(available_datasets)
             valid_whodrug_configs = whodrug_df[whodrug_df['dataset_exists']].copy()
             
             if len(valid_whodrug_configs) == 0:
@@ -2899,11 +5511,7 @@ def generate_coded_list():
                 
                 # 预加载所有需要的数据集
                 unique_datasets = valid_whodrug_configs['table_path'].unique()
-                dataset_cache = {}
-                for ds_name in unique_datasets:
-                    if ds_name in processor.datasets:
-                        dataset_info = processor.datasets[ds_name]
-                        dataset_cache[ds_name] = dataset_info.get('data_view', dataset_info['data'])
+                dataset_cache = load_dataset_frames(unique_datasets)
                 
                 # 批量收集所有唯一值和代码映射
                 all_unique_values = set()
@@ -3409,13 +6017,16 @@ def generate_uncoded_list():
         if not translation_config:
             return jsonify({'success': False, 'message': '未找到翻译库配置，请先保存配置'}), 400
         
-        # 使用全局processor实例获取合并后的数据
-        # 确保processor已经加载了数据
-        if not processor.datasets or getattr(processor, 'current_path', None) != path:
-            success, message = processor.read_sas_files(path, mode='SDTM')
+        # 使用该路径对应项目的processor获取合并后的数据
+        # 确保processor已经以SDTM模式加载了数据
+        processor = get_project_processor(path, create=True)
+        processor.wait_until_loaded()
+        if not processor.datasets or processor.source_mode != 'SDTM':
+            with processor.lock:
+                success, message = processor.read_sas_files(path, mode='SDTM')
+            processor_registry.evict(keep=path)
             if not success:
                 return jsonify({'success': False, 'message': f'读取SAS文件失败: {message}'}), 500
-            processor.current_path = path
         
         # 获取MedDRA和WHODrug配置表中的变量名
         meddra_config = translation_config.get('meddra_config', [])
@@ -3441,7 +6052,10 @@ def generate_uncoded_list():
         all_uncoded_data = []
         
         for dataset_name, dataset_info in processor.datasets.items():
-            df = dataset_info.get('data_view', dataset_info['data'])
+            processor.ensure_loaded(dataset_name)
+            if 'data' not in dataset_info:
+                continue
+            df = processor._get_data_view(dataset_name)
             meta = dataset_info.get('meta')
             
             # 筛选出非编码变量
@@ -3658,10 +6272,14 @@ def generate_dataset_label():
         if not ig_version:
             return jsonify({'success': False, 'message': '未找到IG版本配置'}), 400
         
-        # 使用全局processor实例获取合并后的数据
+        # 使用该路径对应项目的processor获取合并后的数据
         # 确保processor已经加载了数据
+        processor = get_project_processor(path, create=True)
+        processor.wait_until_loaded()
         if not processor.datasets:
-            processor.read_sas_files(path)
+            with processor.lock:
+                processor.read_sas_files(path)
+            processor_registry.evict(keep=path)
         
         # 使用pandas批量处理数据集标签
         import pandas as pd
@@ -3802,10 +6420,14 @@ def generate_variable_label():
         if not ig_version:
             return jsonify({'success': False, 'message': '未找到IG版本配置'}), 400
         
-        # 使用全局processor实例获取合并后的数据
+        # 使用该路径对应项目的processor获取合并后的数据
         # 确保processor已经加载了数据
+        processor = get_project_processor(path, create=True)
+        processor.wait_until_loaded()
         if not processor.datasets:
-            processor.read_sas_files(path)
+            with processor.lock:
+                processor.read_sas_files(path)
+            processor_registry.evict(keep=path)
         
         # 生成变量标签清单
         variable_labels = []
@@ -3815,6 +6437,9 @@ def generate_variable_label():
         
         # 1. 使用向量化操作收集所有数据集和变量信息
         def extract_variable_info(dataset_name, dataset_info):
+            processor.ensure_loaded(dataset_name)
+            if 'data' not in dataset_info:
+                return []
             df = dataset_info['data']
             meta = dataset_info.get('meta')
             
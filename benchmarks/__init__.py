@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""性能对比脚本，在项目根目录以 python -m benchmarks.<脚本名> 运行"""
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+项目级键编码性能对比：键字典 int32 编码（SAS_KEY_ENCODING=True）vs 规范化字符串键
+构造合成研究（DM/AE/LB 及 SUPPDM/SUPPAE/SUPPLB），分别在两种模式下构建 SDTM 预览视图并执行变量合并，
+校验结果一致并输出耗时、峰值内存与键列内存占用
+
+用法（在项目根目录运行）: python -m benchmarks.benchmark_key_encoding [受试者数量]
+"""
+
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from app import SASDataProcessor
+from benchmarks.benchmark_supp_pivot import make_supp
+
+
+def make_study(n_subjects, seed=0):
+    """生成合成研究：主表键列与 SAS 读取结果一致（STUDYID/USUBJID 为字符，--SEQ 为浮点）"""
+    rng = np.random.default_rng(seed)
+    subjects = np.array([f"STUDY01-{i:05d}" for i in range(n_subjects)], dtype=object)
+
+    def domain(prefix, per_subject, extra):
+        n = n_subjects * per_subject
+        frame = pd.DataFrame({
+            'STUDYID': 'STUDY01',
+            'DOMAIN': prefix,
+            'USUBJID': np.repeat(subjects, per_subject),
+            f'{prefix}SEQ': np.tile(np.arange(1, per_subject + 1), n_subjects).astype(float),
+        })
+        for name, values in extra.items():
+            frame[name] = rng.choice(values, n).astype(object)
+        return frame
+
+    dm = pd.DataFrame({'STUDYID': 'STUDY01', 'DOMAIN': 'DM', 'USUBJID': subjects,
+                       'SEX': rng.choice(['M', 'F'], n_subjects).astype(object),
+                       'AGE': rng.integers(18, 80, n_subjects).astype(float)})
+    ae = domain('AE', 8, {'AETERM': ['HEADACHE', 'NAUSEA', 'RASH'], 'AEDECOD': ['Headache', 'Nausea', 'Rash']})
+    lb = domain('LB', 40, {'LBTESTCD': ['ALT', 'AST', 'GLUC'], 'LBORRES': ['1.2', '35', '5.4']})
+    suppdm = make_supp('DM', '', n_subjects, 1, ['RACEOTH', 'DMOTH'], seed=seed + 3)
+    suppdm['IDVAR'] = ''
+    suppdm['IDVARVAL'] = ''
+    datasets = {
+        'DM': dm, 'AE': ae, 'LB': lb, 'SUPPDM': suppdm,
+        'SUPPAE': make_supp('AE', 'AESEQ', n_subjects, 8, ['AETRTEM', 'AESOSP', 'AEREL1', 'AEACN1'], seed=seed + 1),
+        'SUPPLB': make_supp('LB', 'LBSEQ', n_subjects, 40, ['LBCLSIG', 'LBNRIND2', 'LBREASND', 'LBSPCCND'], seed=seed + 2),
+    }
+    return datasets
+
+
+def new_processor(datasets, key_encoding):
+    processor = SASDataProcessor()
+    processor.hide_supp_in_preview = True
+    processor.key_encoding = key_encoding
+    processor.datasets = {name: {'data': df, 'raw_data': df} for name, df in datasets.items()}
+    return processor
+
+
+def key_memory(processor):
+    """键的内存占用：规范化字符串键列（深度字节）与 int32 编码 + 键字典"""
+    string_bytes = code_bytes = 0
+    for index in processor._key_indexes.values():
+        for _, _, normalized in index.normalized_columns.values():
+            string_bytes += int(normalized.memory_usage(index=False, deep=True))
+        for cached in index.encoded_columns.values():
+            code_bytes += cached['codes'].nbytes
+    dictionary_bytes = sum(d['bytes'] for d in processor.key_dictionary.stats().values())
+    return string_bytes, code_bytes, dictionary_bytes
+
+
+MERGE_CONFIG = [
+    {'target': {'dataset': 'AE', 'column': 'AETERM'},
+     'sources': [{'dataset': 'SUPPAE', 'column': 'AETRTEM'}, {'dataset': 'SUPPAE', 'column': 'AESOSP'}]},
+    {'target': {'dataset': 'LB', 'column': 'LBORRES'},
+     'sources': [{'dataset': 'SUPPLB', 'column': 'LBCLSIG'}, {'dataset': 'SUPPLB', 'column': 'LBNRIND2'}]},
+    {'target': {'dataset': 'DM', 'column': 'SEX'}, 'sources': [{'dataset': 'SUPPDM', 'column': 'RACEOTH'}]},
+]
+
+
+def run_mode(datasets, key_encoding):
+    targets = ['DM', 'AE', 'LB']
+    # 峰值内存单独测量（tracemalloc 会显著拖慢计时）
+    tracemalloc.start()
+    new_processor(datasets, key_encoding)._build_preview_views(targets=targets)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    processor = new_processor(datasets, key_encoding)
+    start = time.perf_counter()
+    processor._build_preview_views(targets=targets)
+    t_cold = time.perf_counter() - start
+    views = {n: processor.datasets[n]['data_view'] for n in targets}
+
+    # 视图失效后重建：主表与 SUPP 的键编码/规范化结果已缓存
+    processor._invalidate_views(targets)
+    start = time.perf_counter()
+    processor._build_preview_views(targets=targets)
+    t_warm = time.perf_counter() - start
+
+    start = time.perf_counter()
+    success, message = processor.merge_variables(MERGE_CONFIG)
+    t_merge = time.perf_counter() - start
+    assert success, message
+    merged = {n: processor.datasets[n]['raw_data'] for n in processor.datasets}
+    return {'cold': t_cold, 'warm': t_warm, 'merge': t_merge, 'peak': peak,
+            'memory': key_memory(processor), 'views': views, 'merged': merged}
+
+
+def main():
+    n_subjects = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    warnings.simplefilter('ignore')
+    datasets = make_study(n_subjects)
+    rows = sum(len(df) for df in datasets.values())
+    print(f"📦 合成研究: {n_subjects:,} 名受试者, {len(datasets)} 个数据集, 共 {rows:,} 行")
+
+    before = run_mode(datasets, key_encoding=False)
+    after = run_mode(datasets, key_encoding=True)
+
+    same = all(before['views'][n].equals(after['views'][n]) for n in before['views']) and \
+        all(before['merged'][n].equals(after['merged'][n]) for n in before['merged'])
+
+    mb = 1024 * 1024
+    for label, result in (('字符串键', before), ('int32 编码', after)):
+        string_bytes, code_bytes, dictionary_bytes = result['memory']
+        print(f"📊 {label}:")
+        print(f"   预览视图构建（首次）: {result['cold']:.3f}s  峰值内存 {result['peak'] / mb:.1f} MB")
+        print(f"   预览视图重建（缓存）: {result['warm']:.3f}s")
+        print(f"   变量合并: {result['merge']:.3f}s")
+        print(f"   键内存: 规范化字符串 {string_bytes / mb:.1f} MB, int32 编码 {code_bytes / mb:.1f} MB, "
+              f"键字典 {dictionary_bytes / mb:.1f} MB")
+    print(f"   预览视图重建加速 {before['warm'] / max(after['warm'], 1e-9):.1f}x, "
+          f"变量合并加速 {before['merge'] / max(after['merge'], 1e-9):.1f}x")
+    print(f"   结果一致: {'✅' if same else '❌'}")
+    return 0 if same else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
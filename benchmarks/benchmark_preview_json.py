@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预览 JSON 序列化性能对比：直接序列化（get_dataset_preview_json，行对象/列数组）vs
+原 to_json -> json.loads -> jsonify 三次转换
+构造 10k / 100k / 1M 行的合成 LB 数据集，以全量预览（?all=1）方式输出，校验解析结果一致并输出耗时与响应大小
+
+用法（在项目根目录运行）: python -m benchmarks.benchmark_preview_json [行数 ...]
+"""
+
+import json
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from app import SASDataProcessor, app
+
+
+def make_lb(n_rows, seed=0):
+    """生成合成 LB：字符键列、浮点结果（含缺失与无穷值）、日期时间与低基数字符列"""
+    rng = np.random.default_rng(seed)
+    n_subjects = max(1, n_rows // 40)
+    result = rng.normal(50, 20, n_rows).round(2)
+    result[rng.random(n_rows) < 0.05] = np.nan
+    result[rng.random(n_rows) < 0.001] = np.inf
+    dtc = pd.Series(pd.to_datetime('2024-01-01') + pd.to_timedelta(rng.integers(0, 10 ** 7, n_rows), unit='s'))
+    dtc[rng.random(n_rows) < 0.05] = pd.NaT
+    return pd.DataFrame({
+        'STUDYID': 'STUDY01',
+        'DOMAIN': 'LB',
+        'USUBJID': np.repeat(np.array([f"STUDY01-{i:05d}" for i in range(n_subjects)], dtype=object), 40)[:n_rows],
+        'LBSEQ': np.tile(np.arange(1, 41), n_subjects)[:n_rows].astype(float),
+        'LBTESTCD': rng.choice(['ALT', 'AST', 'GLUC', 'HGB'], n_rows).astype(object),
+        'LBTEST': rng.choice(['丙氨酸氨基转移酶', '天门冬氨酸氨基转移酶', '葡萄糖', '血红蛋白'], n_rows).astype(object),
+        'LBORRES': rng.choice(['1.2', '35', '5.4', '', 'NOT DONE'], n_rows).astype(object),
+        'LBSTRESN': result,
+        'LBSTNRLO': rng.choice([0.0, 3.5, np.nan], n_rows),
+        'LBNRIND': rng.choice(['NORMAL', 'HIGH', 'LOW', None], n_rows).astype(object),
+        'VISITNUM': rng.integers(1, 10, n_rows).astype(float),
+        'LBDTC': dtc,
+    })
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def run_case(n_rows):
+    df = make_lb(n_rows)
+    processor = SASDataProcessor()
+    processor.datasets['LB'] = {'data': df, 'raw_data': df}
+
+    with app.app_context():
+        legacy, t_legacy = timed(lambda: app.json.response(processor.get_dataset_preview('LB', limit=None)).get_data())
+    records, t_records = timed(lambda: processor.get_dataset_preview_json('LB', limit=None))
+    columns, t_columns = timed(lambda: processor.get_dataset_preview_json('LB', limit=None, shape='columns'))
+
+    expected = json.loads(legacy)
+    actual = json.loads(records)
+    columnar = json.loads(columns)
+    same = expected['data'] == actual['data'] and \
+        expected['data'] == [dict(zip(columnar['columns'], row)) for row in zip(*columnar['data'])]
+
+    mb = 1024 * 1024
+    print(f"📊 {n_rows:,} 行 x {df.shape[1]} 列:")
+    print(f"   to_json + json.loads + jsonify: {t_legacy:.3f}s  {len(legacy) / mb:.1f} MB")
+    print(f"   直接序列化（行对象）: {t_records:.3f}s  {len(records) / mb:.1f} MB  (加速 {t_legacy / max(t_records, 1e-9):.1f}x)")
+    print(f"   直接序列化（列数组）: {t_columns:.3f}s  {len(columns) / mb:.1f} MB  (加速 {t_legacy / max(t_columns, 1e-9):.1f}x)")
+    print(f"   结果一致: {'✅' if same else '❌'}")
+    return same
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    warnings.simplefilter('ignore')
+    ok = True
+    for n_rows in sizes:
+        ok = run_case(n_rows) and ok
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SUPP 转置性能对比：supp_pivot.pivot_first vs DataFrame.pivot_table(aggfunc='first')
+构造大规模 SUPPAE / SUPPLB 合成数据，校验两者结果一致并输出耗时
+
+用法（在项目根目录运行）: python -m benchmarks.benchmark_supp_pivot [受试者数量]
+"""
+
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from supp_pivot import pivot_first
+
+
+def make_supp(rdomain, idvar, n_subjects, records_per_subject, qnams, seed=0):
+    """生成合成 SUPP 数据：每个受试者若干记录，每条记录若干 QNAM，并混入少量重复与空值"""
+    rng = np.random.default_rng(seed)
+    subjects = np.array([f"STUDY01-{i:05d}" for i in range(n_subjects)], dtype=object)
+    n_records = n_subjects * records_per_subject
+    usubjid = np.repeat(subjects, records_per_subject)
+    seq = np.tile(np.arange(1, records_per_subject + 1), n_subjects).astype(str).astype(object)
+
+    frames = []
+    for qnam in qnams:
+        # 每个 QNAM 只覆盖部分记录，模拟稀疏的补充限定符
+        keep = rng.random(n_records) < 0.7
+        qval = rng.choice(['Y', 'N', 'NOT DONE', 'RELATED', ''], keep.sum()).astype(object)
+        frames.append(pd.DataFrame({
+            'STUDYID': 'STUDY01',
+            'RDOMAIN': rdomain,
+            'USUBJID': usubjid[keep],
+            'IDVAR': idvar,
+            'IDVARVAL': seq[keep],
+            'QNAM': qnam,
+            'QLABEL': f"{qnam} label",
+            'QVAL': qval,
+        }))
+    df = pd.concat(frames, ignore_index=True)
+    # 追加约 1% 的重复键（取第一个值）与空 QVAL
+    dup = df.sample(frac=0.01, random_state=seed).copy()
+    dup['QVAL'] = 'DUPLICATE'
+    df = pd.concat([df, dup], ignore_index=True)
+    df.loc[df.sample(frac=0.005, random_state=seed + 1).index, 'QVAL'] = None
+    return df
+
+
+def run_case(name, df, index):
+    """分别计时两种实现，并校验结果一致"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        start = time.perf_counter()
+        expected = df.pivot_table(index=index, columns='QNAM', values='QVAL', aggfunc='first').reset_index()
+        t_pivot_table = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = pivot_first(df, index)
+    t_pivot_first = time.perf_counter() - start
+
+    # 含空 QVAL 时 pivot_table 的行顺序不保证按键排序，这里按键排序后再比较
+    expected = expected.sort_values(index).reset_index(drop=True)
+    actual = actual.sort_values(index).reset_index(drop=True)
+    same = expected.equals(actual)
+
+    print(f"📊 {name}: {len(df):,} 行 -> {actual.shape[0]:,} x {actual.shape[1]}")
+    print(f"   pivot_table: {t_pivot_table:.3f}s")
+    print(f"   pivot_first: {t_pivot_first:.3f}s  (加速 {t_pivot_table / max(t_pivot_first, 1e-9):.1f}x)")
+    print(f"   结果一致: {'✅' if same else '❌'}")
+    return same
+
+
+def main():
+    n_subjects = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    index = ['STUDYID', 'USUBJID', 'IDVARVAL']
+
+    suppae = make_supp('AE', 'AESEQ', n_subjects, 8, ['AETRTEM', 'AESOSP', 'AEREL1', 'AEREL2', 'AEACN1', 'AEYNDESC'], seed=1)
+    supplb = make_supp('LB', 'LBSEQ', n_subjects, 40, ['LBCLSIG', 'LBNRIND2', 'LBREASND', 'LBSPCCND'], seed=2)
+
+    ok = run_case('SUPPAE', suppae, index)
+    ok = run_case('SUPPLB', supplb, index) and ok
+    ok = run_case('SUPPLB (STUDYID/USUBJID)', supplb, ['STUDYID', 'USUBJID']) and ok
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+"""
+SAS数据集读取辅助函数
+
+本模块中的函数需要在子进程中执行（进程池读取），因此不依赖 app.py 中的
+Flask 应用与数据库实例，保证在 Windows spawn 模式下也能被子进程安全导入。
+"""
+
+import os
+import json
+import time
+import hashlib
+import datetime
+import threading
+from pathlib import Path
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+import pandas as pd
+import pyreadstat
+
+# pyarrow 为可选依赖，仅用于数据集的磁盘列式缓存（Feather/Arrow IPC）
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+# Windows 下命名共享内存在最后一个句柄关闭时即被回收，子进程退出后父进程无法再打开，
+# 因此仅在 POSIX 平台使用共享内存，其余平台回传因子化后的紧凑数组
+USE_SHARED_MEMORY = os.name == 'posix'
+
+# 超大文件拆分读取：文件大小超过阈值（MB）时按行区间拆分到多个进程并行读取，0 表示关闭
+LARGE_FILE_THRESHOLD_MB = float(os.getenv('SAS_LARGE_FILE_THRESHOLD_MB', '512'))
+# 单个大文件拆分读取使用的进程数，默认为CPU核心数
+LARGE_FILE_WORKERS = int(os.getenv('SAS_LARGE_FILE_WORKERS', '0')) or None
+# 多线程读取时同一时刻只允许一个大文件拆分读取，避免进程数随线程数成倍增加；
+# 该锁只在本进程内有效，因此进程池读取时子进程不拆分大文件
+_split_read_lock = threading.Lock()
+
+
+def file_signature(file_path, with_hash=False):
+    """文件签名：路径、大小、修改时间，可选内容哈希（SHA1），用于判断文件是否变化"""
+    stat = os.stat(file_path)
+    signature = {
+        'path': os.path.abspath(file_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns
+    }
+    if with_hash:
+        sha1 = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha1.update(chunk)
+        signature['sha1'] = sha1.hexdigest()
+    return signature
+
+
+def _metadata_to_json(meta):
+    """将 pyreadstat 元数据转换为 JSON 文本（缓存用，不使用 pickle）。
+    日期时间与非字符串键的字典（如值标签）加标记保存，无法表示为 JSON 的属性跳过"""
+    def encode(value):
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return {'__datetime__': value.isoformat()}
+        if isinstance(value, dict):
+            if all(isinstance(k, str) for k in value):
+                return {k: encode(v) for k, v in value.items()}
+            return {'__items__': [[encode(k), encode(v)] for k, v in value.items()]}
+        if isinstance(value, (list, tuple)):
+            return [encode(v) for v in value]
+        if isinstance(value, (np.integer, np.floating)):
+            return value.item()
+        return value
+
+    fields = {}
+    for name, value in vars(meta).items():
+        try:
+            fields[name] = json.loads(json.dumps(encode(value)))
+        except (TypeError, ValueError):
+            continue
+    return json.dumps(fields, ensure_ascii=False)
+
+
+def _metadata_from_json(text):
+    """由 _metadata_to_json 的结果还原元数据对象（pyreadstat.metadata_container）"""
+    def decode(value):
+        if isinstance(value, dict):
+            if set(value) == {'__datetime__'}:
+                return datetime.datetime.fromisoformat(value['__datetime__'])
+            if set(value) == {'__items__'}:
+                return {decode(k): decode(v) for k, v in value['__items__']}
+            return {k: decode(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [decode(v) for v in value]
+        return value
+
+    meta = pyreadstat.metadata_container()
+    for name, value in json.loads(text).items():
+        setattr(meta, name, decode(value))
+    return meta
+
+
+class DatasetCache:
+    """已解析SAS数据集的磁盘缓存（Feather/Arrow IPC，不压缩以便内存映射读取；元数据保存为 JSON）。
+
+    缓存键由文件路径、大小、修改时间及可选的内容哈希生成，文件变化后自动失效；
+    缓存总大小超过上限时按最近最少使用（LRU）顺序删除。默认关闭，需安装 pyarrow 并设置 SAS_CACHE_ENABLED=True。
+    """
+
+    def __init__(self, cache_dir, max_mb=4096, use_hash=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_mb * 1024 * 1024
+        self.use_hash = use_hash
+
+    @classmethod
+    def from_env(cls):
+        """根据环境变量创建缓存；未启用或缺少 pyarrow 时返回 None"""
+        if feather is None or os.getenv('SAS_CACHE_ENABLED', 'False').lower() not in ('1', 'true', 'yes'):
+            return None
+        default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'sas')
+        return cls(
+            os.getenv('SAS_CACHE_DIR', default_dir),
+            float(os.getenv('SAS_CACHE_MAX_MB', '4096')),
+            os.getenv('SAS_CACHE_USE_HASH', 'False').lower() in ('1', 'true', 'yes')
+        )
+
+    def _key(self, file_path):
+        signature = file_signature(file_path, self.use_hash)
+        return hashlib.sha1(repr(sorted(signature.items())).encode('utf-8')).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.feather', base + '.meta.json'
+
+    def load(self, file_path, columns=None):
+        """读取缓存（内存映射），columns 指定时仅读取这些列；未命中或缓存损坏时返回 None"""
+        try:
+            data_path, meta_path = self._paths(self._key(file_path))
+            if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+                return None
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = _metadata_from_json(f.read())
+            df = feather.read_table(data_path, columns=columns, memory_map=True).to_pandas()
+            # 更新访问时间供 LRU 淘汰使用
+            os.utime(data_path)
+            return df, meta
+        except Exception as e:
+            print(f"读取缓存失败 {file_path}: {e}")
+            return None
+
+    def store(self, file_path, df, meta):
+        """写入缓存；无法转换为 Arrow 的数据集（如混合类型列）跳过缓存"""
+        tmp_paths = []
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            data_path, meta_path = self._paths(self._key(file_path))
+            tmp_suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+            tmp_paths = [data_path + tmp_suffix, meta_path + tmp_suffix]
+            feather.write_feather(df, tmp_paths[0], compression='uncompressed')
+            with open(tmp_paths[1], 'w', encoding='utf-8') as f:
+                f.write(_metadata_to_json(meta))
+            os.replace(tmp_paths[1], meta_path)
+            os.replace(tmp_paths[0], data_path)
+        except Exception as e:
+            print(f"写入缓存失败 {file_path}: {e}")
+            for path in tmp_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        """缓存总大小超过上限时，按最近访问时间从旧到新删除缓存项"""
+        if self.max_bytes <= 0 or not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.feather'):
+                continue
+            data_path = os.path.join(self.cache_dir, name)
+            meta_path = data_path[:-len('.feather')] + '.meta.json'
+            try:
+                size = os.path.getsize(data_path) + (os.path.getsize(meta_path) if os.path.exists(meta_path) else 0)
+                entries.append((os.path.getmtime(data_path), size, data_path, meta_path))
+            except OSError:
+                continue
+        total = sum(e[1] for e in entries)
+        for _, size, data_path, meta_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in (data_path, meta_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+    def stats(self):
+        """缓存统计：条目数与总字节数"""
+        if not os.path.isdir(self.cache_dir):
+            return {'entries': 0, 'total_bytes': 0, 'max_bytes': self.max_bytes}
+        files = [os.path.join(self.cache_dir, n) for n in os.listdir(self.cache_dir)]
+        return {
+            'entries': sum(1 for f in files if f.endswith('.feather')),
+            'total_bytes': sum(os.path.getsize(f) for f in files if os.path.isfile(f)),
+            'max_bytes': self.max_bytes
+        }
+
+
+def read_sas7bdat(file_path, split_threshold_mb=None, split_workers=None, usecols=None):
+    """读取单个SAS文件；超过阈值的大文件按行区间拆分为多个进程并行读取后按顺序拼接。
+    usecols 指定时仅读取这些列（列投影读取）。
+
+    Returns:
+        (df, meta, workers)，workers 为实际使用的读取进程数（未拆分时为1）
+    """
+    threshold_mb = LARGE_FILE_THRESHOLD_MB if split_threshold_mb is None else float(split_threshold_mb)
+    if threshold_mb > 0 and os.path.getsize(file_path) >= threshold_mb * 1024 * 1024:
+        workers = int(split_workers or LARGE_FILE_WORKERS or os.cpu_count() or 4)
+        if workers > 1:
+            try:
+                with _split_read_lock:
+                    df, meta = pyreadstat.read_file_multiprocessing(
+                        pyreadstat.read_sas7bdat, file_path, num_processes=workers, usecols=usecols
+                    )
+                return df, meta, workers
+            except Exception as e:
+                # 拆分读取失败时（如行数元数据缺失）回退为整文件读取
+                print(f"拆分读取 {file_path} 失败，回退为单进程读取: {e}")
+    df, meta = pyreadstat.read_sas7bdat(file_path, usecols=usecols)
+    return df, meta, 1
+
+
+def compact_dataframe(df, max_category_ratio=0.5):
+    """压缩数据类型：低基数字符列转为 category，无缺失且取值均为整数的浮点列无损降为最小整数类型。
+
+    Returns:
+        (compacted_df, report)，report 包含压缩前后内存字节数及被转换的列
+    """
+    before_bytes = int(df.memory_usage(index=False, deep=True).sum())
+    columns = {}
+    categorical, downcast = [], []
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == object and len(values) > 0:
+            if pd.api.types.infer_dtype(values, skipna=True) == 'string' \
+                    and values.nunique(dropna=False) <= len(values) * max_category_ratio:
+                columns[col] = values.astype('category')
+                categorical.append(col)
+                continue
+        elif values.dtype.kind == 'f' and len(values) > 0:
+            array = values.to_numpy()
+            if not np.isnan(array).any() and np.abs(array).max() < 2 ** 53 and np.array_equal(array, np.trunc(array)):
+                columns[col] = pd.to_numeric(values.astype(np.int64), downcast='integer')
+                downcast.append(col)
+                continue
+        columns[col] = values
+    compacted = pd.DataFrame(columns, index=df.index) if (categorical or downcast) else df
+    after_bytes = int(compacted.memory_usage(index=False, deep=True).sum())
+    return compacted, {
+        'before_bytes': before_bytes,
+        'after_bytes': after_bytes,
+        'categorical_columns': categorical,
+        'downcast_columns': downcast
+    }
+
+
+def restore_compacted_dtypes(df, downcast_columns):
+    """将降为整数的列恢复为 float64（预览/拼接等需要与原始读取结果一致的输出时使用）"""
+    restore = {c: 'float64' for c in downcast_columns if c in df.columns and df[c].dtype.kind in 'iu'}
+    return df.astype(restore) if restore else df
+
+
+def _export_column(values: pd.Series):
+    """将单列写入共享内存，返回可跨进程传递的列描述信息。
+
+    数值/日期列直接写入原始缓冲区；字符列先因子化为 int32 编码写入共享内存，
+    仅把去重后的取值随描述信息回传，避免逐个字符串序列化。
+    """
+    if values.dtype == object:
+        codes, uniques = pd.factorize(values)
+        uniques = np.asarray(uniques, dtype=object)
+        missing = codes < 0
+        if missing.any():
+            # factorize 会把 None 统一为 NaN；缺失值按列中首个缺失值原样回传，与线程读取的结果一致
+            uniques = np.append(uniques, np.array([values.iloc[int(missing.argmax())]], dtype=object))
+            codes[missing] = len(uniques) - 1
+        array = codes.astype(np.int32, copy=False)
+        spec = {'kind': 'factorized', 'uniques': uniques}
+    else:
+        array = np.ascontiguousarray(values.to_numpy())
+        spec = {'kind': 'array'}
+
+    spec.update({'name': values.name, 'dtype': array.dtype.str, 'length': len(array)})
+    if not USE_SHARED_MEMORY:
+        spec['inline'] = array
+        return spec
+
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    try:
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    finally:
+        shm.close()
+    # 共享内存段的所有权交给父进程（由父进程读取后 unlink），子进程不再跟踪
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    spec['shm_name'] = shm.name
+    return spec
+
+
+def _import_column(spec) -> np.ndarray:
+    """从共享内存恢复单列数据，恢复后立即释放共享内存段。"""
+    if 'inline' in spec:
+        array = spec['inline']
+    else:
+        shm = shared_memory.SharedMemory(name=spec['shm_name'])
+        try:
+            dtype = np.dtype(spec['dtype'])
+            array = np.ndarray((spec['length'],), dtype=dtype, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+    if spec['kind'] == 'factorized':
+        return spec['uniques'].take(array)
+    return array
+
+
+def release_shared_columns(specs) -> None:
+    """释放未被读取的共享内存段（父进程恢复失败时调用）。"""
+    for spec in specs or []:
+        if 'shm_name' not in spec:
+            continue
+        try:
+            shm = shared_memory.SharedMemory(name=spec['shm_name'])
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def read_sas_metadata(file_path):
+    """仅读取SAS文件元数据（行数、列名、标签），不加载数据。返回 (meta, error)"""
+    try:
+        _, meta = pyreadstat.read_sas7bdat(file_path, metadataonly=True)
+        return meta, None
+    except Exception as e:
+        return None, str(e)
+
+
+def read_sas_file_to_shared_memory(file_path, split_threshold_mb=None, split_workers=None, cache=None):
+    """子进程入口：读取SAS文件并将各列放入共享内存。
+    进程池调用时传入 split_workers=1，子进程内不再拆分读取大文件。
+
+    Returns:
+        (dataset_name, payload, error)。payload 包含列描述、meta 及读取耗时，
+        DataFrame 本身不经过 pickle 传输。
+    """
+    dataset_name = Path(file_path).stem
+    try:
+        start = time.perf_counter()
+        df, meta, workers = read_sas7bdat(file_path, split_threshold_mb, split_workers)
+        read_seconds = time.perf_counter() - start
+        if cache is not None:
+            cache.store(file_path, df, meta)
+
+        specs = []
+        try:
+            for col in df.columns:
+                specs.append(_export_column(df[col]))
+        except Exception:
+            release_shared_columns(specs)
+            raise
+        export_seconds = time.perf_counter() - start - read_seconds
+
+        return dataset_name, {
+            'columns': specs,
+            'meta': meta,
+            'rows': len(df),
+            'split_workers': workers,
+            'read_seconds': read_seconds,
+            'export_seconds': export_seconds
+        }, None
+    except Exception as e:
+        return dataset_name, None, str(e)
+
+
+def rebuild_dataframe(payload) -> pd.DataFrame:
+    """在父进程中根据共享内存列描述重建 DataFrame。"""
+    specs = payload['columns']
+    data = {}
+    try:
+        for i, spec in enumerate(specs):
+            data[spec['name']] = _import_column(spec)
+    except Exception:
+        release_shared_columns(specs[i:])
+        raise
+    return pd.DataFrame(data, columns=[spec['name'] for spec in specs])
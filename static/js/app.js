@@ -11,6 +11,15 @@ let isMergeExecuted = false; // 跟踪合并执行状态
 // 虚拟滚动状态：按数据集维护偏移量与总行数
 const virtualState = {}; 
 
+// 为依赖已加载数据集的请求附加当前项目路径，后端按路径定位对应项目
+function withProjectPath(url) {
+    if (!lastDataPath) {
+        return url;
+    }
+    const separator = url.includes('?') ? '&' : '?';
+    return `${url}${separator}path=${encodeURIComponent(lastDataPath)}`;
+}
+
 // DOM元素 - 基础设置
 const translationModeSelect = document.getElementById('translationMode');
 const translationDirectionSelect = document.getElementById('translationDirection');
@@ -34,6 +43,7 @@ const previewContent = document.getElementById('previewContent');
 const currentDatasetTitle = document.getElementById('currentDatasetTitle');
 const refreshPreviewBtn = document.getElementById('refreshPreviewBtn');
 const showAllDataBtn = document.getElementById('showAllDataBtn');
+const previewSearchInput = document.getElementById('previewSearchInput');
 const previewSummary = document.getElementById('previewSummary');
 const datasetStats = document.getElementById('datasetStats');
 const backToSetupBtn = document.getElementById('backToSetupBtn');
@@ -51,9 +61,67 @@ const previewState = {
     loading: false,
     hasMore: true,
     columns: [],
-    allData: []
+    allData: [],
+    streamController: null,
+    // 服务端排序与全局搜索：sort 为 'COL' 或 '-COL'（降序），search 为搜索文本
+    sort: '',
+    search: '',
+    // 虚拟滚动状态（大数据集/宽表），为 null 时使用普通表格
+    virtual: null
+};
+
+// 虚拟滚动参数：行数或列数达到阈值的数据集按视窗（行窗口 x 列窗口）分块取数，只渲染可见区域的单元格
+const VIRTUAL_SCROLL = {
+    minRows: 5000,
+    minColumns: 60,
+    rowHeight: 32,
+    columnWidth: 160,
+    headerHeight: 40,
+    rowBlock: 100,       // 每次请求的行数
+    columnBlock: 20,     // 每次请求的列数
+    maxBlocks: 120,      // 前端缓存的数据块上限
+    maxRequests: 6,      // 同时进行的请求数上限
+    overscanRows: 10,
+    overscanColumns: 2
 };
 
+// 当前预览的排序/搜索查询参数（附加在 /get_dataset 请求上）
+function previewQueryString() {
+    let query = '';
+    if (previewState.sort) {
+        query += `&sort=${encodeURIComponent(previewState.sort)}`;
+    }
+    if (previewState.search) {
+        query += `&search=${encodeURIComponent(previewState.search)}`;
+    }
+    return query;
+}
+
+// 点击表头切换排序：升序 -> 降序 -> 不排序，由服务端排序后重新加载
+function togglePreviewSort(column) {
+    if (previewState.sort === column) {
+        previewState.sort = `-${column}`;
+    } else if (previewState.sort === `-${column}`) {
+        previewState.sort = '';
+    } else {
+        previewState.sort = column;
+    }
+    if (currentSelectedDataset) {
+        loadDatasetPreview(currentSelectedDataset, true);
+    }
+}
+
+// 表头文字附带当前排序方向
+function previewHeaderLabel(column) {
+    if (previewState.sort === column) {
+        return `${column} <i class="fas fa-sort-up ms-1"></i>`;
+    }
+    if (previewState.sort === `-${column}`) {
+        return `${column} <i class="fas fa-sort-down ms-1"></i>`;
+    }
+    return column;
+}
+
 // DOM元素 - 合并配置
 const currentConfigSection = document.getElementById('currentConfigSection');
 const currentConfigIndexSpan = document.getElementById('currentConfigIndex');
@@ -370,6 +438,20 @@ function initializeEventListeners() {
         });
     }
     
+    if (previewSearchInput) {
+        // 输入停顿后按搜索文本由服务端筛选并重新加载
+        let searchTimer = null;
+        previewSearchInput.addEventListener('input', () => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => {
+                previewState.search = previewSearchInput.value.trim();
+                if (currentSelectedDataset) {
+                    loadDatasetPreview(currentSelectedDataset, true);
+                }
+            }, 300);
+        });
+    }
+    
     if (showAllDataBtn) {
         showAllDataBtn.addEventListener('click', () => {
             if (currentSelectedDataset) {
@@ -623,7 +705,8 @@ async function readDatasets() {
             body: JSON.stringify({
                 path: path,
                 mode: currentMode,
-                translation_direction: currentMode === 'SDTM' ? translationDirectionSelect.value : null
+                translation_direction: currentMode === 'SDTM' ? translationDirectionSelect.value : null,
+                two_phase: true
             })
         });
 
@@ -634,6 +717,10 @@ async function readDatasets() {
             displayDatasets();
             showAlert(result.message, 'success');
             lastDataPath = path;
+            if (result.load_state === 'loading') {
+                // 两阶段加载：元数据已返回，轮询后台数据加载状态
+                pollDatasetsStatus();
+            }
             
             // 启用下一步
             nextToPreviewContainer.style.display = 'block';
@@ -665,6 +752,32 @@ async function readDatasets() {
     }
 }
 
+// 轮询后台数据加载状态，加载完成后刷新数据集信息
+async function pollDatasetsStatus(interval = 1000) {
+    try {
+        const response = await fetch(withProjectPath('/datasets_status'));
+        const status = await response.json();
+        if (status.load_state === 'loading') {
+            setTimeout(() => pollDatasetsStatus(interval), interval);
+            return;
+        }
+        if (status.load_state === 'ready' && status.datasets_info) {
+            currentDatasets = status.datasets_info;
+            displayDatasets();
+            const failed = Object.entries(status.datasets || {}).filter(([, s]) => s.status === 'error');
+            if (failed.length > 0) {
+                showAlert(`数据加载完成，${failed.length} 个数据集读取失败: ${failed.map(([name]) => name).join(', ')}`, 'warning');
+            } else {
+                showAlert('数据集已全部加载完成', 'success');
+            }
+        } else if (status.load_state === 'error') {
+            showAlert('后台加载数据集失败', 'error');
+        }
+    } catch (error) {
+        showAlert('获取加载状态失败: ' + error.message, 'error');
+    }
+}
+
 function displayDatasets() {
     if (Object.keys(currentDatasets).length === 0) {
         showAlert('未找到数据集', 'warning');
@@ -753,6 +866,21 @@ async function loadDatasetPreview(datasetName, forceRefresh = false) {
         return;
     }
     
+    // 中止上一个数据集仍在进行的流式加载
+    if (previewState.streamController) {
+        previewState.streamController.abort();
+        previewState.streamController = null;
+    }
+    
+    // 切换数据集时清除排序与搜索条件
+    if (previewState.currentDataset !== datasetName) {
+        previewState.sort = '';
+        previewState.search = '';
+        if (previewSearchInput) {
+            previewSearchInput.value = '';
+        }
+    }
+    
     // 重置状态
     previewState.currentDataset = datasetName;
     previewState.loadedRows = 0;
@@ -771,14 +899,41 @@ async function loadDatasetPreview(datasetName, forceRefresh = false) {
     
     // 显示控制按钮
     refreshPreviewBtn.style.display = 'inline-block';
+    if (previewSearchInput) {
+        previewSearchInput.style.display = 'inline-block';
+    }
     // 隐藏"显示全部"按钮，因为默认就加载所有列
     showAllDataBtn.style.display = 'none';
     
     // 清空内容并开始加载
     previewContent.innerHTML = '';
+    previewState.virtual = null;
     
-    // 直接加载所有数据（包括所有列），但保持行数限制
-    await loadAllData();
+    // 大数据集/宽表按可见区域分块取数（虚拟滚动），其余直接加载所有数据（包括所有列）
+    if (dsInfo.rows >= VIRTUAL_SCROLL.minRows || dsInfo.columns >= VIRTUAL_SCROLL.minColumns) {
+        await loadVirtualPreview();
+    } else {
+        await loadAllData();
+    }
+}
+
+// 列数组形式的预览（format=columns）还原为表格使用的行对象数组
+function columnarToRows(dataset) {
+    if (dataset.format !== 'columns') {
+        return dataset.data || [];
+    }
+    const columns = dataset.columns || [];
+    const arrays = dataset.data || [];
+    const rowCount = arrays.length > 0 ? arrays[0].length : 0;
+    const rows = new Array(rowCount);
+    for (let i = 0; i < rowCount; i++) {
+        const row = {};
+        for (let j = 0; j < columns.length; j++) {
+            row[columns[j]] = arrays[j][i];
+        }
+        rows[i] = row;
+    }
+    return rows;
 }
 
 async function loadNextBatch() {
@@ -792,9 +947,10 @@ async function loadNextBatch() {
     showBatchLoadingIndicator();
     
     try {
-        const url = `/get_dataset/${previewState.currentDataset}?limit=${previewState.pageSize}&offset=${previewState.loadedRows}`;
+        const url = withProjectPath(`/get_dataset/${previewState.currentDataset}?limit=${previewState.pageSize}&offset=${previewState.loadedRows}&format=columns${previewQueryString()}`);
         const response = await fetch(url);
         const dataset = await response.json();
+        dataset.data = columnarToRows(dataset);
 
         if (dataset.error) {
             showDatasetError(dataset.error);
@@ -827,6 +983,31 @@ async function loadNextBatch() {
     }
 }
 
+// 逐行读取 NDJSON 流式响应，每解析出一行调用一次 onMessage
+async function readNdjsonStream(response, onMessage) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+        let newline;
+        while ((newline = buffer.indexOf('\n')) >= 0) {
+            const line = buffer.slice(0, newline);
+            buffer = buffer.slice(newline + 1);
+            if (line.trim()) {
+                onMessage(JSON.parse(line));
+            }
+        }
+        if (done) {
+            break;
+        }
+    }
+    if (buffer.trim()) {
+        onMessage(JSON.parse(buffer));
+    }
+}
+
 async function loadAllData() {
     if (previewState.loading) {
         return;
@@ -835,34 +1016,275 @@ async function loadAllData() {
     previewState.loading = true;
     showBatchLoadingIndicator();
     
+    // 全量数据以 NDJSON 分块流式加载：首行为元数据，其后每行为一块列数组，收到即渲染；
+    // 切换数据集时中止请求，服务端随连接关闭停止输出
+    const controller = new AbortController();
+    previewState.streamController = controller;
+    
     try {
-        const url = `/get_dataset/${previewState.currentDataset}?all=1`;
-        const response = await fetch(url);
-        const dataset = await response.json();
-
-        if (dataset.error) {
-            showDatasetError(dataset.error);
+        const url = withProjectPath(`/get_dataset/${previewState.currentDataset}?all=1&stream=1&format=columns${previewQueryString()}`);
+        const response = await fetch(url, { signal: controller.signal });
+        if (!response.ok) {
+            const dataset = await response.json().catch(() => ({}));
+            showDatasetError(dataset.error || `HTTP ${response.status}`);
             return;
         }
 
-        // 重置状态并设置全部数据
-        previewState.allData = dataset.data || [];
-        previewState.loadedRows = dataset.data?.length || 0;
+        let header = null;
+        let rendered = false;
+        await readNdjsonStream(response, message => {
+            if (!header) {
+                header = message;
+                previewState.allData = [];
+                previewState.loadedRows = 0;
+                previewState.totalRows = header.total_rows;
+                previewState.columns = header.columns || [];
+                return;
+            }
+            const rows = columnarToRows({ format: 'columns', columns: header.columns, data: message.data });
+            previewState.allData.push(...rows);
+            previewState.loadedRows += rows.length;
+            previewState.hasMore = previewState.loadedRows < previewState.totalRows;
+            if (!rendered) {
+                renderDatasetPreviewStructure({ ...header, data: rows });
+                rendered = true;
+            } else {
+                appendDataToTable(rows);
+            }
+            updateLoadingStatus();
+        });
+
         previewState.hasMore = false;
-        previewState.columns = dataset.columns || [];
-        
-        // 重新渲染整个结构
-        renderDatasetPreviewStructure(dataset);
+        if (!rendered && header) {
+            renderDatasetPreviewStructure({ ...header, data: [] });
+        }
         updateLoadingStatus();
         
         // 隐藏"显示全部"按钮
         showAllDataBtn.style.display = 'none';
         
     } catch (error) {
-        showDatasetError('加载全部数据失败: ' + error.message);
+        if (error.name !== 'AbortError') {
+            showDatasetError('加载全部数据失败: ' + error.message);
+        }
     } finally {
-        previewState.loading = false;
-        hideBatchLoadingIndicator();
+        // 已被新的加载取代时不改动其状态
+        if (previewState.streamController === controller) {
+            previewState.streamController = null;
+            previewState.loading = false;
+            hideBatchLoadingIndicator();
+        }
+    }
+}
+
+// 虚拟滚动预览：先取结果行数与列结构确定滚动区域大小，再随滚动按需请求可见区域的数据块
+async function loadVirtualPreview() {
+    const state = {
+        datasetName: previewState.currentDataset,
+        query: previewQueryString(),
+        columns: [],
+        totalRows: 0,
+        blocks: new Map(),   // `${行块}:${列块}` -> 列数组，按最近使用顺序排列
+        pending: new Set(),
+        frame: null
+    };
+    previewState.virtual = state;
+    previewContent.innerHTML = `
+        <div class="text-center py-5">
+            <div class="spinner-border text-primary" role="status"></div>
+        </div>
+    `;
+    
+    try {
+        const response = await fetch(withProjectPath(`/get_dataset_schema/${state.datasetName}?${state.query.slice(1)}`));
+        const schema = await response.json();
+        // 等待期间已切换数据集或查询条件
+        if (previewState.virtual !== state) {
+            return;
+        }
+        if (!response.ok || schema.error) {
+            showDatasetError(schema.error || `HTTP ${response.status}`);
+            return;
+        }
+        state.columns = schema.columns.map(col => col.name);
+        state.labels = Object.fromEntries(schema.columns.map(col => [col.name, col.label]));
+        state.totalRows = schema.total_rows;
+        previewState.columns = state.columns;
+        previewState.totalRows = schema.total_rows;
+        previewState.hasMore = false;
+        renderVirtualPreviewStructure(schema);
+        renderVirtualViewport();
+    } catch (error) {
+        if (previewState.virtual === state) {
+            showDatasetError('加载数据失败: ' + error.message);
+        }
+    }
+}
+
+function renderVirtualPreviewStructure(schema) {
+    const state = previewState.virtual;
+    const { rowHeight, columnWidth, headerHeight } = VIRTUAL_SCROLL;
+    let content = '';
+    
+    const dsInfo = currentDatasets[schema.dataset_name];
+    if (dsInfo && Array.isArray(schema.supp_failed_columns)) {
+        dsInfo.supp_failed_columns = schema.supp_failed_columns;
+    }
+    if (dsInfo && dsInfo.supp_failed_columns && dsInfo.supp_failed_columns.length > 0) {
+        content += renderSuppFailureAlert(schema.dataset_name, dsInfo);
+    }
+    
+    if (state.totalRows > 0) {
+        content += `
+            <div class="virtual-grid-container" id="virtualGridContainer">
+                <div class="virtual-grid-canvas" style="width: ${state.columns.length * columnWidth}px; height: ${headerHeight + state.totalRows * rowHeight}px;">
+                    <div class="virtual-grid-header" id="virtualGridHeader" style="height: ${headerHeight}px;"></div>
+                    <div id="virtualGridBody"></div>
+                </div>
+            </div>
+            <div id="loadingStatusIndicator" class="text-center py-2 text-muted"></div>
+        `;
+    } else {
+        content += `
+            <div class="alert alert-info text-center">
+                <i class="fas fa-info-circle me-2"></i>
+                ${state.query ? '没有符合条件的数据' : '该数据集暂无数据'}
+            </div>
+        `;
+    }
+    previewContent.innerHTML = content;
+    
+    const container = document.getElementById('virtualGridContainer');
+    if (container) {
+        // 滚动时每帧最多重绘一次
+        container.addEventListener('scroll', () => {
+            if (!state.frame) {
+                state.frame = requestAnimationFrame(() => {
+                    state.frame = null;
+                    renderVirtualViewport();
+                });
+            }
+        });
+    }
+}
+
+function escapePreviewText(value) {
+    return String(value).replace(/[&<>"]/g, ch => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;' }[ch]));
+}
+
+// 按当前滚动位置渲染可见行列（含少量预渲染），缺失的数据块向服务端请求，返回后重绘
+function renderVirtualViewport() {
+    const state = previewState.virtual;
+    const container = document.getElementById('virtualGridContainer');
+    if (!state || !container) {
+        return;
+    }
+    const { rowHeight, columnWidth, headerHeight, overscanRows, overscanColumns } = VIRTUAL_SCROLL;
+    const viewTop = Math.max(0, container.scrollTop - headerHeight);
+    const firstVisibleRow = Math.min(state.totalRows, Math.floor(viewTop / rowHeight));
+    const lastVisibleRow = Math.min(state.totalRows, Math.ceil((viewTop + container.clientHeight) / rowHeight));
+    const firstRow = Math.max(0, firstVisibleRow - overscanRows);
+    const lastRow = Math.min(state.totalRows, lastVisibleRow + overscanRows);
+    const firstCol = Math.max(0, Math.floor(container.scrollLeft / columnWidth) - overscanColumns);
+    const lastCol = Math.min(state.columns.length, Math.ceil((container.scrollLeft + container.clientWidth) / columnWidth) + overscanColumns);
+    
+    requestVirtualBlocks(state, firstRow, lastRow, firstCol, lastCol);
+    
+    let header = '';
+    for (let c = firstCol; c < lastCol; c++) {
+        const col = state.columns[c];
+        const title = state.labels[col] ? `${col} - ${state.labels[col]}` : col;
+        header += `<div class="virtual-grid-cell virtual-grid-header-cell sortable-header" style="left: ${c * columnWidth}px; width: ${columnWidth}px;"
+                        title="${escapePreviewText(title)}" data-column="${escapePreviewText(col)}" onclick="togglePreviewSort(this.dataset.column)">${previewHeaderLabel(escapePreviewText(col))}</div>`;
+    }
+    
+    let body = '';
+    for (let r = firstRow; r < lastRow; r++) {
+        body += `<div class="virtual-grid-row${r % 2 ? ' odd' : ''}" style="top: ${headerHeight + r * rowHeight}px; height: ${rowHeight}px;">`;
+        for (let c = firstCol; c < lastCol; c++) {
+            const value = virtualCellValue(state, r, c);
+            const left = `left: ${c * columnWidth}px; width: ${columnWidth}px;`;
+            if (value === undefined) {
+                body += `<div class="virtual-grid-cell pending" style="${left}">…</div>`;
+            } else {
+                const text = value === null ? '' : escapePreviewText(value);
+                body += `<div class="virtual-grid-cell" style="${left}" title="${text}">${text}</div>`;
+            }
+        }
+        body += '</div>';
+    }
+    document.getElementById('virtualGridHeader').innerHTML = header;
+    document.getElementById('virtualGridBody').innerHTML = body;
+    
+    previewState.loadedRows = lastVisibleRow;
+    const statusIndicator = document.getElementById('loadingStatusIndicator');
+    if (statusIndicator) {
+        statusIndicator.innerHTML = `
+            <small>第 ${(firstVisibleRow + 1).toLocaleString()} - ${lastVisibleRow.toLocaleString()} 行 / 共 ${state.totalRows.toLocaleString()} 行，
+            第 ${Math.min(firstCol + 1, state.columns.length)} - ${lastCol} 列 / 共 ${state.columns.length} 列</small>
+        `;
+    }
+    const loadedRowsIndicator = document.getElementById('loadedRowsIndicator');
+    const loadedRowsText = document.getElementById('loadedRowsText');
+    if (loadedRowsIndicator && loadedRowsText) {
+        loadedRowsIndicator.style.display = 'inline';
+        loadedRowsText.textContent = `共 ${state.totalRows.toLocaleString()} 行`;
+    }
+}
+
+// 单元格取值：所在数据块尚未加载时返回 undefined
+function virtualCellValue(state, row, col) {
+    const { rowBlock, columnBlock } = VIRTUAL_SCROLL;
+    const key = `${Math.floor(row / rowBlock)}:${Math.floor(col / columnBlock)}`;
+    const block = state.blocks.get(key);
+    if (!block) {
+        return undefined;
+    }
+    const values = block[col % columnBlock];
+    return values ? values[row % rowBlock] : undefined;
+}
+
+// 请求覆盖可见区域但尚未缓存的数据块；超出缓存上限时淘汰最久未使用的块
+function requestVirtualBlocks(state, firstRow, lastRow, firstCol, lastCol) {
+    const { rowBlock, columnBlock, maxBlocks, maxRequests } = VIRTUAL_SCROLL;
+    for (let rb = Math.floor(firstRow / rowBlock); rb * rowBlock < lastRow; rb++) {
+        for (let cb = Math.floor(firstCol / columnBlock); cb * columnBlock < lastCol; cb++) {
+            const key = `${rb}:${cb}`;
+            if (state.blocks.has(key)) {
+                const block = state.blocks.get(key);
+                state.blocks.delete(key);
+                state.blocks.set(key, block);
+                continue;
+            }
+            if (state.pending.has(key) || state.pending.size >= maxRequests) {
+                continue;
+            }
+            state.pending.add(key);
+            const url = withProjectPath(`/get_dataset_viewport/${state.datasetName}?row_start=${rb * rowBlock}&row_count=${rowBlock}&col_start=${cb * columnBlock}&col_count=${columnBlock}${state.query}`);
+            fetch(url)
+                .then(response => response.json())
+                .then(viewport => {
+                    if (viewport.error) {
+                        throw new Error(viewport.error);
+                    }
+                    state.blocks.set(key, viewport.data || []);
+                    while (state.blocks.size > maxBlocks) {
+                        state.blocks.delete(state.blocks.keys().next().value);
+                    }
+                })
+                .catch(error => {
+                    // 失败的块记为空块，避免重绘时反复请求；刷新预览后重新加载
+                    console.error('加载预览数据块失败:', error);
+                    state.blocks.set(key, []);
+                })
+                .finally(() => {
+                    state.pending.delete(key);
+                    // 已切换数据集或查询条件时丢弃结果
+                    if (previewState.virtual === state) {
+                        renderVirtualViewport();
+                    }
+                });
+        }
     }
 }
 
@@ -873,6 +1295,10 @@ function renderDatasetPreviewStructure(dataset) {
     
     // 检查SUPP失败信息
     const dsInfo = currentDatasets[dataset.dataset_name];
+    // SDTM 视图在首次预览时构建，失败列随预览返回
+    if (dsInfo && Array.isArray(dataset.supp_failed_columns)) {
+        dsInfo.supp_failed_columns = dataset.supp_failed_columns;
+    }
     if (dsInfo && dsInfo.supp_failed_columns && dsInfo.supp_failed_columns.length > 0) {
         content += renderSuppFailureAlert(dataset.dataset_name, dsInfo);
     }
@@ -891,7 +1317,7 @@ function renderDatasetPreviewStructure(dataset) {
                     <table class="table table-striped table-hover preview-table" id="previewTable">
                         <thead class="table-header-sticky">
                             <tr>
-                                ${dataset.columns.map(col => `<th title="${col}">${col}</th>`).join('')}
+                                ${dataset.columns.map(col => `<th title="${col}" data-column="${col}" class="sortable-header" onclick="togglePreviewSort(this.dataset.column)">${previewHeaderLabel(col)}</th>`).join('')}
                             </tr>
                         </thead>
                         <tbody id="previewTableBody">
@@ -1683,7 +2109,7 @@ async function loadVariablesForRow(row, datasetName) {
     const sourceSelect = row.querySelector('.source-variable-select');
     
     try {
-        const response = await fetch(`/get_dataset/${datasetName}?limit=1`);
+        const response = await fetch(withProjectPath(`/get_dataset/${datasetName}?limit=1`));
         const dataset = await response.json();
         
         if (dataset.error) {
@@ -1696,7 +2122,7 @@ async function loadVariablesForRow(row, datasetName) {
         // 获取SUPP数据集的源变量信息
         let suppResult = { source_variables: [], supp_dataset: null };
         try {
-            const suppResponse = await fetch(`/get_source_variables/${datasetName}`);
+            const suppResponse = await fetch(withProjectPath(`/get_source_variables/${datasetName}`));
             suppResult = await suppResponse.json();
         } catch (error) {
             console.warn('获取SUPP变量信息失败:', error);
@@ -1783,7 +2209,7 @@ function adjustSourceSelectHeight(selectElement, optionCount) {
 async function loadSuppSourceVariables(datasetName, sourceSelect) {
     try {
         // 使用新的后端接口获取源变量
-        const response = await fetch(`/get_source_variables/${datasetName}`);
+        const response = await fetch(withProjectPath(`/get_source_variables/${datasetName}`));
         const result = await response.json();
         
         if (result.error) {
@@ -2342,6 +2768,7 @@ async function initializeMergeConfigPage() {
             const dataResult = await dataResponse.json();
             if (dataResult.success) {
                 currentDatasets = dataResult.datasets;
+                lastDataPath = currentPath;
                 console.log('数据集信息重新加载成功');
             } else {
                 console.error('重新加载数据集信息失败:', dataResult.message);
@@ -2437,7 +2864,7 @@ async function saveMergeConfig() {
         // 转换配置格式以符合后端预期
         const formattedConfigs = await Promise.all(validConfigs.map(async config => {
             // 获取对应的SUPP数据集名称
-            const suppResponse = await fetch(`/get_source_variables/${config.dataset}`);
+            const suppResponse = await fetch(withProjectPath(`/get_source_variables/${config.dataset}`));
             const suppResult = await suppResponse.json();
             const suppDataset = suppResult.supp_dataset;
             
@@ -3370,7 +3797,7 @@ async function executeMergeProcess() {
         // 执行合并过程
         showLoadingOverlay('正在执行合并配置表...');
         
-        const response = await fetch('/execute_merge', {
+        const response = await fetch(withProjectPath('/execute_merge'), {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -3500,7 +3927,7 @@ async function executeMergeConfigBeforeGeneration() {
         showAlert('正在执行变量合并...', 'info');
         
         // 执行合并
-        const mergeResponse = await fetch('/merge_variables', {
+        const mergeResponse = await fetch(withProjectPath('/merge_variables'), {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -3854,6 +4281,7 @@ async function loadDatasetsForTranslationLibrary() {
         
         if (result.success && result.datasets) {
             currentDatasets = result.datasets;
+            lastDataPath = currentPath;
             console.log('翻译库页面数据集重新加载成功:', currentDatasets);
         } else {
             console.error('翻译库页面数据集重新加载失败:', result.message);
@@ -3962,7 +4390,7 @@ function bindConfigRowEvents(row, configId, type) {
             if (selectedDataset && currentDatasets && currentDatasets[selectedDataset]) {
                 // 获取数据集的变量列表
                 try {
-                    const response = await fetch(`/api/get_dataset_variables?dataset_name=${encodeURIComponent(selectedDataset)}`);
+                    const response = await fetch(withProjectPath(`/api/get_dataset_variables?dataset_name=${encodeURIComponent(selectedDataset)}`));
                     const result = await response.json();
                     
                     if (result.success && result.variables) {
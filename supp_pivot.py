@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+SUPP 数据集转置（长表 -> 宽表）
+
+等价于 ``df.pivot_table(index=index, columns='QNAM', values='QVAL', aggfunc='first').reset_index()``：
+键列与 QNAM 先编码为整数，再把 QVAL 一次性写入预分配的二维数组，避免 pivot_table 的分组聚合开销。
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def pivot_first(df, index, columns='QNAM', values='QVAL'):
+    """按 index 分组、columns 取值转列，每个单元格取第一个非空的 values（与 aggfunc='first' 一致）。
+
+    与 pivot_table 保持相同的结果：任一键列或 columns 为空的行被忽略；行按键排序、列按取值排序；
+    没有任何非空取值的行和列被丢弃；缺失单元格为 NaN。
+    注意：QVAL 含空值时 pivot_table 的行顺序偶尔不是严格按键排序，此处始终按键排序，行集合与取值一致。
+    """
+    index = list(index)
+    # factorize 对空值返回 -1，据此剔除键或 columns 为空的行，无需单独做 notna
+    key_codes, key_uniques = [], []
+    valid = np.ones(len(df), dtype=bool)
+    for key in index:
+        codes, uniques = pd.factorize(df[key], sort=True)
+        valid &= codes >= 0
+        key_codes.append(codes.astype(np.int64, copy=False))
+        key_uniques.append(uniques)
+    col_codes, col_uniques = pd.factorize(df[columns], sort=True)
+    valid &= col_codes >= 0
+
+    numeric = df[values].dtype.kind in 'iuf'
+    cell_values = df[values].to_numpy(dtype=np.float64 if numeric else object)
+    valid &= pd.notna(cell_values)
+
+    # 多个键的编码按混合进制合成单个整数，其大小顺序即为按键的字典序
+    combined = np.zeros(len(df), dtype=np.int64)
+    radix = 1
+    for codes, uniques in zip(reversed(key_codes), reversed(key_uniques)):
+        combined += codes * radix
+        radix *= max(len(uniques), 1)
+        if radix >= 2 ** 62:
+            raise OverflowError('too many key combinations for pivot_first')
+    combined = combined[valid]
+    col_codes = col_codes[valid]
+    cell_values = cell_values[valid]
+
+    # 只有至少含一个非空值的分组才会出现在这里，等价于 pivot_table 丢弃全空行
+    group_codes, group_ids = pd.factorize(combined, sort=True)
+    n_groups, n_cols = len(group_ids), len(col_uniques)
+    flat = group_codes.astype(np.int64, copy=False) * n_cols + col_codes
+    # 无排序的 factorize 按首次出现顺序编号：编号首次超过此前最大值的位置即该单元格的第一个非空值
+    cell_codes, cells = pd.factorize(flat)
+    seen = np.maximum.accumulate(cell_codes)
+    is_first = np.ones(len(cell_codes), dtype=bool)
+    is_first[1:] = cell_codes[1:] > seen[:-1]
+    grid = np.full(n_groups * n_cols, np.nan, dtype=np.float64 if numeric else object)
+    grid[cells] = cell_values[is_first]
+    grid = grid.reshape(n_groups, n_cols)
+    keep_cols = np.zeros(n_cols, dtype=bool)
+    keep_cols[col_codes] = True
+
+    # 由分组编号还原各键的编码
+    group_key_codes = []
+    rest = np.asarray(group_ids, dtype=np.int64)
+    for uniques in reversed(key_uniques):
+        base = max(len(uniques), 1)
+        group_key_codes.append(rest % base)
+        rest = rest // base
+    group_key_codes.reverse()
+
+    # 按位置组装列，QNAM 与键列同名时也保留两列（与 pivot_table 一致）
+    arrays = [uniques.take(codes) for codes, uniques in zip(group_key_codes, key_uniques)]
+    value_cols = np.flatnonzero(keep_cols)
+    arrays.extend(grid[:, j] for j in value_cols)
+    out = pd.DataFrame(dict(enumerate(arrays)), index=pd.RangeIndex(n_groups))
+    out.columns = pd.Index(index + [col_uniques[j] for j in value_cols], dtype=object, name=columns)
+    return out
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SDTM 数据集信息的回归测试
+视图尚未构建时给出视图行数与推算的列，合并失败列为未知（None）；首次预览构建视图后随预览返回失败列，
+数据集信息随之更新；规范化后重复的 SUPP 键不使视图行数多于原始表；惰性模式下数据集信息不构建视图
+"""
+
+from types import SimpleNamespace
+
+import pandas as pd
+
+import sas_reader
+from app import SASDataProcessor
+
+
+def make_processor():
+    """DM 有重复 USUBJID；SUPPDM 的 RACEOTH 只指向不存在的受试者（合并后全为空，视为失败）"""
+    dm = pd.DataFrame({'STUDYID': ['ST'] * 3, 'USUBJID': ['S-1', 'S-1', 'S-2'], 'DMSEQ': [1.0, 2.0, 1.0]})
+    supp = pd.DataFrame({
+        'STUDYID': ['ST', 'ST', 'ST'], 'RDOMAIN': ['DM', 'DM', 'DM'], 'USUBJID': ['S-1', 'S-2', 'S-9'],
+        'IDVAR': ['', '', ''], 'IDVARVAL': ['', '', ''],
+        'QNAM': ['ETHNIC2', 'ETHNIC2', 'RACEOTH'], 'QVAL': ['X', 'Y', 'Other'],
+    })
+    processor = SASDataProcessor()
+    processor.hide_supp_in_preview = True
+    processor.datasets = {name: {'data': df, 'raw_data': df, 'version': SASDataProcessor._next_version()}
+                          for name, df in (('DM', dm), ('SUPPDM', supp))}
+    return processor
+
+
+def test_unbuilt_view_info_then_failures_on_first_preview():
+    processor = make_processor()
+    info = processor.get_all_datasets_info()['DM']
+    assert 'data_view' not in processor.datasets['DM']
+    assert info['view_ready'] is False and info['supp_failed_columns'] is None
+    assert info['column_names'] == ['STUDYID', 'USUBJID', 'DMSEQ', 'ETHNIC2', 'RACEOTH']
+
+    preview = processor.get_dataset_preview('DM', limit=None)
+    # 视图行数与推算的行数一致（重复受试者不因附加 SUPP 列而增减）
+    assert preview['total_rows'] == info['rows'] == 3
+    assert [f['column'] for f in preview['supp_failed_columns']] == ['RACEOTH']
+    assert [row['ETHNIC2'] for row in preview['data']] == ['X', 'X', 'Y']
+
+    built = processor.get_all_datasets_info()['DM']
+    assert built['view_ready'] is True and built['rows'] == 3
+    assert built['supp_failed_columns'] == preview['supp_failed_columns']
+
+
+def test_duplicate_normalized_supp_keys_keep_row_count():
+    """SUPPDM 中 IDVARVAL '1' 与 '1.0' 规范化后为同一键：视图按首行附加，行数与数据集信息一致"""
+    dm = pd.DataFrame({'STUDYID': ['ST'] * 3, 'USUBJID': ['S-1', 'S-1', 'S-2'], 'DMSEQ': [1.0, 2.0, 1.0]})
+    supp = pd.DataFrame({
+        'STUDYID': ['ST'] * 3, 'RDOMAIN': ['DM'] * 3, 'USUBJID': ['S-1', 'S-1', 'S-2'],
+        'IDVAR': ['DMSEQ'] * 3, 'IDVARVAL': ['1', '1.0', '1'], 'QNAM': ['X'] * 3, 'QVAL': ['a', 'b', 'c'],
+    })
+    processor = SASDataProcessor()
+    processor.hide_supp_in_preview = True
+    processor.datasets = {name: {'data': df, 'raw_data': df, 'version': SASDataProcessor._next_version()}
+                          for name, df in (('DM', dm), ('SUPPDM', supp))}
+    info = processor.get_all_datasets_info()['DM']
+    preview = processor.get_dataset_preview('DM', limit=None)
+    assert info['rows'] == preview['total_rows'] == 3
+    assert [row['X'] for row in preview['data']] == ['a', None, 'c']
+
+
+def test_lazy_info_does_not_build_views(monkeypatch):
+    """惰性模式下视图失效的已加载主表：数据集信息按列规则推算，不为此重建视图"""
+    dm = pd.DataFrame({'STUDYID': ['ST', 'ST'], 'USUBJID': ['S-1', 'S-2']})
+    supp = pd.DataFrame({'STUDYID': ['ST'], 'RDOMAIN': ['DM'], 'USUBJID': ['S-1'], 'IDVAR': [''],
+                         'IDVARVAL': [''], 'QNAM': ['RACEOTH'], 'QVAL': ['Other']})
+    frames = {'DM': dm, 'SUPPDM': supp}
+    monkeypatch.setattr(sas_reader, 'read_sas7bdat', lambda path, *args, **kwargs: (
+        frames[path], SimpleNamespace(column_names=list(frames[path].columns), number_rows=len(frames[path])), 1))
+    processor = SASDataProcessor()
+    processor.lazy = True
+    processor.hide_supp_in_preview = True
+    processor.datasets = {name: {'path': name, 'status': 'unloaded', 'version': SASDataProcessor._next_version(),
+                                 'meta': SimpleNamespace(column_names=list(df.columns), number_rows=len(df))}
+                          for name, df in frames.items()}
+    processor.ensure_loaded('DM')
+    processor._invalidate_views(['DM'])
+    info = processor.get_all_datasets_info()['DM']
+    assert 'data_view' not in processor.datasets['DM']
+    assert info['view_ready'] is False and info['rows'] == 2
+    assert info['column_names'] == ['STUDYID', 'USUBJID', 'RACEOTH']
+
+
+if __name__ == "__main__":
+    test_unbuilt_view_info_then_failures_on_first_preview()
+    test_duplicate_normalized_supp_keys_keep_row_count()
+    print("✅ SDTM 数据集信息正常")
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ETag 条件请求与预览页缓存的回归测试
+数据未变化时预览、视窗、结构、变量列表与加载状态接口对 If-None-Match 返回 304，
+合并提交、SDTM 视图失效或增量刷新 SUPP（含惰性模式下已淘汰的主表）后 ETag 改变并返回新内容；重复的预览页请求命中服务端页缓存；惰性模式下 304 不加载数据
+"""
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import pandas as pd
+
+import sas_reader
+from app import SASDataProcessor, app, processor_registry
+
+PROJECT = '/tmp/etag-cache-test-project'
+
+
+def make_processor():
+    processor = processor_registry.get(PROJECT, create=True)
+    df = pd.DataFrame({'USUBJID': ['S-1', 'S-2', 'S-3'], 'AESEQ': [1.0, 2.0, 3.0]})
+    processor.datasets = {'AE': {'data': df, 'raw_data': df, 'version': SASDataProcessor._next_version()}}
+    return processor
+
+
+def test_conditional_get_and_invalidation():
+    """未变化时返回 304；合并提交后 ETag 改变；视图失效同样改变 ETag"""
+    processor = make_processor()
+    client = app.test_client()
+    urls = [
+        f'/get_dataset/AE?path={PROJECT}&limit=2',
+        f'/get_dataset_viewport/AE?path={PROJECT}&row_start=1&row_count=2&columns=AESEQ',
+        f'/get_dataset_schema/AE?path={PROJECT}',
+        f'/api/get_dataset_variables?path={PROJECT}&dataset_name=AE',
+        f'/datasets_status?path={PROJECT}',
+    ]
+    etags = {}
+    for url in urls:
+        first = client.get(url)
+        assert first.status_code == 200 and first.headers.get('ETag'), url
+        assert first.headers['Cache-Control'] == 'no-cache'
+        etags[url] = first.headers['ETag']
+        again = client.get(url, headers={'If-None-Match': etags[url]})
+        assert again.status_code == 304 and again.data == b'', url
+
+    processor._commit_dataset('AE', processor.datasets['AE']['data'].assign(AESEQ=[7.0, 8.0, 9.0]))
+    for url in urls:
+        changed = client.get(url, headers={'If-None-Match': etags[url]})
+        assert changed.status_code == 200 and changed.headers['ETag'] != etags[url], url
+    assert client.get(urls[0]).get_json()['data'][0]['AESEQ'] == 7.0
+
+    etag = client.get(urls[1]).headers['ETag']
+    processor._invalidate_views(['AE'])
+    assert client.get(urls[1], headers={'If-None-Match': etag}).status_code == 200
+
+    # 其他处理器（项目或服务重启）版本号相同也不会得到相同的 ETag
+    other = SASDataProcessor()
+    other.datasets = dict(processor.datasets)
+    assert other.dataset_etag('AE') != processor.dataset_etag('AE')
+    assert client.get('/get_dataset/MISSING?path=' + PROJECT).status_code == 404
+
+
+def test_page_cache_and_info_memo():
+    """重复请求同一页命中页缓存且内容一致；数据集信息在版本未变化时复用"""
+    processor = make_processor()
+    client = app.test_client()
+    url = f'/get_dataset/AE?path={PROJECT}&limit=2&offset=1&format=columns'
+    before = processor.page_cache.stats()
+    first = client.get(url).data
+    second = client.get(url).data
+    stats = processor.page_cache.stats()
+    assert first == second
+    assert stats['hits'] == before['hits'] + 1 and stats['misses'] == before['misses'] + 1
+
+    info = processor.get_all_datasets_info()
+    assert processor.get_all_datasets_info() is info
+    processor._commit_dataset('AE', processor.datasets['AE']['data'].iloc[:2])
+    assert processor.get_all_datasets_info()['AE']['rows'] == 2
+    assert client.get(url).get_json()['data'] == [['S-2'], [2.0]]
+
+
+def test_merge_invalidates_cached_view():
+    """SDTM 视图缓存页与 304：合并提交使主表视图失效后旧 ETag 返回 200 与新视图（不命中旧的页缓存），
+    视图在该次响应中重建但不改变版本号，新 ETag 再次请求返回 304"""
+    processor = processor_registry.get(PROJECT + '-sdtm', create=True)
+    processor.hide_supp_in_preview = True
+    dm = pd.DataFrame({'STUDYID': ['ST', 'ST'], 'USUBJID': ['S-1', 'S-2'], 'ETHNIC': ['A', 'B']})
+    supp = pd.DataFrame({'STUDYID': ['ST', 'ST'], 'RDOMAIN': ['DM', 'DM'], 'USUBJID': ['S-1', 'S-2'], 'IDVAR': ['', ''],
+                         'IDVARVAL': ['', ''], 'QNAM': ['RACEOTH', 'RACEOTH'], 'QVAL': ['Other', 'x']})
+    processor.datasets = {name: {'data': df, 'raw_data': df, 'version': SASDataProcessor._next_version()}
+                          for name, df in (('DM', dm), ('SUPPDM', supp))}
+    client = app.test_client()
+    url = f'/get_dataset/DM?path={PROJECT}-sdtm&limit=10'
+    first = client.get(url)
+    assert [row['RACEOTH'] for row in first.get_json()['data']] == ['Other', 'x']
+    assert client.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    success, message = processor.merge_variables([
+        {'target': {'dataset': 'DM', 'column': 'ETHNICX'},
+         'sources': [{'dataset': 'DM', 'column': 'ETHNIC'}, {'dataset': 'SUPPDM', 'column': 'RACEOTH'}]}])
+    assert success, message
+    assert 'data_view' not in processor.datasets['DM']
+    changed = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and changed.headers['ETag'] != first.headers['ETag']
+    assert changed.get_json()['data'] == [{'STUDYID': 'ST', 'USUBJID': 'S-1', 'ETHNICX': 'AOther'},
+                                          {'STUDYID': 'ST', 'USUBJID': 'S-2', 'ETHNICX': 'Bx'}]
+    assert 'data_view' in processor.datasets['DM']
+    assert client.get(url, headers={'If-None-Match': changed.headers['ETag']}).status_code == 304
+
+
+def test_lazy_conditional_get_does_not_load(monkeypatch):
+    """惰性模式下 304 只比较条目版本号，不读取文件；被淘汰后重新加载版本号不变，旧 ETag 仍然有效"""
+    reads = []
+    df = pd.DataFrame({'USUBJID': ['S-1', 'S-2'], 'AESEQ': [1.0, 2.0]})
+
+    def fake_read(path, *args):
+        reads.append(path)
+        return df.copy(), SimpleNamespace(column_names=list(df.columns), number_rows=len(df)), 1
+    monkeypatch.setattr(sas_reader, 'read_sas7bdat', fake_read)
+    processor = processor_registry.get(PROJECT + '-lazy', create=True)
+    processor.lazy = True
+    processor.datasets = {'AE': {'path': '/data/AE.sas7bdat', 'status': 'unloaded', 'version': SASDataProcessor._next_version(),
+                                 'meta': SimpleNamespace(column_names=list(df.columns), number_rows=len(df))}}
+    client = app.test_client()
+    url = f'/get_dataset_schema/AE?path={PROJECT}-lazy'
+
+    etag = processor.dataset_etag('AE')
+    assert reads == []
+    first = client.get(url)
+    assert first.status_code == 200 and first.headers['ETag'] == f'"{etag}"' and len(reads) == 1
+
+    processor.memory_budget_mb = 1e-9
+    processor._evict_idle_datasets()
+    assert 'data' not in processor.datasets['AE']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304 and len(reads) == 1
+    assert client.get(url).headers['ETag'] == f'"{etag}"' and len(reads) == 2
+
+
+def test_lazy_refresh_of_supp_invalidates_evicted_domain(monkeypatch, tmp_path):
+    """惰性模式下 DM 被淘汰后 SUPPDM 文件变化：增量刷新为未加载的 DM 分配新版本号，
+    旧 ETag 返回 200 与含新 SUPP 取值的视图，数据集信息同步更新"""
+    frames = {
+        'DM': pd.DataFrame({'STUDYID': ['ST'], 'USUBJID': ['S-1'], 'AGE': [30.0]}),
+        'AE': pd.DataFrame({'STUDYID': ['ST'], 'USUBJID': ['S-1'], 'AESEQ': [1.0]}),
+        'SUPPDM': pd.DataFrame({'STUDYID': ['ST'], 'RDOMAIN': ['DM'], 'USUBJID': ['S-1'], 'IDVAR': [''],
+                                'IDVARVAL': [''], 'QNAM': ['RACEOTH'], 'QVAL': ['Other']}),
+    }
+    sizes = {name: 1 for name in frames}
+
+    def meta(df):
+        return SimpleNamespace(column_names=list(df.columns), number_rows=len(df))
+    monkeypatch.setattr(sas_reader, 'file_signature',
+                        lambda path, with_hash=False: {'path': path, 'size': sizes[Path(path).stem], 'mtime_ns': 0})
+    monkeypatch.setattr(sas_reader, 'read_sas7bdat', lambda path, *args, **kwargs: (
+        frames[Path(path).stem].copy(), meta(frames[Path(path).stem]), 1))
+    monkeypatch.setattr(sas_reader, 'read_sas_metadata', lambda path: (meta(frames[Path(path).stem]), None))
+    for name in frames:
+        (tmp_path / f'{name}.sas7bdat').write_bytes(b'')
+
+    processor = processor_registry.get(PROJECT + '-lazy-refresh', create=True)
+    processor.lazy = True
+    processor.hide_supp_in_preview = True
+    processor.memory_budget_mb = 1e-9
+    processor.source_directory = str(tmp_path)
+    processor.datasets = {name: {'path': str(tmp_path / f'{name}.sas7bdat'), 'status': 'unloaded',
+                                 'version': SASDataProcessor._next_version(), 'meta': meta(df)}
+                          for name, df in frames.items()}
+    processor.file_signatures = processor._collect_file_signatures(
+        [str(tmp_path / f'{name}.sas7bdat') for name in frames])
+    client = app.test_client()
+    url = f'/get_dataset/DM?path={PROJECT}-lazy-refresh&limit=10'
+
+    first = client.get(url)
+    assert first.get_json()['data'][0]['RACEOTH'] == 'Other'
+    info_before = processor.get_all_datasets_info()['DM']
+    processor.ensure_loaded('AE')
+    assert 'data' not in processor.datasets['DM']
+    assert client.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    frames['SUPPDM'] = frames['SUPPDM'].assign(QNAM=['RACEOTH2'], QVAL=['Another'])
+    sizes['SUPPDM'] = 2
+    success, _, changes = processor.refresh_sas_files()
+    assert success and changes['modified'] == ['SUPPDM'] and changes['invalidated_views'] == ['DM']
+    assert 'data' not in processor.datasets['DM']
+
+    changed = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and changed.headers['ETag'] != first.headers['ETag']
+    assert changed.get_json()['data'] == [{'STUDYID': 'ST', 'USUBJID': 'S-1', 'AGE': 30.0, 'RACEOTH2': 'Another'}]
+    info = processor.get_all_datasets_info()['DM']
+    assert info is not info_before and 'RACEOTH2' in info['column_names'] and 'RACEOTH' not in info['column_names']
+
+
+if __name__ == "__main__":
+    test_conditional_get_and_invalidation()
+    test_page_cache_and_info_memo()
+    test_merge_invalidates_cached_view()
+    print("✅ ETag 条件请求与预览页缓存正常")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+连接键索引的回归测试
+键重复时取首个匹配行、unique=True 时回退；单侧缺失键按值匹配，两侧都有缺失键或数值/字符键混用时回退给 merge；
+分类列、空表；规范化键列（_normalize_key_series）的取值表、缓存命中，以及项目键字典跨数据集编码一致
+"""
+
+import numpy as np
+import pandas as pd
+
+from app import COPY_ON_WRITE, KeyIndex, SASDataProcessor, StudyKeyDictionary
+
+KEYS = ['USUBJID', 'SEQ']
+
+
+def make_index():
+    return KeyIndex(SASDataProcessor._normalize_key_series, StudyKeyDictionary())
+
+
+def merged_positions(left, right, keys):
+    """参考实现：merge 后取右表行号，未匹配为 -1"""
+    merged = left[keys].merge(right[keys].assign(__pos=np.arange(len(right))), on=keys, how='left')
+    return merged['__pos'].fillna(-1).astype(int).tolist()
+
+
+def test_duplicate_keys_first_match_or_fallback():
+    """右表 (S-1, 1) 重复：不要求唯一时取首个匹配行（第 3 行），unique=True 时返回 None；
+    去掉重复行后与 merge 对齐一致，未匹配（含左表缺失键、NaN 序号）为 -1"""
+    left = pd.DataFrame({'USUBJID': ['S-1', 'S-1', None, 'S-2', 'S-3'], 'SEQ': [1.0, 2.0, 1.0, 1.0, np.nan]})
+    right = pd.DataFrame({'USUBJID': ['S-1', 'S-1', 'S-2', 'S-1'], 'SEQ': [2.0, 1.0, 1.0, 1.0]})
+    index = make_index()
+    assert index.positions(left, KEYS, right).tolist() == [1, 0, -1, 2, -1]
+    assert index.positions(left, KEYS, right, unique=True) is None
+    assert index.lookup(right, KEYS, left).tolist() == [1, 0, -1, 2, -1]
+    assert index.lookup(right, KEYS, left, unique=True) is None
+
+    right = right.iloc[:3]
+    assert index.positions(left, KEYS, right, unique=True).tolist() == merged_positions(left, right, KEYS)
+    assert index.lookup(right, KEYS, left, unique=True).tolist() == [1, 0, -1, 2, -1]
+    # 本数据集自身键重复不影响 positions 的唯一性判断
+    twice = pd.concat([left, left], ignore_index=True)
+    assert index.positions(twice, KEYS, right, unique=True).tolist() == [1, 0, -1, 2, -1] * 2
+
+
+def test_missing_keys_and_kind_mismatch():
+    """只有一侧有缺失键时按值匹配；两侧都有缺失键（merge 会让缺失值相互匹配）、数值与字符键、布尔键均返回 None"""
+    left = pd.DataFrame({'USUBJID': ['S-1', 'S-1', 'S-2'], 'SEQ': [1.0, 2.0, 1.0]})
+    right = pd.DataFrame({'USUBJID': ['S-1', None, 'S-2', 'S-1'], 'SEQ': [2.0, 1.0, 1.0, 1.0]})
+    index = make_index()
+    assert index.positions(left, KEYS, right).tolist() == [3, 0, 2]
+
+    with_null = pd.concat([left, pd.DataFrame({'USUBJID': [None], 'SEQ': [1.0]})], ignore_index=True)
+    assert index.positions(with_null, KEYS, right) is None
+    assert merged_positions(with_null, right.iloc[:3], KEYS)[-1] == 1
+
+    # 整数与浮点同属数值，可以匹配
+    assert index.positions(left.assign(SEQ=[1, 2, 1]), KEYS, right).tolist() == [3, 0, 2]
+    assert index.positions(left, KEYS, right.assign(SEQ=['2', '1', '1', '1'])) is None
+    assert index.positions(left, ['USUBJID'], right.assign(USUBJID=[True] * 4)) is None
+
+
+def test_categorical_and_empty_frames():
+    """分类键（类别顺序与取值无关）与普通字符键互相匹配；空表返回空结果或全部未匹配"""
+    left = pd.DataFrame({'USUBJID': ['S-1', 'S-1', 'S-2', 'S-3'], 'SEQ': [1.0, 2.0, 1.0, 1.0]})
+    right = pd.DataFrame({'USUBJID': ['S-1', 'S-1', 'S-2'], 'SEQ': [2.0, 1.0, 1.0]})
+    categorical = left.assign(USUBJID=left['USUBJID'].astype('category'))
+    reordered = right.assign(USUBJID=pd.Categorical(right['USUBJID'], categories=['S-9', 'S-2', 'S-1']))
+    expected = [1, 0, 2, -1]
+    assert make_index().positions(categorical, KEYS, reordered, unique=True).tolist() == expected
+    assert make_index().positions(left, KEYS, reordered, unique=True).tolist() == expected
+    assert make_index().positions(categorical, KEYS, right, unique=True).tolist() == expected
+
+    assert make_index().positions(left.iloc[:0], KEYS, right).tolist() == []
+    assert make_index().positions(left, KEYS, right.iloc[:0], unique=True).tolist() == [-1] * 4
+    assert make_index().lookup(right.iloc[:0], KEYS, left, unique=True).tolist() == [-1] * 4
+
+
+def test_normalized_keys_match_across_types():
+    """原值比较时字符序号与数值序号不匹配（回退）；规范化后 '1' / ' 2 ' 与 1.0 / 2.0 对齐"""
+    left = pd.DataFrame({'USUBJID': ['S-1', 'S-1'], 'SEQ': ['1', ' 2 ']})
+    right = pd.DataFrame({'USUBJID': ['S-1', 'S-1'], 'SEQ': [2.0, 1.0]})
+    index = make_index()
+    assert index.positions(left, KEYS, right) is None
+    normalized = left.assign(SEQ=index.normalized(left, 'SEQ'))
+    other = right.assign(SEQ=SASDataProcessor._normalize_key_series(right['SEQ']))
+    assert index.positions(normalized, KEYS, other, unique=True).tolist() == [1, 0]
+
+
+def test_normalized_reuses_cached_column():
+    """同一键列只规范化一次，写回后的规范化列再次请求时命中缓存"""
+    df = pd.DataFrame({'USUBJID': ['S-1 ', 'S-2'], 'AESEQ': [1.0, 2.0]})
+    index = KeyIndex(SASDataProcessor._normalize_key_series)
+    first = index.normalized(df, 'AESEQ')
+    assert first.tolist() == ['1', '2']
+    df['AESEQ'] = first
+    assert index.normalized(df, 'AESEQ').tolist() == ['1', '2']
+    # 写回的列与缓存共享缓冲区依赖写时复制；关闭时写入会复制数据，只要求结果正确
+    if COPY_ON_WRITE:
+        assert index.hits == 1
+        assert index.stats()['normalize_hits'] == 1
+        assert index.stats()['normalize_misses'] == 1
+
+
+def test_normalize_key_series_values():
+    """数值字符串去掉空白、前导零与正号，整数值浮点去掉 .0；非数值原样保留；缺失值为 'None' / 'nan'；
+    保留原索引，与逐值实现一致"""
+    table = [
+        ('1', '1'), ('1.0', '1'), (' 2 ', '2'), ('02', '2'), ('+3', '3'), ('-4.0', '-4'), ('.5', '.5'),
+        ('1e3', '1000'), ('1.5', '1.5'), ('inf', 'inf'), ('nan', 'nan'), ('None', 'None'), ('A', 'A'),
+        ('S-001', 'S-001'), ('01-002', '01-002'), ('x1', 'x1'), ('', ''), ('  ', ''),
+        (None, 'None'), (np.nan, 'nan'), (1, '1'), (1.0, '1'), (True, '1'), (2.5, '2.5'), (-0.0, '0'),
+    ]
+    series = pd.Series([value for value, _ in table], index=np.arange(len(table))[::-1] + 5, dtype=object)
+    actual = SASDataProcessor._normalize_key_series(series)
+    assert actual.tolist() == [expected for _, expected in table]
+    assert actual.index.equals(series.index)
+    assert SASDataProcessor._normalize_key_values(series).tolist() == actual.tolist()
+
+    floats = pd.Series([1.0, np.nan, 3.0, 1e16])
+    assert SASDataProcessor._normalize_key_series(floats).tolist() == ['1', 'nan', '3', '10000000000000000']
+    categorical = pd.Series(['1.0', None, '1.0'], dtype='category')
+    assert SASDataProcessor._normalize_key_series(categorical).tolist() == ['1', 'nan', '1']
+    assert SASDataProcessor._normalize_key_series(pd.Series([], dtype=object)).tolist() == []
+
+
+def test_encoded_shared_dictionary():
+    """同一项目字典下 '2' 与 2.0 编码相同；'1' 与 '1.0' 规范化后合并，标记为非一一对应"""
+    dictionary = StudyKeyDictionary()
+    codes, injective = KeyIndex(SASDataProcessor._normalize_key_series, dictionary).encoded(
+        pd.DataFrame({'AESEQ': ['1', '1.0', ' 2 ', '2']}), 'AESEQ')
+    assert codes.tolist() == [0, 0, 1, 1] and injective is False
+    codes, injective = KeyIndex(SASDataProcessor._normalize_key_series, dictionary).encoded(
+        pd.DataFrame({'CMSEQ': [2.0, 1.0, np.nan]}), 'CMSEQ')
+    assert codes.tolist() == [1, 0, 2] and injective is True
+    assert dictionary.size('AESEQ') == 3
+
+
+if __name__ == "__main__":
+    test_duplicate_keys_first_match_or_fallback()
+    test_missing_keys_and_kind_mismatch()
+    test_categorical_and_empty_frames()
+    test_normalized_keys_match_across_types()
+    test_normalized_reuses_cached_column()
+    test_normalize_key_series_values()
+    test_encoded_shared_dictionary()
+    print("✅ 键索引与键规范化的边界情况正常")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+惰性加载与内存预算淘汰的回归测试
+被淘汰的 SDTM 主表在数据集信息中仍给出 SUPP 合入的 QNAM 列与来源明细；
+使用中的数据集不被淘汰，淘汰不修改其他请求已取得的条目
+"""
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import pandas as pd
+
+import sas_reader
+from app import SASDataProcessor
+
+FRAMES = {
+    'DM': pd.DataFrame({'STUDYID': ['ST', 'ST'], 'USUBJID': ['S-1', 'S-2'], 'ETHNIC': ['A', 'B']}),
+    'AE': pd.DataFrame({'STUDYID': ['ST'], 'USUBJID': ['S-1'], 'AESEQ': [1.0], 'AETERM': ['Headache']}),
+    'SUPPDM': pd.DataFrame({
+        'STUDYID': ['ST', 'ST', 'ST'], 'RDOMAIN': ['DM', 'DM', 'dm'], 'USUBJID': ['S-1', 'S-2', 'S-1'],
+        'IDVAR': ['', '', ''], 'IDVARVAL': ['', '', ''],
+        'QNAM': ['ETHNIC2', 'ETHNIC2', 'RACEOTH'], 'QVAL': ['X', 'Y', 'Other'],
+    }),
+}
+
+
+def make_processor(monkeypatch):
+    """SDTM 惰性模式处理器，内存预算小到任何时候只能保留最近访问的一个主表"""
+    def fake_read(path, *args):
+        df = FRAMES[Path(path).stem]
+        return df.copy(), SimpleNamespace(column_names=list(df.columns), number_rows=len(df)), 1
+    monkeypatch.setattr(sas_reader, 'read_sas7bdat', fake_read)
+    processor = SASDataProcessor()
+    processor.lazy = True
+    processor.hide_supp_in_preview = True
+    processor.memory_budget_mb = 0.0001
+    processor.datasets = {
+        name: {'path': f'/data/{name}.sas7bdat', 'status': 'unloaded', 'version': SASDataProcessor._next_version(),
+               'meta': SimpleNamespace(column_names=list(df.columns), number_rows=len(df))}
+        for name, df in FRAMES.items()
+    }
+    return processor
+
+
+def test_evicted_domain_keeps_supp_columns(monkeypatch):
+    """DM 被淘汰后数据集信息仍包含 SUPPDM 的 QNAM 列（大小写不同的 RDOMAIN 同样计入）与来源明细"""
+    processor = make_processor(monkeypatch)
+    processor.ensure_loaded('DM')
+    loaded_info = processor.get_all_datasets_info()['DM']
+    processor.ensure_loaded('AE')
+    assert 'data' not in processor.datasets['DM'] and processor.datasets['DM']['status'] == 'unloaded'
+
+    info = processor.get_all_datasets_info()['DM']
+    assert info['view_ready'] is False
+    assert info['column_names'] == loaded_info['column_names'] == ['STUDYID', 'USUBJID', 'ETHNIC', 'ETHNIC2', 'RACEOTH']
+    assert {'ETHNIC2', 'RACEOTH'} <= set(info['selectable_columns'])
+    assert info['supp_origin_detail'] == loaded_info['supp_origin_detail']
+    assert info['supp_origin_detail']['RACEOTH'] == {'supp_ds': 'SUPPDM', 'qnam': 'RACEOTH', 'idvar': None}
+    assert 'SUPPDM' not in processor.get_all_datasets_info()
+
+
+def test_pinned_and_held_entries_survive_eviction(monkeypatch):
+    """使用中的数据集不被淘汰；淘汰替换条目而不清空已被其他请求取得的旧条目"""
+    processor = make_processor(monkeypatch)
+    processor.ensure_loaded('DM')
+    held = processor.datasets['DM']
+    processor._pin('DM')
+    processor.ensure_loaded('AE')
+    assert 'data' in processor.datasets['DM'] and processor.datasets['DM'] is held
+    processor._unpin('DM')
+
+    processor.ensure_loaded('AE')
+    assert 'data' not in processor.datasets['DM']
+    # 旧条目保持完整，持有者仍可读到数据与视图
+    assert list(held['data']['USUBJID']) == ['S-1', 'S-2'] and 'ETHNIC2' in held['data_view'].columns
+    assert processor.get_dataset_preview('DM', limit=None)['data'][0]['RACEOTH'] == 'Other'
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+变量合并拼接的回归测试
+_concat_non_empty 跳过缺失值（None/NaN/NA/NaT）、空字符串与任意大小写的 'nan'，保留纯空白与字面 'None'；
+浮点、可空整数、日期时间、布尔按逐值 str() 输出；空表与两种分隔符；随机混合类型输入与原逐行实现一致，
+以及 merge_variables 写入目标列与删除源列
+"""
+
+import numpy as np
+import pandas as pd
+
+from app import SASDataProcessor
+
+
+def reference_concat(frame, separator):
+    """原实现：逐行 apply，跳过缺失值、空字符串与 'nan'"""
+    def concat_row(row):
+        parts = []
+        for val in row.values.tolist():
+            if pd.notna(val):
+                sval = str(val)
+                if sval.lower() != 'nan' and sval != '':
+                    parts.append(sval)
+        return separator.join(parts)
+    if frame.empty:
+        return pd.Series([], index=frame.index, dtype=object)
+    return frame.apply(concat_row, axis=1)
+
+
+def random_frame(rng, n_rows, n_cols):
+    """随机混合类型列：对象列（各种缺失写法、数值、日期、布尔）、含缺失的浮点、可空整数、日期时间与分类列"""
+    pool = ['A', 'b c', '头痛', '', ' ', 'nan', 'NaN', 'None', None, np.nan, pd.NA, 1, 2.5, 0.1 + 0.2,
+            pd.Timestamp('2024-01-02'), True]
+    columns = {}
+    for i in range(n_cols):
+        kind = rng.integers(0, 5)
+        missing = rng.random(n_rows) < 0.3
+        if kind == 0:
+            columns[f'_s{i}'] = pd.Series([pool[j] for j in rng.integers(0, len(pool), n_rows)], dtype=object)
+        elif kind == 1:
+            values = rng.normal(size=n_rows).round(int(rng.integers(0, 4)))
+            values[missing] = np.nan
+            columns[f'_s{i}'] = pd.Series(values)
+        elif kind == 2:
+            values = pd.array(rng.integers(-50, 50, n_rows), dtype='Int64')
+            values[missing] = pd.NA
+            columns[f'_s{i}'] = pd.Series(values)
+        elif kind == 3:
+            values = pd.Series(pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 10 ** 6, n_rows), unit='s'))
+            columns[f'_s{i}'] = values.mask(missing)
+        else:
+            values = rng.choice(['X', 'Y', '', 'nan'], n_rows).astype(object)
+            values[missing] = None
+            columns[f'_s{i}'] = pd.Series(values).astype('category')
+    frame = pd.DataFrame(columns)
+    frame.index = rng.permutation(n_rows) + 3
+    # 与合并中的处理一致：整数列（含可空整数）拼接前转为 float64
+    return frame.astype({c: 'float64' for c in frame.columns if frame[c].dtype.kind in 'iu'})
+
+
+def make_frame():
+    """各列类型混合：对象列含各种缺失写法，数值列含浮点误差、-0.0 与科学计数，另有日期、可空整数与分类列"""
+    frame = pd.DataFrame({
+        'A': pd.Series(['A', '', 'nan', 'NaN', None, pd.NA, ' ', '头痛', 'None', 'b c'], dtype=object),
+        'B': [2.5, np.nan, 0.1 + 0.2, 1.0, np.nan, 3.0, np.nan, -0.0, 1e20, np.nan],
+        'C': pd.Series([pd.Timestamp('2024-01-02'), True, 1, 'nAn', np.nan, '', 'x', False, None,
+                        pd.Timestamp('2024-01-02 03:04:05')], dtype=object),
+        'D': pd.to_datetime(['2024-03-01'] + [None] * 8 + ['2024-03-01 12:00'], format='ISO8601'),
+        'E': pd.array([1, None, 3] + [None] * 7, dtype='Int64'),
+        'F': pd.Categorical(['X', None, '', 'nan', None, None, None, None, None, 'X']),
+    })
+    frame.index = range(10, 20)
+    return frame
+
+
+def test_concat_skips_missing_and_formats_values():
+    """按列顺序拼接；可空整数输出 '1' 而非 '1.0'；全部为空的行为空串；保留原索引"""
+    frame = make_frame()
+    joined = SASDataProcessor._concat_non_empty(frame, ' ')
+    assert joined.index.tolist() == list(range(10, 20))
+    assert joined.tolist() == [
+        'A 2.5 2024-01-02 00:00:00 2024-03-01 00:00:00 1 X',
+        'True',
+        '0.30000000000000004 1 3',
+        '1.0',
+        '',
+        '3.0',
+        '  x',
+        '头痛 -0.0 False',
+        'None 1e+20',
+        'b c 2024-01-02 03:04:05 2024-03-01 12:00:00 X',
+    ]
+    assert SASDataProcessor._concat_non_empty(frame, '').tolist()[:3] == [
+        'A2.52024-01-02 00:00:002024-03-01 00:00:001X', 'True', '0.3000000000000000413']
+
+
+def test_concat_empty_and_single_column():
+    """空表返回 object 类型的空列；单列布尔、可空布尔/浮点与无符号整数按 str() 输出"""
+    empty = SASDataProcessor._concat_non_empty(make_frame().iloc[:0], ' ')
+    assert empty.tolist() == [] and empty.dtype == object
+    assert SASDataProcessor._concat_non_empty(pd.DataFrame({'B': [True, False]}), '+').tolist() == ['True', 'False']
+    frame = pd.DataFrame({
+        'B': pd.array([True, None], dtype='boolean'),
+        'F': pd.array([0.5, None], dtype='Float64'),
+        'U': np.array([1, 2], dtype='uint8'),
+    })
+    assert SASDataProcessor._concat_non_empty(frame, ' ').tolist() == ['True 0.5 1', '2']
+
+
+def test_concat_matches_row_apply():
+    """随机输入下向量化拼接与原逐行实现一致（两种分隔符，保留乱序索引）"""
+    rng = np.random.default_rng(20240517)
+    for _ in range(200):
+        frame = random_frame(rng, int(rng.integers(0, 40)), int(rng.integers(1, 6)))
+        # 全部为日期时间列时原实现逐行取到的是纳秒整数（datetime64.tolist()），向量化实现有意输出日期时间文本，
+        # 此时与按对象列逐行拼接的结果比较
+        reference = frame.astype(object) if len(frame.columns) and all(
+            pd.api.types.is_datetime64_any_dtype(t) for t in frame.dtypes) else frame
+        for separator in (' ', ''):
+            expected = reference_concat(reference, separator)
+            actual = SASDataProcessor._concat_non_empty(frame, separator)
+            assert actual.index.equals(expected.index)
+            assert actual.tolist() == expected.tolist()
+
+
+def test_merge_variables_concat():
+    """已有目标列的原值排在源列之前；新目标列按源列顺序拼接；两种翻译方向分别以空格/无分隔拼接，源列被删除"""
+    cm = pd.DataFrame({
+        'STUDYID': 'S1',
+        'USUBJID': ['U1', 'U1', 'U2', 'U2', 'U3'],
+        'CMSEQ': [1.0, 2.0, 1.0, 2.0, 1.0],
+        'CMTRT': pd.Series(['ASPIRIN', '', 'nan', None, '阿司匹林'], dtype=object),
+        'CMINDC': pd.Series(['HEADACHE', 'FEVER', None, None, '头痛'], dtype=object),
+        'CMDOSE': [100.0, np.nan, 2.5, np.nan, 1.0],
+    })
+    expected = {
+        'en_to_zh': (['ASPIRIN HEADACHE 100.0', 'FEVER', '2.5', '', '阿司匹林 头痛 1.0'],
+                     ['100.0 ASPIRIN', '', '2.5', '', '1.0 阿司匹林']),
+        'zh_to_en': (['ASPIRINHEADACHE100.0', 'FEVER', '2.5', '', '阿司匹林头痛1.0'],
+                     ['100.0ASPIRIN', '', '2.5', '', '1.0阿司匹林']),
+    }
+    for direction, (into_source, into_new) in expected.items():
+        processor = SASDataProcessor()
+        processor.translation_direction = direction
+        processor.datasets['CM'] = {'data': cm.copy(), 'raw_data': cm.copy()}
+        success, message = processor.merge_variables([
+            {'target': {'dataset': 'CM', 'column': 'CMTRT'},
+             'sources': [{'dataset': 'CM', 'column': 'CMINDC'}, {'dataset': 'CM', 'column': 'CMDOSE'}]}
+        ])
+        assert success, message
+        merged = processor.datasets['CM']['raw_data']
+        assert merged['CMTRT'].tolist() == into_source
+        assert list(merged.columns) == ['STUDYID', 'USUBJID', 'CMSEQ', 'CMTRT']
+
+        processor.datasets['CM'] = {'data': cm.copy(), 'raw_data': cm.copy()}
+        success, message = processor.merge_variables([
+            {'target': {'dataset': 'CM', 'column': 'CMNEW'},
+             'sources': [{'dataset': 'CM', 'column': 'CMDOSE'}, {'dataset': 'CM', 'column': 'CMTRT'}]}
+        ])
+        assert success, message
+        merged = processor.datasets['CM']['raw_data']
+        assert merged['CMNEW'].tolist() == into_new
+        assert list(merged.columns) == ['STUDYID', 'USUBJID', 'CMSEQ', 'CMINDC', 'CMNEW']
+
+
+def test_merge_dry_run_leaves_data_untouched():
+    """试运行只返回抽样受试者的合并结果与估算，不修改 raw_data；抽样结果与全量合并后的对应行一致"""
+    n = 200
+    cm = pd.DataFrame({
+        'STUDYID': 'S1',
+        'USUBJID': [f'U{i % 40:02d}' for i in range(n)],
+        'CMSEQ': np.arange(n, dtype='float64'),
+        'CMTRT': ['ASPIRIN'] * n,
+        'CMINDC': ['HEADACHE', None] * (n // 2),
+    })
+    config = [{'target': {'dataset': 'CM', 'column': 'CMTRT'},
+               'sources': [{'dataset': 'CM', 'column': 'CMINDC'}]}]
+    processor = SASDataProcessor()
+    processor.datasets['CM'] = {'data': cm.copy(), 'raw_data': cm.copy()}
+    raw = processor.datasets['CM']['raw_data']
+    success, message, result = processor.merge_dry_run(config, sample_subjects=5, preview_rows=1000)
+    assert success, message
+    assert processor.datasets['CM']['raw_data'] is raw and raw.equals(cm)
+    assert result['sample']['subjects'] == 5
+    assert result['estimate']['rows']['CM'] == {'full': n, 'sample': 25}
+    assert result['estimate']['seconds'] >= 0 and result['estimate']['memory_bytes'] > 0
+
+    preview = result['preview'][0]
+    rows = {(r['USUBJID'], r['CMSEQ']): r['CMTRT'] for r in preview['data']}
+    success, message = processor.merge_variables(config)
+    assert success, message
+    merged = processor.datasets['CM']['raw_data']
+    expected = {(u, s): v for u, s, v in zip(merged['USUBJID'], merged['CMSEQ'], merged['CMTRT']) if (u, s) in rows}
+    assert rows == expected
+
+
+if __name__ == "__main__":
+    test_concat_skips_missing_and_formats_values()
+    test_concat_empty_and_single_column()
+    test_concat_matches_row_apply()
+    test_merge_variables_concat()
+    test_merge_dry_run_leaves_data_untouched()
+    print("✅ 变量合并拼接的边界情况正常")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合并执行计划的回归测试
+随机生成的链式配置（前一条的目标列作为后一条的来源）与跨数据集连接（含 SUPP QNAM 来源与 SUPP 目标）
+一次编译为分阶段分组计划执行（串行与并行分组），结果与逐条调用 merge_variables 一致
+"""
+
+import numpy as np
+import pandas as pd
+
+from app import SASDataProcessor
+
+SUBJECTS = [f'S-{i}' for i in range(1, 7)]
+KEYS = {'STUDYID', 'USUBJID', 'AESEQ', 'CMSEQ', 'RDOMAIN', 'IDVAR', 'IDVARVAL', 'QNAM', 'QVAL'}
+
+
+def make_frames(rng):
+    """DM 每受试者一行；AE/CM 每受试者多行（--SEQ 递增）；SUPPAE 按 AESEQ 指向 AE 的部分行"""
+    def with_seq(n_rows):
+        subjects = rng.choice(SUBJECTS, n_rows)
+        return subjects, pd.Series(subjects).groupby(subjects).cumcount().to_numpy() + 1.0
+    dm = pd.DataFrame({'STUDYID': 'ST', 'USUBJID': SUBJECTS,
+                       'ETHNIC': rng.choice(['A', 'B', None], 6).astype(object),
+                       'RACE': rng.choice(['W', 'X', ''], 6).astype(object)})
+    subjects, seq = with_seq(12)
+    ae = pd.DataFrame({'STUDYID': 'ST', 'USUBJID': subjects, 'AESEQ': seq,
+                       'AETERM': rng.choice(['Headache', 'Nausea', None, 'nan'], 12).astype(object),
+                       'AEDECOD': rng.choice(['头痛', '恶心', ''], 12).astype(object),
+                       'AESEV': rng.choice(['MILD', 'SEVERE'], 12).astype(object)})
+    subjects, seq = with_seq(10)
+    cm = pd.DataFrame({'STUDYID': 'ST', 'USUBJID': subjects, 'CMSEQ': seq,
+                       'CMTRT': rng.choice(['ASPIRIN', 'IBUPROFEN', None], 10).astype(object),
+                       'CMINDC': rng.choice(['PAIN', '', None], 10).astype(object),
+                       'CMDOSE': np.where(rng.random(10) < 0.3, np.nan, rng.integers(1, 5, 10) * 50.0)})
+    picks = rng.choice(len(ae), 6, replace=False)
+    supp = pd.DataFrame({'STUDYID': 'ST', 'RDOMAIN': 'AE', 'USUBJID': ae['USUBJID'].to_numpy()[picks],
+                         'IDVAR': 'AESEQ', 'IDVARVAL': [str(int(v)) for v in ae['AESEQ'].to_numpy()[picks]],
+                         'QNAM': rng.choice(['AETRTEM', 'AEOTH'], 6), 'QVAL': rng.choice(['Y', 'N', 'maybe'], 6)})
+    return {'DM': dm, 'AE': ae, 'CM': cm, 'SUPPAE': supp}
+
+
+def make_processor(frames, direction):
+    processor = SASDataProcessor()
+    processor.hide_supp_in_preview = True
+    processor.translation_direction = direction
+    processor.datasets = {name: {'data': df.copy(), 'raw_data': df.copy(), 'version': SASDataProcessor._next_version()}
+                          for name, df in frames.items()}
+    return processor
+
+
+def candidates(processor, name):
+    """可作为来源/目标的列：主表的非键列（含此前合并新增的列），SUPP 的 QNAM 取值"""
+    df = processor.datasets[name]['raw_data']
+    if name.startswith('SUPP'):
+        return sorted(df['QNAM'].dropna().astype(str).unique())
+    return [c for c in df.columns if c not in KEYS]
+
+
+def random_config(rng, processor, n_new):
+    """按 processor 当前的列随机生成一条配置：目标为已有列或新列，来源 1-3 个，偏向同表与其他主表。
+    SUPP 目标的来源限于其自身与 RDOMAIN 主表（其他主表来源在 SUPP 目标上不受支持）"""
+    target = str(rng.choice(['DM', 'AE', 'CM', 'AE', 'CM', 'SUPPAE']))
+    columns = candidates(processor, target)
+    if target.startswith('SUPP') or (columns and rng.random() < 0.5):
+        column = str(rng.choice(columns)) if columns else None
+    else:
+        column = f'NEW{n_new}'
+    pool = ['SUPPAE', 'AE'] if target.startswith('SUPP') else ['DM', 'AE', 'CM', 'SUPPAE', target, target]
+    sources = []
+    for _ in range(int(rng.integers(1, 4))):
+        dataset = str(rng.choice(pool))
+        options = candidates(processor, dataset)
+        if options:
+            sources.append({'dataset': dataset, 'column': str(rng.choice(options))})
+    if column is None or not sources:
+        return None
+    return {'target': {'dataset': target, 'column': column}, 'sources': sources}
+
+
+def test_plan_matches_sequential_merges():
+    """逐条执行时根据当时的列生成配置（因此包含链式配置与已删除的同表来源），再整体执行计划比较各数据集与预览视图"""
+    stages = []
+    for seed in range(25):
+        rng = np.random.default_rng(seed)
+        frames = make_frames(rng)
+        direction = str(rng.choice(['en_to_zh', 'zh_to_en']))
+        sequential = make_processor(frames, direction)
+        configs = []
+        for i in range(int(rng.integers(2, 7))):
+            config = random_config(rng, sequential, i)
+            if config is None:
+                continue
+            success, message = sequential.merge_variables([config], workers=1)
+            assert success, (seed, config, message)
+            configs.append(config)
+
+        for workers in (1, 4):
+            planned = make_processor(frames, direction)
+            success, message = planned.merge_variables(configs, workers=workers)
+            assert success, (seed, message)
+            stages.append(planned.merge_stats['plan']['stages'])
+            for name in frames:
+                for key in ('raw_data', 'data'):
+                    pd.testing.assert_frame_equal(planned.datasets[name][key].reset_index(drop=True),
+                                                  sequential.datasets[name][key].reset_index(drop=True),
+                                                  obj=f'seed {seed} {name} {key}')
+            for name in ('DM', 'AE', 'CM'):
+                assert planned.get_dataset_preview(name, limit=None)['data'] == \
+                    sequential.get_dataset_preview(name, limit=None)['data'], (seed, name)
+    # 覆盖多阶段计划（存在读写冲突的链式配置）
+    assert max(stages) >= 3
+
+
+def test_chained_cross_dataset_configs():
+    """固定用例：AE 新列取 DM 的列（多对一连接），随后作为 CM 新列的来源（按受试者取 AE 首行），
+    最后作为 AE 另一新列的同表来源被删除"""
+    dm = pd.DataFrame({'STUDYID': 'ST', 'USUBJID': ['S-1', 'S-2'], 'ETHNIC': ['A', 'B']})
+    ae = pd.DataFrame({'STUDYID': 'ST', 'USUBJID': ['S-1', 'S-1', 'S-2'], 'AESEQ': [1.0, 2.0, 1.0],
+                       'AETERM': ['Headache', 'Nausea', None]})
+    cm = pd.DataFrame({'STUDYID': 'ST', 'USUBJID': ['S-2', 'S-1', 'S-3'], 'CMSEQ': [1.0, 1.0, 1.0],
+                       'CMTRT': ['ASPIRIN', None, 'IBUPROFEN']})
+    configs = [
+        {'target': {'dataset': 'AE', 'column': 'AEX'},
+         'sources': [{'dataset': 'AE', 'column': 'AETERM'}, {'dataset': 'DM', 'column': 'ETHNIC'}]},
+        {'target': {'dataset': 'CM', 'column': 'CMX'},
+         'sources': [{'dataset': 'CM', 'column': 'CMTRT'}, {'dataset': 'AE', 'column': 'AEX'}]},
+        {'target': {'dataset': 'AE', 'column': 'AEY'}, 'sources': [{'dataset': 'AE', 'column': 'AEX'}]},
+    ]
+    processor = make_processor({'DM': dm, 'AE': ae, 'CM': cm}, 'en_to_zh')
+    success, message = processor.merge_variables(configs)
+    assert success, message
+    # 第二条读取第一条写入的 AE，第三条写入第二条读取的 AE：三个阶段
+    assert processor.merge_stats['plan']['stages'] == 3
+    assert processor.datasets['CM']['raw_data']['CMX'].tolist() == ['ASPIRIN B', 'Headache A', 'IBUPROFEN']
+    ae_result = processor.datasets['AE']['raw_data']
+    assert list(ae_result.columns) == ['STUDYID', 'USUBJID', 'AESEQ', 'AEY']
+    assert ae_result['AEY'].tolist() == ['Headache A', 'Nausea A', 'B']
+
+
+if __name__ == "__main__":
+    test_plan_matches_sequential_merges()
+    test_chained_cross_dataset_configs()
+    print("✅ 合并执行计划与逐条执行结果一致")
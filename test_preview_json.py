@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预览 JSON 直接序列化的回归测试
+特殊值（±Inf、NaN、NaT、可空整数/浮点缺失、分类缺失）输出为 null，日期时间为带毫秒的 ISO 格式，
+字符串转义与中文原样输出；分页越界、空数据集、降为整数的列恢复为浮点，以及流式输出的分块边界
+"""
+
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+
+from app import SASDataProcessor, _ndjson_response, app
+
+COLUMNS = ['AVAL', 'AESEQ', 'AETERM', 'AEDT', 'AESEV', 'AESER', 'AENUM', 'AERATE']
+
+
+def make_processor():
+    df = pd.DataFrame({
+        'AVAL': [np.inf, -np.inf, np.nan, 1.5e-7],
+        'AESEQ': [1, 2, 3, 4],
+        'AETERM': ['头痛', 'A "q"\\b', 'x\ny', None],
+        'AEDT': pd.to_datetime(['2024-01-02 03:04:05', None, '2024-02-29 00:00:00', '1960-01-01 00:00:00.123'],
+                               format='ISO8601'),
+        'AESEV': pd.Categorical(['MILD', None, 'SEVERE', 'MILD']),
+        'AESER': [True, False, True, False],
+        'AENUM': pd.array([1, None, 3, None], dtype='Int64'),
+        'AERATE': pd.array([0.5, None, np.nan, 2.0], dtype='Float64'),
+    })
+    processor = SASDataProcessor()
+    processor.datasets['AE'] = {'data': df, 'raw_data': df}
+    empty = pd.DataFrame({'A': pd.Series([], dtype=float)})
+    processor.datasets['EMPTY'] = {'data': empty, 'raw_data': empty}
+    seq = pd.DataFrame({'AESEQ': pd.array([1, 2, 3, 4], dtype='int8'), 'X': list('abcd')})
+    processor.datasets['SEQ'] = {'data': seq, 'raw_data': seq, 'compaction': {'downcast_columns': ['AESEQ']}}
+    return processor
+
+
+EXPECTED = [
+    {'AVAL': None, 'AESEQ': 1, 'AETERM': '头痛', 'AEDT': '2024-01-02T03:04:05.000', 'AESEV': 'MILD',
+     'AESER': True, 'AENUM': 1, 'AERATE': 0.5},
+    {'AVAL': None, 'AESEQ': 2, 'AETERM': 'A "q"\\b', 'AEDT': None, 'AESEV': None,
+     'AESER': False, 'AENUM': None, 'AERATE': None},
+    {'AVAL': None, 'AESEQ': 3, 'AETERM': 'x\ny', 'AEDT': '2024-02-29T00:00:00.000', 'AESEV': 'SEVERE',
+     'AESER': True, 'AENUM': 3, 'AERATE': None},
+    {'AVAL': 1.5e-7, 'AESEQ': 4, 'AETERM': None, 'AEDT': '1960-01-01T00:00:00.123', 'AESEV': 'MILD',
+     'AESER': False, 'AENUM': None, 'AERATE': 2.0},
+]
+
+
+def test_special_values_and_escaping():
+    """±Inf/NaN/NaT/NA 为 null；1960 年前后的日期时间保留毫秒；引号、反斜杠与换行转义，中文不转义"""
+    processor = make_processor()
+    body = processor.get_dataset_preview_json('AE', limit=None)
+    assert '头痛'.encode('utf-8') in body and b'Infinity' not in body and b'NaN' not in body
+    records = json.loads(body)
+    assert records['data'] == EXPECTED and records['columns'] == COLUMNS and records['total_rows'] == 4
+    assert processor.get_dataset_preview('AE', limit=None)['data'] == EXPECTED
+
+    columns = json.loads(processor.get_dataset_preview_json('AE', limit=None, shape='columns'))
+    assert columns['format'] == 'columns'
+    assert columns['data'] == [[row[c] for row in EXPECTED] for c in COLUMNS]
+
+
+def test_pagination_edges():
+    """最后一页不满、偏移越过末尾返回空页但保留总行数；空数据集总页数为 0；未知数据集返回 None"""
+    processor = make_processor()
+    last = json.loads(processor.get_dataset_preview_json('AE', limit=3, offset=3, shape='columns'))
+    assert last['data'] == [[EXPECTED[3][c]] for c in COLUMNS]
+    assert (last['page'], last['page_size'], last['total_pages']) == (2, 3, 2)
+
+    beyond = json.loads(processor.get_dataset_preview_json('AE', limit=2, offset=10))
+    assert beyond['data'] == [] and beyond['total_rows'] == 4 and beyond['columns'] == COLUMNS
+
+    empty = json.loads(processor.get_dataset_preview_json('EMPTY', limit=10))
+    assert empty['data'] == [] and empty['columns'] == ['A'] and empty['total_pages'] == 0
+    assert processor.get_dataset_preview_json('MISSING') is None
+
+
+def test_downcast_columns_restored_as_float():
+    """读取后降为整数的列按原始读取结果（浮点）输出，与未压缩时一致"""
+    body = make_processor().get_dataset_preview_json('SEQ', limit=2)
+    assert b'"AESEQ":1.0' in body and b'"AESEQ":2.0' in body
+
+
+def test_stream_chunk_boundaries():
+    """行数为分块大小整数倍时不输出空分块；空数据集只输出表头；gzip 解压后与全量预览一致；关闭后不再输出"""
+    processor = make_processor()
+    lines = ''.join(processor.iter_dataset_preview('AE', chunk_rows=2)).splitlines()
+    header = json.loads(lines[0])
+    assert header['total_rows'] == 4 and header['columns'] == COLUMNS and header['chunk_rows'] == 2
+    assert [json.loads(line) for line in lines[1:]] == EXPECTED
+
+    chunks = list(processor.iter_dataset_preview('AE', shape='columns', chunk_rows=2))
+    assert [json.loads(chunk)['offset'] for chunk in chunks[1:]] == [0, 2]
+    assert list(processor.iter_dataset_preview('EMPTY', chunk_rows=2)) == [
+        '{"columns": ["A"], "total_rows": 0, "dataset_name": "EMPTY", "format": "records", "chunk_rows": 2}\n']
+
+    with app.test_request_context():
+        response = _ndjson_response(processor.iter_dataset_preview('AE', shape='columns', chunk_rows=3), True)
+        body = gzip.decompress(b''.join(response.response)).decode('utf-8')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    rows = []
+    for line in body.splitlines()[1:]:
+        chunk = json.loads(line)
+        assert chunk['offset'] == len(rows)
+        rows += [dict(zip(COLUMNS, values)) for values in zip(*chunk['data'])]
+    assert rows == EXPECTED
+
+    stream = processor.iter_dataset_preview('AE', chunk_rows=2)
+    next(stream)
+    stream.close()
+    assert list(stream) == []
+    assert processor.iter_dataset_preview('MISSING') is None
+
+
+if __name__ == "__main__":
+    test_special_values_and_escaping()
+    test_pagination_edges()
+    test_downcast_columns_restored_as_float()
+    test_stream_chunk_boundaries()
+    print("✅ 预览 JSON 直接序列化的边界情况正常")
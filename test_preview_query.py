@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预览服务端排序/筛选/搜索的回归测试
+混合类型列排序、空白字符串的空值筛选、数值/日期/字符列的等值与区间筛选、跳过数值列的全局搜索，
+缓存命中与数据变更后的失效，以及视窗接口的越界与列子集
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from app import SASDataProcessor
+
+
+def make_processor():
+    df = pd.DataFrame({
+        'USUBJID': ['S-10', 'S-2', 'S-1', 'S-2', 'S-3', 'S-4'],
+        'MIXED': pd.Series([10, 'b', 2.5, None, 'A', 3], dtype=object),
+        'AETERM': ['Headache', '', '  ', None, 'nan', 'HEAD injury'],
+        'AESEQ': [3.0, np.nan, 1.0, 2.0, np.nan, 1.0],
+        'AESTDTC': ['2024-03-01', '2024-01', None, '2024-02-10', '2024-01-15', ''],
+        'AEDT': pd.to_datetime(['2024-03-01', None, '2024-01-15', '2024-02-10', '2024-01-15', None]),
+        'AESEV': pd.Categorical(['MILD', ' ', None, 'MILD', 'SEVERE', 'MILD']),
+    })
+    processor = SASDataProcessor()
+    processor.datasets['AE'] = {'data': df, 'raw_data': df}
+    return processor, df
+
+
+def rows(processor, df, **query):
+    return processor._preview_rows('AE', df, query).tolist()
+
+
+def test_sort_mixed_types_and_missing():
+    """数值与字符串混杂的列：数值在前按数值比较（10 排在 2.5 之后），字符串在后；降序整体反转，缺失值始终在最后；
+    多列排序与相同键的稳定顺序"""
+    processor, df = make_processor()
+    assert rows(processor, df, sort='MIXED') == [2, 5, 0, 4, 1, 3]
+    assert rows(processor, df, sort='-MIXED') == [1, 4, 0, 5, 2, 3]
+    assert rows(processor, df, sort='AESEQ') == [2, 5, 3, 0, 1, 4]
+    assert rows(processor, df, sort='-AESEQ') == [0, 3, 2, 5, 1, 4]
+    assert rows(processor, df, sort='AESEQ,-USUBJID') == [5, 2, 3, 0, 4, 1]
+    assert rows(processor, df, sort='-AEDT') == [0, 3, 2, 4, 1, 5]
+    preview = processor.get_dataset_preview('AE', limit=None, query={'sort': 'MIXED'})
+    assert [row['MIXED'] for row in preview['data']] == [2.5, 3, 10, 'A', 'b', None]
+
+
+def test_null_filter_blank_strings():
+    """字符列与分类列中的空字符串、纯空白视为空值，字面 'nan' 不是；数值列只有 NaN 为空"""
+    processor, df = make_processor()
+    assert rows(processor, df, filters=[{'column': 'AETERM', 'op': 'null'}]) == [1, 2, 3]
+    assert rows(processor, df, filters=[{'column': 'AETERM', 'op': 'null', 'value': 'false'}]) == [0, 4, 5]
+    assert rows(processor, df, filters=[{'column': 'AESEV', 'op': 'null'}]) == [1, 2]
+    assert rows(processor, df, filters=[{'column': 'AESEQ', 'op': 'null'}]) == [1, 4]
+    assert rows(processor, df, filters=[{'column': 'AESTDTC', 'op': 'null'}, {'column': 'AETERM', 'op': 'null'}]) == [2]
+
+
+def test_equals_range_and_search_by_type():
+    """等值筛选按列类型比较；区间筛选对数值边界按数值、对 ISO 日期字符按字符串；搜索含字母时不匹配数值列的缺失值"""
+    processor, df = make_processor()
+    assert rows(processor, df, filters=[{'column': 'AESEQ', 'op': 'equals', 'value': ['1', '3']}]) == [0, 2, 5]
+    assert rows(processor, df, filters=[{'column': 'MIXED', 'op': 'equals', 'value': '3'}]) == [5]
+    assert rows(processor, df, filters=[{'column': 'USUBJID', 'op': 'equals', 'value': ' S-2 '}]) == [1, 3]
+    assert rows(processor, df, filters=[{'column': 'MIXED', 'op': 'range', 'min': 2}]) == [0, 2, 5]
+    assert rows(processor, df, filters=[{'column': 'AESTDTC', 'op': 'range', 'min': '2024-01-10', 'max': '2024-02-28'}]) == [3, 4]
+    assert rows(processor, df, filters=[{'column': 'AEDT', 'op': 'range', 'max': '2024-01-31'}]) == [2, 4]
+    assert rows(processor, df, filters=[{'column': 'AETERM', 'op': 'contains', 'value': 'HEAD'}]) == [0, 5]
+    assert rows(processor, df, search='nan') == [4]
+    assert rows(processor, df, search='2024-01') == [1, 2, 4]
+    assert rows(processor, df, search='mild', sort='-MIXED') == [0, 5, 3]
+    for query in ({'sort': 'MISSING'}, {'filters': [{'column': 'AETERM', 'op': 'bogus'}]}, {'filters': ['AETERM']}):
+        try:
+            processor.get_dataset_preview('AE', query=query)
+            assert False, f'无效查询应报错: {query}'
+        except ValueError:
+            pass
+
+
+def test_query_cache_reuse_and_invalidation():
+    """翻页命中缓存；数据集提交新版本后重新计算"""
+    df = pd.DataFrame({'USUBJID': ['S-2', 'S-1', 'S-3'], 'AESEQ': [2.0, 1.0, 3.0]})
+    processor = SASDataProcessor()
+    processor.datasets['AE'] = {'data': df, 'raw_data': df}
+    query = {'sort': '-AESEQ', 'filters': [{'column': 'AESEQ', 'op': 'range', 'min': 2}]}
+    first = processor.get_dataset_preview('AE', limit=1, offset=0, query=query)
+    second = processor.get_dataset_preview('AE', limit=1, offset=1, query=query)
+    assert [first['data'][0]['AESEQ'], second['data'][0]['AESEQ']] == [3.0, 2.0]
+    assert first['total_rows'] == 2 and first['unfiltered_rows'] == 3
+    assert processor._preview_queries['AE'].hits >= 1
+
+    processor._commit_dataset('AE', df.assign(AESEQ=[5.0, 1.0, 1.0]))
+    assert 'AE' not in processor._preview_queries
+    assert processor.get_dataset_preview('AE', limit=10, query=query)['data'] == [{'USUBJID': 'S-2', 'AESEQ': 5.0}]
+
+
+def test_viewport_edges():
+    """视窗越过末行/末列时截断为空而不报错；列子集按请求顺序输出；结构信息给出筛选后行数与列类型"""
+    processor, _ = make_processor()
+    query = {'sort': '-AESEQ'}
+    tail = json.loads(processor.get_dataset_viewport_json('AE', row_start=4, row_count=10, query=query))
+    assert (tail['row_start'], tail['row_count'], tail['total_rows']) == (4, 2, 6)
+    assert tail['data'][0] == ['S-2', 'S-3']
+    beyond = json.loads(processor.get_dataset_viewport_json('AE', row_start=10, row_count=5, query=query))
+    assert beyond['row_count'] == 0 and beyond['data'] == [[]] * 7
+    right = json.loads(processor.get_dataset_viewport_json('AE', row_start=0, row_count=2, col_start=9))
+    assert right['columns'] == [] and right['data'] == []
+
+    picked = json.loads(processor.get_dataset_viewport_json('AE', 1, 2, columns=['AEDT', 'USUBJID'], shape='records', query=query))
+    assert picked['data'] == [{'AEDT': '2024-02-10T00:00:00.000', 'USUBJID': 'S-2'},
+                              {'AEDT': '2024-01-15T00:00:00.000', 'USUBJID': 'S-1'}]
+
+    schema = processor.get_dataset_schema('AE', query={'filters': [{'column': 'AESEV', 'op': 'null'}]})
+    assert schema['total_rows'] == 2 and schema['unfiltered_rows'] == 6
+    assert [c['dtype'] for c in schema['columns']] == ['string', 'string', 'string', 'number', 'string', 'datetime', 'string']
+    try:
+        processor.get_dataset_viewport_json('AE', columns=['USUBJID', 'MISSING'])
+        assert False, '未知列应报错'
+    except ValueError:
+        pass
+
+
+if __name__ == "__main__":
+    test_sort_mixed_types_and_missing()
+    test_null_filter_blank_strings()
+    test_equals_range_and_search_by_type()
+    test_query_cache_reuse_and_invalidation()
+    test_viewport_edges()
+    print("✅ 预览排序/筛选/搜索的边界情况正常")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+项目处理器注册表的回归测试
+路径规范化（相对路径、..、结尾分隔符指向同一项目）、未指定路径时使用最近使用的项目；
+按项目数与内存预算的 LRU 淘汰（有未保存合并结果、正在加载或被占用的项目推后或跳过）；
+未登记路径共用一个空处理器，create=False 的接口不登记项目、不修改该处理器
+"""
+
+import os
+import threading
+
+import pandas as pd
+
+import app as app_module
+from app import ProcessorRegistry, SASDataProcessor, app, processor_registry
+
+
+def add_dataset(processor, rows=10):
+    df = pd.DataFrame({'USUBJID': [f'S-{i}' for i in range(rows)], 'AESEQ': [1.0] * rows})
+    processor.datasets['AE'] = {'data': df, 'raw_data': df, 'version': SASDataProcessor._next_version()}
+
+
+def test_path_normalization_and_active_project(tmp_path):
+    """同一目录的不同写法得到同一处理器；未命中且不创建时返回 None 且不登记；未指定路径返回最近使用的项目"""
+    registry = ProcessorRegistry(max_projects=4, memory_budget_mb=0)
+    first = registry.get(str(tmp_path / 'study'), create=True)
+    assert registry.get(str(tmp_path / 'other' / '..' / 'study'), create=True) is first
+    assert registry.get(str(tmp_path / 'study') + os.sep) is first
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        assert registry.get('study') is first
+    finally:
+        os.chdir(cwd)
+
+    assert registry.get(str(tmp_path / 'missing')) is None
+    assert registry.get(None, create=True) is first
+    second = registry.get(str(tmp_path / 'second'), create=True)
+    assert registry.get() is second
+    assert [p['path'] for p in registry.get_stats()['projects']] == [str(tmp_path / 'second'), str(tmp_path / 'study')]
+    assert (registry.stats['hits'], registry.stats['misses']) == (5, 3)
+
+
+def test_lru_eviction_order(tmp_path):
+    """超过项目数时淘汰最久未使用的项目；有未保存合并结果的项目最后淘汰；正在加载或被占用的项目跳过；
+    保留的项目（keep）不被淘汰"""
+    registry = ProcessorRegistry(max_projects=2, memory_budget_mb=0)
+    paths = [str(tmp_path / name) for name in 'abcd']
+    a, b, c = (registry.get(p, create=True) for p in paths[:3])
+    registry.get(paths[0])  # a 最近使用，b 最久未使用
+    registry.evict(keep=paths[2])
+    assert registry.get(paths[1]) is None and registry.get(paths[0]) is a and registry.get(paths[2]) is c
+
+    a.datasets['AE'] = {'dirty': True}
+    d = registry.get(paths[3], create=True)
+    registry.evict(keep=paths[3])
+    # a 有未保存的合并结果，先淘汰更近使用的 c
+    assert registry.get(paths[2]) is None and registry.get(paths[0]) is a
+    assert registry.get(paths[3]) is d
+
+    e = registry.get(str(tmp_path / 'e'), create=True)
+    # 项目锁可重入，由另一线程持有 d 的锁模拟正在处理的请求
+    held, release = threading.Event(), threading.Event()
+
+    def hold():
+        with d.lock:
+            held.set()
+            release.wait(5)
+    holder = threading.Thread(target=hold)
+    holder.start()
+    held.wait(5)
+    state, a.load_state = a.load_state, 'loading'
+    try:
+        registry.evict(keep=str(tmp_path / 'e'))
+    finally:
+        release.set()
+        holder.join()
+    # 正在加载与被占用的项目都跳过，超出上限也不强行淘汰
+    assert len(registry.get_stats()['projects']) == 3
+    a.load_state = state
+    registry.evict(keep=str(tmp_path / 'e'))
+    assert registry.get(str(tmp_path / 'e')) is e and len(registry.get_stats()['projects']) == 2
+    assert registry.stats['evictions'] == 3
+    # 淘汰只解除登记，已取得处理器的请求仍可读取其数据
+    assert a.datasets['AE'] == {'dirty': True}
+
+
+def test_memory_budget_eviction(tmp_path):
+    """总内存超过预算时按 LRU 淘汰，直到回到预算内"""
+    registry = ProcessorRegistry(max_projects=0, memory_budget_mb=0.0001)
+    old = registry.get(str(tmp_path / 'old'), create=True)
+    new = registry.get(str(tmp_path / 'new'), create=True)
+    add_dataset(old)
+    add_dataset(new)
+    registry.evict()
+    assert registry.get(str(tmp_path / 'old')) is None and registry.get(str(tmp_path / 'new')) is new
+    assert registry.active_key is not None
+
+    registry.memory_budget_mb = 100
+    registry.get(str(tmp_path / 'old'), create=True)
+    registry.evict()
+    assert len(registry.get_stats()['projects']) == 2
+
+
+def test_unregistered_path_uses_shared_processor():
+    """未登记路径的只读接口共用同一空处理器且不登记项目；合并接口拒绝执行，不修改共用处理器"""
+    client = app.test_client()
+    before = processor_registry.get_stats()['projects']
+    assert client.get('/get_dataset/AE?path=/tmp/unregistered-a').status_code == 404
+    assert client.get('/get_dataset_schema/AE?path=/tmp/unregistered-b').status_code == 404
+    shared = app_module._unregistered_processor
+    assert shared is not None and not shared.datasets
+    direction, stats = shared.translation_direction, shared.merge_stats
+
+    config = [{'target': {'dataset': 'AE', 'column': 'X'}, 'sources': [{'dataset': 'AE', 'column': 'AESEQ'}]}]
+    response = client.post('/merge_variables', json={'path': '/tmp/unregistered-a', 'config': config,
+                                                     'translation_direction': 'en_to_zh'})
+    assert response.get_json()['success'] is False
+    response = client.post('/merge_variables', json={'path': '/tmp/unregistered-a', 'config': config, 'dry_run': True})
+    assert response.get_json()['success'] is False
+    response = client.post('/execute_merge', json={'merge_config': config, 'translation_config': {
+        'path': '/tmp/unregistered-c', 'translation_direction': 'en_to_zh'}})
+    assert response.status_code == 400 and response.get_json()['success'] is False
+
+    assert app_module._unregistered_processor is shared
+    assert shared.translation_direction == direction and shared.merge_stats is stats and not shared.datasets
+    assert processor_registry.get_stats()['projects'] == before
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+编码清单列投影读取的回归测试
+未加载项目时 /api/generate_coded_list 只读取配置涉及的列（read_projected_views），
+生成的编码清单与全量读取 SDTM 后由预览视图生成的一致：含来自 SUPP 的 QNAM 列（按 IDVAR 与按受试者合并）
+以及与主表列重名而改名为 *_SUPP 的列
+"""
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import pandas as pd
+
+import app as app_module
+import sas_reader
+from app import DatabaseManager, ProcessorRegistry, app
+
+FRAMES = {
+    'AE': pd.DataFrame({'STUDYID': 'ST', 'USUBJID': ['S-1', 'S-1', 'S-2', 'S-3'], 'AESEQ': [1.0, 2.0, 1.0, 1.0],
+                        'AETERM': ['头疼', '恶心', '头疼', '皮疹'], 'AEDECOD': ['头痛', '恶心', '头痛', '皮疹'],
+                        'AEPTCD': [10019211.0, 10028813.0, 10019211.0, None], 'AESEV': ['轻度', '中度', '轻度', '重度']}),
+    'SUPPAE': pd.DataFrame({'STUDYID': 'ST', 'RDOMAIN': 'AE', 'USUBJID': ['S-1', 'S-1', 'S-2', 'S-1'],
+                            'IDVAR': 'AESEQ', 'IDVARVAL': ['1', '2', '1', '2'],
+                            'QNAM': ['AELLT', 'AELLT', 'AELLT', 'AESEV'],
+                            'QVAL': ['偏头痛', '反胃', '紧张性头痛', '极重度']}),
+    'CM': pd.DataFrame({'STUDYID': 'ST', 'USUBJID': ['S-1', 'S-2', 'S-2'], 'CMSEQ': [1.0, 1.0, 2.0],
+                        'CMTRT': ['阿司匹林', '布洛芬', '对乙酰氨基酚'], 'CMDECOD': ['阿司匹林', '布洛芬', '对乙酰氨基酚']}),
+    'SUPPCM': pd.DataFrame({'STUDYID': 'ST', 'RDOMAIN': 'CM', 'USUBJID': ['S-1', 'S-2'], 'IDVAR': '',
+                            'IDVARVAL': '', 'QNAM': ['CMATC', 'CMATC'], 'QVAL': ['镇痛药', '解热镇痛药']}),
+    'DM': pd.DataFrame({'STUDYID': 'ST', 'USUBJID': ['S-1', 'S-2', 'S-3'], 'RACE': ['亚洲人'] * 3}),
+}
+
+CONFIG = {
+    'translation_direction': 'zh_to_en',
+    'meddra_version': '27.1.chinese',
+    'whodrug_version': 'global.2025.mar.1.chinese',
+    'meddra_config': [
+        {'table_path': 'AE', 'name_column': 'AEDECOD', 'code_column': 'AEPTCD'},
+        {'table_path': 'AE', 'name_column': 'AELLT', 'code_column': 'AEPTCD'},
+        {'table_path': 'AE', 'name_column': 'AESEV_SUPP', 'code_column': ''},
+        {'table_path': 'AE', 'name_column': 'AEMISSING', 'code_column': ''},
+        {'table_path': 'MH', 'name_column': 'MHDECOD', 'code_column': ''},
+    ],
+    'whodrug_config': [
+        {'table_path': 'CM', 'name_column': 'CMDECOD', 'code_column': ''},
+        {'table_path': 'CM', 'name_column': 'CMATC', 'code_column': 'CMDECOD'},
+    ],
+}
+
+
+def make_study(monkeypatch, tmp_path):
+    """SAS 文件由 FRAMES 给出；记录每次读取的数据集与列"""
+    study = tmp_path / 'study'
+    study.mkdir()
+    for name in FRAMES:
+        (study / f'{name}.sas7bdat').write_bytes(b'')
+    reads = []
+
+    def fake_read(path, *args, usecols=None, **kwargs):
+        name = Path(path).stem
+        reads.append((name, usecols))
+        df = FRAMES[name] if usecols is None else FRAMES[name][usecols]
+        return df.copy(), SimpleNamespace(column_names=list(FRAMES[name].columns), number_rows=len(df)), 1
+
+    def fake_metadata(path):
+        df = FRAMES[Path(path).stem]
+        return SimpleNamespace(column_names=list(df.columns), number_rows=len(df)), None
+    monkeypatch.setattr(sas_reader, 'read_sas7bdat', fake_read)
+    monkeypatch.setattr(sas_reader, 'read_sas_metadata', fake_metadata)
+    return str(study), reads
+
+
+def coded_list(client, path):
+    response = client.post('/api/generate_coded_list', json={'path': path, 'translation_direction': 'zh_to_en'})
+    result = response.get_json()
+    assert response.status_code == 200 and result['success'], result
+    return sorted(({k: item.get(k) for k in ('dataset', 'variable', 'value', 'dictionary_type', 'translation_method')}
+                   for item in result['data']['coded_items']),
+                  key=lambda item: (item['dataset'], item['variable'], item['value']))
+
+
+def test_projected_coded_list_matches_full_read(monkeypatch, tmp_path):
+    # 编码清单接口在当前目录读写 translation_db.sqlite，测试中改到临时目录
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(DatabaseManager, 'get_translation_library_config', lambda self, path: CONFIG)
+    registry = ProcessorRegistry(max_projects=4, memory_budget_mb=0)
+    monkeypatch.setattr(app_module, 'processor_registry', registry)
+    path, reads = make_study(monkeypatch, tmp_path)
+    client = app.test_client()
+
+    projected = coded_list(client, path)
+    # 未加载项目：只按列读取且不登记项目；AE 另读取合并键与 QNAM 重名列，未配置的 DM 不读取
+    assert registry.get(path) is None
+    assert all(usecols is not None for _, usecols in reads)
+    assert 'DM' not in {name for name, _ in reads}
+    read_columns = dict(reads)
+    assert read_columns['AE'] == ['STUDYID', 'USUBJID', 'AESEQ', 'AEDECOD', 'AEPTCD', 'AESEV']
+    assert read_columns['SUPPAE'] == ['STUDYID', 'RDOMAIN', 'USUBJID', 'IDVAR', 'IDVARVAL', 'QNAM', 'QVAL']
+
+    processor = registry.get(path, create=True)
+    processor.cache = None
+    success, message = processor.read_sas_files(path, mode='SDTM', use_multithread=False)
+    assert success, message
+    reads.clear()
+    full = coded_list(client, path)
+    assert reads == []
+    assert projected == full
+
+    values = {(item['variable'], item['value']) for item in full}
+    assert {v for var, v in values if var == 'AELLT'} == {'偏头痛', '反胃', '紧张性头痛'}
+    # QNAM 与未配置的主表列 AESEV 重名：两条路径都改名为 AESEV_SUPP
+    assert {v for var, v in values if var == 'AESEV_SUPP'} == {'极重度'}
+    assert {v for var, v in values if var == 'CMATC'} == {'镇痛药', '解热镇痛药'}
+    assert not any(var in ('AEMISSING', 'MHDECOD') for var, _ in values)
+
+    # 名称列与代码列逐行一致（代码映射由二者成对取值得到）
+    required = {}
+    for item in CONFIG['meddra_config'] + CONFIG['whodrug_config']:
+        required.setdefault(item['table_path'], set()).update(c for c in (item['name_column'], item['code_column']) if c)
+    views, failed = processor.read_projected_views(path, required)
+    assert failed == [] and sorted(views) == ['AE', 'CM']
+    for item in CONFIG['meddra_config'] + CONFIG['whodrug_config']:
+        name = item['table_path']
+        columns = [c for c in (item['name_column'], item['code_column']) if c]
+        if name not in views or not set(columns) <= set(views[name].columns):
+            continue
+        full_view = processor._get_data_view(name)
+        pd.testing.assert_frame_equal(views[name][columns].reset_index(drop=True),
+                                      full_view[columns].reset_index(drop=True), obj=f'{name} {columns}')
+    assert views['AE']['AELLT'].fillna('').tolist() == ['偏头痛', '反胃', '紧张性头痛', '']
+    assert views['CM']['CMATC'].tolist() == ['镇痛药', '解热镇痛药', '解热镇痛药']
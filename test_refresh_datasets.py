@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量刷新的回归测试（全量读取与惰性模式）
+文件未变化时不重新读取；新增、修改、删除的文件与读取失败的文件分别体现在 changes 中，
+读取失败的数据集不保留旧数据并记录错误，修复后作为新增重新读取；SUPP 变化使对应主表视图失效并返回新内容
+"""
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import pandas as pd
+
+import sas_reader
+from app import SASDataProcessor
+
+
+def make_study(monkeypatch, tmp_path):
+    """目录中的数据集由 frames 给出，文件签名的大小取 sizes；broken 中的数据集读取失败"""
+    study = SimpleNamespace(
+        frames={
+            'DM': pd.DataFrame({'STUDYID': ['ST', 'ST'], 'USUBJID': ['S-1', 'S-2']}),
+            'AE': pd.DataFrame({'STUDYID': ['ST'], 'USUBJID': ['S-1'], 'AESEQ': [1.0], 'AETERM': ['Headache']}),
+            'CM': pd.DataFrame({'STUDYID': ['ST'], 'USUBJID': ['S-2'], 'CMSEQ': [1.0], 'CMTRT': ['ASPIRIN']}),
+            'VS': pd.DataFrame({'STUDYID': ['ST'], 'USUBJID': ['S-1'], 'VSSEQ': [1.0], 'VSORRES': ['120']}),
+            'SUPPDM': pd.DataFrame({'STUDYID': ['ST'], 'RDOMAIN': ['DM'], 'USUBJID': ['S-1'], 'IDVAR': [''],
+                                    'IDVARVAL': [''], 'QNAM': ['RACEOTH'], 'QVAL': ['Other']}),
+        },
+        sizes={}, broken=set(), reads=[])
+
+    def meta(df):
+        return SimpleNamespace(column_names=list(df.columns), number_rows=len(df))
+
+    def fake_read(path, *args, **kwargs):
+        name = Path(path).stem
+        study.reads.append(name)
+        if name in study.broken:
+            raise OSError('corrupt file')
+        return study.frames[name].copy(), meta(study.frames[name]), 1
+
+    def fake_metadata(path):
+        name = Path(path).stem
+        if name in study.broken:
+            return None, 'corrupt file'
+        return meta(study.frames[name]), None
+
+    def write(name, df):
+        study.frames[name] = df
+        study.sizes[name] = study.sizes.get(name, 0) + 1
+        (tmp_path / f'{name}.sas7bdat').write_bytes(b'')
+
+    def remove(name):
+        (tmp_path / f'{name}.sas7bdat').unlink()
+
+    monkeypatch.setattr(sas_reader, 'file_signature', lambda path, with_hash=False: {
+        'path': path, 'size': study.sizes[Path(path).stem], 'mtime_ns': 0})
+    monkeypatch.setattr(sas_reader, 'read_sas7bdat', fake_read)
+    monkeypatch.setattr(sas_reader, 'read_sas_metadata', fake_metadata)
+    study.write, study.remove = write, remove
+    for name, df in list(study.frames.items()):
+        write(name, df)
+    return study
+
+
+def run_refresh(monkeypatch, tmp_path, lazy):
+    study = make_study(monkeypatch, tmp_path)
+    processor = SASDataProcessor()
+    processor.cache = None
+    success, message = processor.read_sas_files(str(tmp_path), mode='SDTM', use_multithread=False, lazy=lazy)
+    assert success, message
+    assert processor.get_dataset_preview('DM', limit=None)['data'][0]['RACEOTH'] == 'Other'
+    dm_etag = processor.dataset_etag('DM')
+
+    # 未变化：不重新读取任何文件
+    reads = len(study.reads)
+    success, message, changes = processor.refresh_sas_files(use_multithread=False)
+    assert success and message == '数据集文件未发生变化'
+    assert changes == {'added': [], 'modified': [], 'deleted': [], 'unchanged': ['AE', 'CM', 'DM', 'SUPPDM', 'VS'],
+                       'invalidated_views': [], 'failed': {}}
+    assert len(study.reads) == reads and processor.dataset_etag('DM') == dm_etag
+
+    # 新增 LB、修改 AE 与 SUPPDM、删除 CM、VS 修改后读取失败
+    study.write('LB', pd.DataFrame({'STUDYID': ['ST'], 'USUBJID': ['S-2'], 'LBSEQ': [1.0], 'LBORRES': ['5.1']}))
+    study.write('AE', study.frames['AE'].assign(AETERM=['Nausea']))
+    study.write('SUPPDM', study.frames['SUPPDM'].assign(QVAL=['Another']))
+    study.remove('CM')
+    study.broken.add('VS')
+    study.write('VS', study.frames['VS'])
+    success, message, changes = processor.refresh_sas_files(use_multithread=False)
+    assert success
+    assert message == ('增量刷新完成：新增 1 个，修改 2 个，删除 1 个数据集；1 个文件读取失败: VS: corrupt file')
+    assert changes == {'added': ['LB'], 'modified': ['AE', 'SUPPDM'], 'deleted': ['CM'], 'unchanged': ['DM'],
+                       'invalidated_views': ['AE', 'DM', 'LB'], 'failed': {'VS': 'corrupt file'}}
+    assert sorted(processor.datasets) == ['AE', 'DM', 'LB', 'SUPPDM']
+    assert processor.load_errors == {'VS': 'corrupt file'} and 'VS' not in processor.file_signatures
+    assert sorted(processor.get_all_datasets_info()) == ['AE', 'DM', 'LB']
+
+    assert processor.dataset_etag('DM') != dm_etag
+    assert processor.get_dataset_preview('DM', limit=None)['data'][0]['RACEOTH'] == 'Another'
+    assert processor.get_dataset_preview('AE', limit=None)['data'][0]['AETERM'] == 'Nausea'
+    assert processor.get_dataset_preview('LB', limit=None)['data'][0]['LBORRES'] == '5.1'
+
+    # VS 修复后作为新增读取，错误记录清除
+    study.broken.clear()
+    study.write('VS', study.frames['VS'].assign(VSORRES=['118']))
+    success, message, changes = processor.refresh_sas_files(use_multithread=False)
+    assert success and changes['added'] == ['VS'] and changes['failed'] == {} and changes['invalidated_views'] == ['VS']
+    assert processor.load_errors == {}
+    assert processor.get_dataset_preview('VS', limit=None)['data'][0]['VSORRES'] == '118'
+    return processor
+
+
+def test_refresh_eager(monkeypatch, tmp_path):
+    """全量读取模式：新增与修改的文件在刷新时立即读取"""
+    processor = run_refresh(monkeypatch, tmp_path, lazy=False)
+    assert all('data' in entry for entry in processor.datasets.values())
+
+
+def test_refresh_lazy(monkeypatch, tmp_path):
+    """惰性模式：同一组变化下 changes 与全量读取一致，数据在首次访问时读取"""
+    run_refresh(monkeypatch, tmp_path, lazy=True)
+
+
+def test_lazy_refresh_defers_domain_reads(monkeypatch, tmp_path):
+    """惰性模式：修改的主表刷新后只有元数据，首次访问时读取新内容；SUPP 在刷新时即读取"""
+    study = make_study(monkeypatch, tmp_path)
+    processor = SASDataProcessor()
+    processor.cache = None
+    assert processor.read_sas_files(str(tmp_path), mode='SDTM', lazy=True)[0]
+    processor.ensure_loaded('AE')
+    study.write('AE', study.frames['AE'].assign(AETERM=['Nausea']))
+    study.write('SUPPDM', study.frames['SUPPDM'].assign(QVAL=['Another']))
+    reads = len(study.reads)
+    success, _, changes = processor.refresh_sas_files()
+    assert success and changes['modified'] == ['AE', 'SUPPDM']
+    assert processor.datasets['AE']['status'] == 'unloaded' and 'data' in processor.datasets['SUPPDM']
+    assert study.reads[reads:] == ['SUPPDM']
+    assert processor.get_dataset_preview('AE', limit=None)['data'][0]['AETERM'] == 'Nausea'
+    assert study.reads[reads:] == ['SUPPDM', 'AE']
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SAS 读取辅助函数（sas_reader）的往返测试
+子进程读取结果经共享内存导出后在父进程重建，与原始数据一致（字符、数值、日期时间列及缺失值），
+字符列缺失值保持原对象，共享内存段在重建后释放；不使用共享内存的平台回传紧凑数组，结果相同；
+大文件按阈值拆分读取的结果与整文件读取一致，拆分失败时回退；
+磁盘列式缓存读回原数据与元数据，文件签名变化后未命中，超出上限按 LRU 淘汰；
+类型压缩后恢复的类型与取值不变，启用压缩时预览与不压缩时一致
+"""
+
+import datetime
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import pyreadstat
+import pytest
+
+import sas_reader
+from app import SASDataProcessor
+
+
+def make_frame():
+    """pyreadstat 读取结果的典型列类型：字符（含空串与 None/NaN 缺失）、数值（含 NaN）、日期时间（含 NaT）"""
+    return pd.DataFrame({
+        'USUBJID': ['S-1', 'S-2', 'S-1', None, ''],
+        'AETERM': ['头痛', 'Nausea', '头痛', 'Rash', None],
+        'AESEQ': [1.0, 1.0, 2.0, np.nan, 3.0],
+        'AEOUT': [np.nan, 'RECOVERED', np.nan, 'RECOVERED', 'FATAL'],
+        'AESTDTC': pd.to_datetime(['2024-01-02 08:30', None, '2024-02-29 00:00', '1999-12-31 23:59', '2024-03-01 12:00']),
+    })
+
+
+def make_meta(df):
+    meta = pyreadstat.metadata_container()
+    meta.column_names = list(df.columns)
+    meta.column_labels = [f'{c} 标签' for c in df.columns]
+    meta.number_rows = len(df)
+    return meta
+
+
+def patch_read(monkeypatch, df):
+    monkeypatch.setattr(sas_reader, 'read_sas7bdat',
+                        lambda path, *args, **kwargs: (df.copy(), make_meta(df), 1))
+
+
+@pytest.mark.parametrize('use_shared_memory', [True, False])
+def test_shared_memory_round_trip(monkeypatch, use_shared_memory):
+    """导出再重建与原数据一致；使用共享内存时重建后各段已 unlink"""
+    df = make_frame()
+    patch_read(monkeypatch, df)
+    monkeypatch.setattr(sas_reader, 'USE_SHARED_MEMORY', use_shared_memory)
+    name, payload, error = sas_reader.read_sas_file_to_shared_memory('/data/study/AE.sas7bdat', split_workers=1)
+    assert (name, error) == ('AE', None)
+    assert payload['rows'] == 5 and payload['split_workers'] == 1
+    assert payload['meta'].column_labels[0] == 'USUBJID 标签'
+    segments = [spec['shm_name'] for spec in payload['columns'] if 'shm_name' in spec]
+    assert len(segments) == (5 if use_shared_memory else 0)
+
+    rebuilt = sas_reader.rebuild_dataframe(payload)
+    pd.testing.assert_frame_equal(rebuilt, df)
+    # 字符列的缺失值保持原对象（None 不变为 NaN）
+    assert rebuilt['USUBJID'].tolist()[3] is None and rebuilt['AETERM'].tolist()[4] is None
+    assert rebuilt['AEOUT'].isna().tolist() == [True, False, True, False, False]
+    assert rebuilt['AESTDTC'].isna().tolist() == [False, True, False, False, False]
+    for segment in segments:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=segment)
+
+
+def test_empty_frame_and_read_error(monkeypatch):
+    """空数据集保留列与类型；读取失败时返回错误信息而不是抛出"""
+    df = make_frame().iloc[:0]
+    patch_read(monkeypatch, df)
+    _, payload, error = sas_reader.read_sas_file_to_shared_memory('AE.sas7bdat', split_workers=1)
+    assert error is None
+    pd.testing.assert_frame_equal(sas_reader.rebuild_dataframe(payload), df)
+
+    def broken(*args, **kwargs):
+        raise OSError('corrupt file')
+    monkeypatch.setattr(sas_reader, 'read_sas7bdat', broken)
+    assert sas_reader.read_sas_file_to_shared_memory('CM.sas7bdat') == ('CM', None, 'corrupt file')
+
+
+def test_release_unread_segments(monkeypatch):
+    """父进程未读取的段由 release_shared_columns 释放，重复释放不报错"""
+    monkeypatch.setattr(sas_reader, 'USE_SHARED_MEMORY', True)
+    specs = [sas_reader._export_column(make_frame()[c]) for c in ('USUBJID', 'AESEQ')]
+    sas_reader.release_shared_columns(specs)
+    sas_reader.release_shared_columns(specs)
+    for spec in specs:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=spec['shm_name'])
+
+
+def patch_pyreadstat(monkeypatch, df, split_error=None):
+    """替换 pyreadstat 的整文件与拆分读取，记录调用参数"""
+    calls = []
+
+    def read_whole(path, usecols=None, **kwargs):
+        calls.append(('whole', usecols))
+        return (df if usecols is None else df[usecols]).copy(), make_meta(df)
+
+    def read_split(reader, path, num_processes=None, usecols=None, **kwargs):
+        calls.append(('split', num_processes, usecols))
+        if split_error is not None:
+            raise split_error
+        chunks = np.array_split(np.arange(len(df)), num_processes)
+        frame = pd.concat([df.iloc[c] for c in chunks], ignore_index=True)
+        return (frame if usecols is None else frame[usecols]), make_meta(df)
+    monkeypatch.setattr(sas_reader.pyreadstat, 'read_sas7bdat', read_whole)
+    monkeypatch.setattr(sas_reader.pyreadstat, 'read_file_multiprocessing', read_split)
+    return calls
+
+
+def test_split_read_threshold_and_projection(monkeypatch, tmp_path):
+    """文件达到阈值时按进程数拆分读取（传递列投影），结果与整文件读取一致；未达阈值、阈值为 0 或单进程时整文件读取"""
+    df = make_frame()
+    path = tmp_path / 'AE.sas7bdat'
+    path.write_bytes(b'x' * 2048)
+    calls = patch_pyreadstat(monkeypatch, df)
+
+    split, _, workers = sas_reader.read_sas7bdat(str(path), split_threshold_mb=0.001, split_workers=3)
+    assert workers == 3 and calls[-1] == ('split', 3, None)
+    pd.testing.assert_frame_equal(split, df)
+    projected, _, _ = sas_reader.read_sas7bdat(str(path), 0.001, 2, usecols=['USUBJID', 'AESEQ'])
+    assert calls[-1] == ('split', 2, ['USUBJID', 'AESEQ'])
+    pd.testing.assert_frame_equal(projected, df[['USUBJID', 'AESEQ']])
+
+    for threshold, workers in ((1, 3), (0, 3), (0.001, 1)):
+        whole, _, used = sas_reader.read_sas7bdat(str(path), threshold, workers)
+        assert used == 1 and calls[-1] == ('whole', None)
+        pd.testing.assert_frame_equal(whole, df)
+
+
+def test_split_read_failure_falls_back(monkeypatch, tmp_path):
+    """拆分读取失败（如缺少行数元数据）时回退为整文件读取，列投影保持不变"""
+    df = make_frame()
+    path = tmp_path / 'AE.sas7bdat'
+    path.write_bytes(b'x' * 2048)
+    calls = patch_pyreadstat(monkeypatch, df, split_error=ValueError('number of rows unknown'))
+    result, _, workers = sas_reader.read_sas7bdat(str(path), 0.001, 4, usecols=['AETERM'])
+    assert workers == 1 and calls == [('split', 4, ['AETERM']), ('whole', ['AETERM'])]
+    pd.testing.assert_frame_equal(result, df[['AETERM']])
+
+
+def write_file(path, content, mtime_ns=None):
+    path.write_bytes(content)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_cache_round_trip_and_projection(tmp_path):
+    """缓存写入后读取与原数据一致（字符列缺失值读回为 None），元数据中的日期时间与非字符串键的值标签还原；
+    指定列时只读取这些列"""
+    df = make_frame()
+    meta = make_meta(df)
+    meta.creation_time = datetime.datetime(2024, 5, 17, 9, 30)
+    meta.variable_value_labels = {'AESEQ': {1.0: '首次', 2.0: '第二次'}}
+    path = tmp_path / 'AE.sas7bdat'
+    write_file(path, b'v1')
+    cache = sas_reader.DatasetCache(str(tmp_path / 'cache'))
+    assert cache.load(str(path)) is None
+    assert cache.store(str(path), df, meta)
+
+    loaded, loaded_meta = cache.load(str(path))
+    pd.testing.assert_frame_equal(loaded, df.assign(AEOUT=df['AEOUT'].astype(object).where(df['AEOUT'].notna(), None)))
+    assert loaded_meta.column_labels == meta.column_labels and loaded_meta.number_rows == 5
+    assert loaded_meta.creation_time == meta.creation_time
+    assert loaded_meta.variable_value_labels == {'AESEQ': {1.0: '首次', 2.0: '第二次'}}
+    projected, _ = cache.load(str(path), columns=['AESEQ', 'USUBJID'])
+    # 与 pyreadstat usecols 相同，按文件中的列顺序返回
+    assert list(projected.columns) == ['USUBJID', 'AESEQ'] and projected['AESEQ'].equals(df['AESEQ'])
+    assert cache.stats()['entries'] == 1
+
+
+def test_cache_misses_when_signature_changes(tmp_path):
+    """大小或修改时间变化后缓存未命中；大小与修改时间相同但内容不同只有启用内容哈希时才未命中"""
+    df = make_frame()
+    path = tmp_path / 'AE.sas7bdat'
+    write_file(path, b'v1', mtime_ns=1_700_000_000_000_000_000)
+    plain = sas_reader.DatasetCache(str(tmp_path / 'plain'))
+    hashed = sas_reader.DatasetCache(str(tmp_path / 'hashed'), use_hash=True)
+    for cache in (plain, hashed):
+        cache.store(str(path), df, make_meta(df))
+        assert cache.load(str(path)) is not None
+
+    write_file(path, b'v2', mtime_ns=1_700_000_000_000_000_000)
+    assert plain.load(str(path)) is not None and hashed.load(str(path)) is None
+    write_file(path, b'v2', mtime_ns=1_700_000_000_000_000_001)
+    assert plain.load(str(path)) is None
+    write_file(path, b'v22', mtime_ns=1_700_000_000_000_000_000)
+    assert plain.load(str(path)) is None
+
+
+def test_cache_lru_eviction(tmp_path):
+    """总大小超过上限时按最近访问时间淘汰，读取命中会更新访问时间"""
+    df = pd.DataFrame({'X': np.arange(20000, dtype=float)})
+    cache = sas_reader.DatasetCache(str(tmp_path / 'cache'), max_mb=0.4)
+    paths = []
+    for i, name in enumerate(['AE', 'CM', 'DM']):
+        path = tmp_path / f'{name}.sas7bdat'
+        write_file(path, name.encode())
+        paths.append(str(path))
+        cache.store(str(path), df, make_meta(df))
+        data_path = cache._paths(cache._key(str(path)))[0]
+        os.utime(data_path, (1000 + i, 1000 + i))
+        if i == 1:
+            # AE 在 CM 之后被访问，DM 写入后淘汰最久未访问的 CM
+            assert cache.load(paths[0]) is not None
+    assert cache.stats()['entries'] == 2
+    assert cache.load(paths[1]) is None and cache.load(paths[0]) is not None and cache.load(paths[2]) is not None
+
+
+def test_processor_reads_through_cache(monkeypatch, tmp_path):
+    """首次读取写入缓存，文件未变化时命中缓存不再解析，文件变化后重新读取"""
+    df = make_frame()
+    reads = []
+
+    def fake_read(path, *args, **kwargs):
+        reads.append(path)
+        return df.copy(), make_meta(df), 1
+    monkeypatch.setattr(sas_reader, 'read_sas7bdat', fake_read)
+    path = tmp_path / 'AE.sas7bdat'
+    write_file(path, b'v1')
+    cache = sas_reader.DatasetCache(str(tmp_path / 'cache'))
+
+    modes = []
+    for content in (b'v1', b'v1', b'v22'):
+        write_file(path, content, mtime_ns=1_700_000_000_000_000_000)
+        name, data, error = SASDataProcessor._read_single_sas_file(str(path), cache=cache)
+        assert (name, error) == ('AE', None)
+        assert data['data']['USUBJID'].tolist() == df['USUBJID'].tolist()
+        modes.append(data['read_stats']['mode'])
+    assert modes == ['thread', 'cache', 'thread'] and len(reads) == 2
+
+
+def test_compaction_round_trip():
+    """低基数字符列转为 category，无缺失的整数值浮点列降为最小整数类型；含缺失、小数或高基数的列不变。
+    恢复后类型与取值与原数据一致"""
+    df = pd.DataFrame({
+        'ARM': ['A', 'B', 'A', 'A', 'B', 'A'],
+        'USUBJID': [f'S-{i}' for i in range(6)],
+        'MIXED': ['A', 1, 'A', 'A', 'A', 'A'],
+        'AESEQ': [1.0, 2.0, 3.0, 1.0, 2.0, 300.0],
+        'BIG': [0.0, -70000.0, 1.0, 2.0, 3.0, 4.0],
+        'WITH_NAN': [1.0, np.nan, 3.0, 1.0, 2.0, 3.0],
+        'DOSE': [0.5, 1.0, 1.5, 2.0, 2.5, 3.0],
+        'DTC': pd.to_datetime(['2024-01-01'] * 6),
+    })
+    compacted, report = sas_reader.compact_dataframe(df)
+    assert report['categorical_columns'] == ['ARM'] and report['downcast_columns'] == ['AESEQ', 'BIG']
+    assert (compacted['AESEQ'].dtype, compacted['BIG'].dtype) == (np.int16, np.int32)
+    assert report['after_bytes'] < report['before_bytes']
+    # 没有可压缩的列时返回原 DataFrame
+    untouched = df[['USUBJID', 'DOSE']]
+    assert sas_reader.compact_dataframe(untouched)[0] is untouched
+
+    restored = sas_reader.restore_compacted_dtypes(compacted, report['downcast_columns'])
+    pd.testing.assert_frame_equal(restored, df.assign(ARM=df['ARM'].astype('category')))
+    pd.testing.assert_frame_equal(restored.astype({'ARM': object}), df)
+    # 未压缩的数据不复制
+    assert sas_reader.restore_compacted_dtypes(df, []) is df
+
+
+def test_compacted_previews_match(monkeypatch, tmp_path):
+    """启用类型压缩读取后，主表内存减少，预览（含 SUPP 合入列、分页、查询与视窗）与不压缩时一致；SUPP 不压缩"""
+    frames = {
+        'AE': pd.DataFrame({'STUDYID': ['ST'] * 4, 'USUBJID': ['S-1', 'S-1', 'S-2', 'S-2'],
+                            'AESEQ': [1.0, 2.0, 1.0, 2.0], 'AESEV': ['MILD', 'MILD', 'SEVERE', 'MILD'],
+                            'AEDUR': [3.0, np.nan, 1.0, 2.0]}),
+        'SUPPAE': pd.DataFrame({'STUDYID': ['ST', 'ST'], 'RDOMAIN': ['AE', 'AE'], 'USUBJID': ['S-1', 'S-2'],
+                                'IDVAR': ['AESEQ', 'AESEQ'], 'IDVARVAL': ['2', '1'],
+                                'QNAM': ['AETRTEM', 'AETRTEM'], 'QVAL': ['Y', 'N']}),
+    }
+    monkeypatch.setattr(sas_reader, 'read_sas7bdat', lambda path, *args, **kwargs: (
+        frames[os.path.basename(path)[:-len('.sas7bdat')]].copy(),
+        make_meta(frames[os.path.basename(path)[:-len('.sas7bdat')]]), 1))
+    for name in frames:
+        (tmp_path / f'{name}.sas7bdat').write_bytes(b'')
+
+    processors = []
+    for compact in (False, True):
+        processor = SASDataProcessor()
+        processor.cache = None
+        processor.compact_dtypes = compact
+        success, message = processor.read_sas_files(str(tmp_path), mode='SDTM', use_multithread=False)
+        assert success, message
+        processors.append(processor)
+    plain, compacted = processors
+    ae = compacted.datasets['AE']
+    assert ae['compaction']['downcast_columns'] == ['AESEQ'] and ae['raw_data']['AESEQ'].dtype == np.int8
+    assert 'compaction' not in compacted.datasets['SUPPAE']
+    stats = compacted.read_stats['AE']['compaction']
+    assert stats['after_bytes'] < stats['before_bytes']
+
+    query = {'sort': '-AESEQ', 'filters': [{'column': 'AESEQ', 'op': 'equals', 'value': ['2']}]}
+    for kwargs in ({'limit': None}, {'limit': 2, 'offset': 1}, {'limit': None, 'query': query}):
+        expected = plain.get_dataset_preview('AE', **kwargs)
+        assert compacted.get_dataset_preview('AE', **kwargs)['data'] == expected['data'], kwargs
+        assert compacted.get_dataset_preview_json('AE', **kwargs) == plain.get_dataset_preview_json('AE', **kwargs)
+    viewport = {'row_start': 1, 'row_count': 2, 'columns': ['AESEQ', 'AETRTEM'], 'query': {'sort': 'AESEQ'}}
+    assert compacted.get_dataset_viewport_json('AE', **viewport) == plain.get_dataset_viewport_json('AE', **viewport)
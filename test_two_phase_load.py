@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+两阶段加载中按数据集等待的回归测试
+预览只等待所需数据集读取完成，不等待整个后台加载；SDTM 主表还需等待其视图合入的 SUPP；
+视图失效与构建期间后台线程插入新条目不影响遍历
+"""
+
+import threading
+from types import SimpleNamespace
+
+import pandas as pd
+
+from app import SASDataProcessor
+
+FRAMES = {
+    'DM': pd.DataFrame({'STUDYID': ['ST'], 'USUBJID': ['S-1'], 'AGE': [30.0]}),
+    'SUPPDM': pd.DataFrame({'STUDYID': ['ST'], 'RDOMAIN': ['DM'], 'USUBJID': ['S-1'], 'IDVAR': [''],
+                            'IDVARVAL': [''], 'QNAM': ['RACEOTH'], 'QVAL': ['Other']}),
+    'AE': pd.DataFrame({'STUDYID': ['ST'], 'USUBJID': ['S-1'], 'AESEQ': [1.0]}),
+}
+
+
+def start_background_load(order, gates):
+    """按 order 顺序逐个"读取"数据集；gates 中的数据集在对应 Event 置位前阻塞"""
+    processor = SASDataProcessor()
+    processor.hide_supp_in_preview = True
+    processor.datasets = {name: {'meta': SimpleNamespace(column_names=list(df.columns), number_rows=len(df)),
+                                 'path': name, 'status': 'pending', 'version': SASDataProcessor._next_version()}
+                          for name, df in FRAMES.items()}
+
+    def fake_results(sas_files, *args):
+        for name in order:
+            if name in gates:
+                gates[name].wait(5)
+            df = FRAMES[name]
+            yield name, {'data': df, 'raw_data': df, 'meta': None, 'path': name, 'read_stats': {},
+                         'version': SASDataProcessor._next_version()}, None
+    processor._iter_read_results = fake_results
+    processor.load_state = 'loading'
+    processor._load_done.clear()
+    thread = threading.Thread(target=processor._load_data_in_background,
+                              args=(processor._load_generation, list(FRAMES), 'SDTM', True, None, 'thread'))
+    thread.start()
+    return processor, thread
+
+
+def test_preview_does_not_wait_for_unrelated_datasets():
+    """AE 仍在读取时 DM（及其 SUPP）已可预览，且视图包含 SUPP 列"""
+    gate = threading.Event()
+    processor, thread = start_background_load(['SUPPDM', 'DM', 'AE'], {'AE': gate})
+    try:
+        preview = processor.get_dataset_preview('DM', limit=None)
+        assert processor.load_state == 'loading' and 'data' not in processor.datasets['AE']
+        assert preview['data'] == [{'STUDYID': 'ST', 'USUBJID': 'S-1', 'AGE': 30.0, 'RACEOTH': 'Other'}]
+    finally:
+        gate.set()
+        thread.join()
+    assert processor.load_state == 'ready'
+
+
+def test_domain_waits_for_its_supp():
+    """DM 已读取但 SUPPDM 未完成时继续等待，避免缓存缺少 SUPP 列的视图"""
+    gate = threading.Event()
+    processor, thread = start_background_load(['DM', 'SUPPDM', 'AE'], {'SUPPDM': gate})
+    try:
+        assert processor.wait_until_dataset_loaded('DM', timeout=0.2) is False
+        assert processor.wait_until_dataset_loaded('AE', timeout=0.2) is False
+        gate.set()
+        assert processor.wait_until_dataset_loaded('DM', timeout=5) is True
+        assert 'RACEOTH' in processor.get_dataset_preview('DM', limit=1)['columns']
+    finally:
+        gate.set()
+        thread.join()
+
+
+def test_views_tolerate_entries_inserted_during_iteration():
+    """模拟后台线程在遍历途中插入数据集：视图失效与构建遍历条目快照，不抛出 RuntimeError"""
+    processor = SASDataProcessor()
+    processor.hide_supp_in_preview = True
+    processor.datasets = {name: {'data': df, 'raw_data': df, 'version': SASDataProcessor._next_version()}
+                          for name, df in FRAMES.items()}
+    late = {'LB': {'meta': None, 'path': 'LB', 'status': 'pending', 'version': SASDataProcessor._next_version()},
+            'CM': {'meta': None, 'path': 'CM', 'status': 'pending', 'version': SASDataProcessor._next_version()}}
+    next_version, key_index = processor._next_version, processor._key_index
+
+    def inserting_version():
+        processor.datasets.setdefault('LB', late['LB'])
+        return next_version()
+
+    def inserting_key_index(name):
+        processor.datasets.setdefault('CM', late['CM'])
+        return key_index(name)
+    processor._next_version = inserting_version
+    processor._key_index = inserting_key_index
+
+    processor._invalidate_views()
+    processor._build_preview_views()
+    assert set(processor.datasets) == {'DM', 'SUPPDM', 'AE', 'LB', 'CM'}
+    assert 'RACEOTH' in processor.datasets['DM']['data_view'].columns
+    assert 'data_view' not in processor.datasets['CM']